@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟LLM服务
+按 OpenAI 兼容协议（/v1/chat/completions、/v1/models）和 Ollama 协议（/api/generate、/api/tags）
+返回模拟回答，延迟分布、生成速度、错误率和超时率可配置，用于在没有真实 API 密钥时
+压测真实的 HTTP 调用路径（连接池、流式解析、超时和熔断）。
+
+用法：
+    python fake_llm_server.py --port 8765 --latency lognormal --latency-median 0.8 --latency-p95 2.5 \\
+        --tokens-per-second 40 --error-rate 0.02
+
+然后让平台指向该服务：
+    OPENAI_API_KEY=fake OPENAI_API_BASE=http://127.0.0.1:8765/v1
+    OLLAMA_BASE_URL=http://127.0.0.1:8765
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from services.fake_llm import FakeLLM, FakeLLMProfile, OUTCOME_ERROR, OUTCOME_TIMEOUT
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI 兼容 / Ollama 协议的请求处理"""
+
+    protocol_version = 'HTTP/1.1'
+    engine: FakeLLM = None
+    models = ['fake-sim']
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # ---- 路由 ----
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('/v1/models', '/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': m, 'object': 'model', 'owned_by': 'fake'} for m in self.models]})
+        elif self.path.rstrip('/') == '/api/tags':
+            self._send_json(200, {'models': [{'name': m, 'model': m} for m in self.models]})
+        else:
+            # 健康检查等探测请求
+            self._send_json(200, {'status': 'ok'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+            return
+
+        path = self.path.split('?')[0].rstrip('/')
+        if path.endswith('/chat/completions'):
+            self._chat_completions(body)
+        elif path == '/api/generate':
+            self._ollama_generate(body)
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown endpoint {path}'}})
+
+    # ---- OpenAI 兼容协议 ----
+
+    def _chat_completions(self, body):
+        messages = body.get('messages') or []
+        prompt = '\n'.join(str(m.get('content', '')) for m in messages if isinstance(m, dict))
+        model = body.get('model') or self.models[0]
+        call = self.engine.plan(prompt, body.get('max_tokens'))
+        if not self._simulate_failure(call):
+            return
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        usage = {
+            'prompt_tokens': max(1, len(prompt) // 2),
+            'completion_tokens': len(call.tokens),
+            'total_tokens': max(1, len(prompt) // 2) + len(call.tokens)
+        }
+        if not body.get('stream'):
+            time.sleep(call.duration)
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': call.content},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            })
+            return
+
+        time.sleep(call.ttft)
+        self._start_stream('text/event-stream')
+        for token in call.tokens:
+            self._write_chunk(f"data: {json.dumps(self._delta(completion_id, model, {'content': token}), ensure_ascii=False)}\n\n")
+            time.sleep(call.token_delay)
+        final = self._delta(completion_id, model, {}, finish_reason='stop')
+        final['usage'] = usage
+        self._write_chunk(f"data: {json.dumps(final)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_stream()
+
+    @staticmethod
+    def _delta(completion_id, model, delta, finish_reason=None):
+        return {
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+        }
+
+    # ---- Ollama 协议 ----
+
+    def _ollama_generate(self, body):
+        prompt = str(body.get('prompt', ''))
+        model = body.get('model') or self.models[0]
+        options = body.get('options') or {}
+        call = self.engine.plan(prompt, options.get('num_predict'))
+        if not self._simulate_failure(call):
+            return
+
+        # Ollama 默认流式返回
+        if body.get('stream') is False:
+            time.sleep(call.duration)
+            self._send_json(200, {
+                'model': model,
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'response': call.content,
+                'done': True,
+                'eval_count': len(call.tokens)
+            })
+            return
+
+        time.sleep(call.ttft)
+        self._start_stream('application/x-ndjson')
+        for token in call.tokens:
+            self._write_chunk(json.dumps({'model': model, 'response': token, 'done': False}, ensure_ascii=False) + '\n')
+            time.sleep(call.token_delay)
+        self._write_chunk(json.dumps({'model': model, 'response': '', 'done': True, 'eval_count': len(call.tokens)}) + '\n')
+        self._end_stream()
+
+    # ---- 工具方法 ----
+
+    def _simulate_failure(self, call):
+        """按计划模拟错误或挂起，返回 False 表示已经处理完请求"""
+        if call.outcome == OUTCOME_TIMEOUT:
+            time.sleep(call.ttft)
+            self._send_json(504, {'error': {'message': 'Simulated upstream timeout'}})
+            return False
+        if call.outcome == OUTCOME_ERROR:
+            time.sleep(call.ttft)
+            self._send_json(500, {'error': {'message': 'Simulated upstream error'}})
+            return False
+        return True
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def parse_args():
+    defaults = FakeLLMProfile.from_env()
+    parser = argparse.ArgumentParser(description='本地模拟LLM服务（OpenAI 兼容 / Ollama 协议）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--models', default='gpt-4o,gpt-3.5-turbo,deepseek-r1:7b,deepseek-chat',
+                        help='逗号分隔，/v1/models 和 /api/tags 返回的模型名')
+    parser.add_argument('--latency', default=defaults.latency, choices=['fixed', 'uniform', 'exponential', 'lognormal'],
+                        help='首 token 延迟分布')
+    parser.add_argument('--latency-median', type=float, default=defaults.latency_median, help='首 token 延迟中位数（秒）')
+    parser.add_argument('--latency-p95', type=float, default=defaults.latency_p95, help='首 token 延迟 95 分位（秒）')
+    parser.add_argument('--tokens-per-second', type=float, default=defaults.tokens_per_second, help='生成速度')
+    parser.add_argument('--completion-tokens', type=int, default=defaults.completion_tokens, help='平均回答长度（token）')
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate, help='返回 HTTP 500 的比例')
+    parser.add_argument('--timeout-rate', type=float, default=defaults.timeout_rate, help='挂起后返回 HTTP 504 的比例')
+    parser.add_argument('--timeout-seconds', type=float, default=defaults.timeout_seconds, help='挂起时长（秒）')
+    parser.add_argument('--seed', type=int, default=defaults.seed, help='随机种子（相同种子的压测可重复）')
+    parser.add_argument('--verbose', action='store_true', help='打印每个请求')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    profile = FakeLLMProfile(
+        latency=args.latency,
+        latency_median=args.latency_median,
+        latency_p95=args.latency_p95,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        seed=args.seed
+    )
+    FakeLLMHandler.engine = FakeLLM('fake-server', profile)
+    FakeLLMHandler.models = [name.strip() for name in args.models.split(',') if name.strip()]
+
+    server = ThreadingHTTPServer((args.host, args.port), FakeLLMHandler)
+    server.daemon_threads = True
+    server.verbose = args.verbose
+    print(f"🤖 模拟LLM服务已启动: http://{args.host}:{args.port}")
+    print(f"   OpenAI 兼容: http://{args.host}:{args.port}/v1/chat/completions")
+    print(f"   Ollama:      http://{args.host}:{args.port}/api/generate")
+    print(f"   配置: {profile}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟Redis服务
+实现共享缓存后端（SHARED_CACHE_BACKEND=redis）用到的 RESP 命令子集，数据只保存在内存中，
+用于在没有 Redis 的环境里测试多个工作进程或多个节点共享缓存。
+
+用法：
+    python fake_redis_server.py --port 6390
+
+然后让平台指向该服务：
+    SHARED_CACHE_BACKEND=redis SHARED_CACHE_REDIS_URL=redis://127.0.0.1:6390/0
+"""
+
+import argparse
+import socket
+import socketserver
+import threading
+import time
+
+
+class RedisStore:
+    """按数据库编号分开的键空间：字符串、哈希和有序集合，字符串支持毫秒级过期（线程安全）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.databases = {}
+
+    def keyspace(self, db):
+        return self.databases.setdefault(db, {'data': {}, 'expires': {}})
+
+    def lookup(self, space, key):
+        """读取键的值，已过期时删除并返回 None（调用方持有锁）"""
+        expires_at = space['expires'].get(key)
+        if expires_at is not None and expires_at <= time.time():
+            space['data'].pop(key, None)
+            space['expires'].pop(key, None)
+        return space['data'].get(key)
+
+
+class WrongType(Exception):
+    pass
+
+
+class CommandError(Exception):
+    pass
+
+
+def _int(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise CommandError('ERR value is not an integer or out of range')
+
+
+def _float(value):
+    try:
+        return float(value)
+    except ValueError:
+        raise CommandError('ERR value is not a valid float')
+
+
+def _typed(value, kind):
+    if value is not None and not isinstance(value, kind):
+        raise WrongType()
+    return value
+
+
+def _format_score(score):
+    return repr(score).encode() if score != int(score) else str(int(score)).encode()
+
+
+class FakeRedisHandler(socketserver.BaseRequestHandler):
+    """解析 RESP 请求（支持管道）并执行命令"""
+
+    store: RedisStore = None
+
+    def setup(self):
+        # 回复很小，关闭 Nagle 算法以免与客户端的延迟确认叠加成几十毫秒的等待
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        self.db = 0
+        buffer = b''
+        while True:
+            try:
+                chunk = self.request.recv(65536)
+            except ConnectionError:
+                return
+            if not chunk:
+                return
+            buffer += chunk
+            # 执行本次已收到的全部完整命令（管道），回复合并后一次写出
+            replies = []
+            while True:
+                try:
+                    command, buffer = _parse_command(buffer)
+                except ValueError:
+                    return
+                if command is None:
+                    break
+                if command:
+                    replies.append(_encode_reply(self._run(command)))
+            if replies:
+                try:
+                    self.request.sendall(b''.join(replies))
+                except ConnectionError:
+                    return
+
+    def _run(self, command):
+        try:
+            return self._execute([part.decode('utf-8') if i == 0 else part for i, part in enumerate(command)])
+        except WrongType:
+            return CommandError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        except CommandError as e:
+            return e
+
+    def _execute(self, command):
+        name, args = command[0].upper(), command[1:]
+        handler = getattr(self, f'cmd_{name.lower()}', None)
+        if handler is None:
+            raise CommandError(f"ERR unknown command '{name}'")
+        with self.store.lock:
+            return handler(self.store.keyspace(self.db), *args)
+
+    # ---- 连接 ----
+
+    def cmd_ping(self, space, *args):
+        return args[0] if args else 'PONG'
+
+    def cmd_auth(self, space, *args):
+        return 'OK'
+
+    def cmd_select(self, space, db):
+        self.db = _int(db)
+        return 'OK'
+
+    def cmd_flushdb(self, space):
+        space['data'].clear()
+        space['expires'].clear()
+        return 'OK'
+
+    def cmd_dbsize(self, space):
+        return sum(1 for key in list(space['data']) if self.store.lookup(space, key) is not None)
+
+    # ---- 键和字符串 ----
+
+    def cmd_get(self, space, key):
+        return _typed(self.store.lookup(space, key), bytes)
+
+    def cmd_set(self, space, key, value, *options):
+        expires_at = None
+        options = list(options)
+        while options:
+            option = options.pop(0).decode().upper()
+            if option in ('PX', 'EX') and options:
+                amount = _int(options.pop(0))
+                expires_at = time.time() + (amount / 1000 if option == 'PX' else amount)
+            else:
+                raise CommandError('ERR syntax error')
+        space['data'][key] = value
+        if expires_at is not None:
+            space['expires'][key] = expires_at
+        else:
+            space['expires'].pop(key, None)
+        return 'OK'
+
+    def cmd_del(self, space, *keys):
+        removed = 0
+        for key in keys:
+            if self.store.lookup(space, key) is not None:
+                del space['data'][key]
+                space['expires'].pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_exists(self, space, *keys):
+        return sum(1 for key in keys if self.store.lookup(space, key) is not None)
+
+    def cmd_pttl(self, space, key):
+        if self.store.lookup(space, key) is None:
+            return -2
+        expires_at = space['expires'].get(key)
+        return -1 if expires_at is None else int((expires_at - time.time()) * 1000)
+
+    # ---- 哈希 ----
+
+    def _hash(self, space, key, create=False):
+        value = _typed(self.store.lookup(space, key), dict)
+        if value is None and create:
+            value = space['data'][key] = {}
+        return value
+
+    def cmd_hget(self, space, key, field):
+        return (self._hash(space, key) or {}).get(field)
+
+    def cmd_hmget(self, space, key, *fields):
+        value = self._hash(space, key) or {}
+        return [value.get(field) for field in fields]
+
+    def cmd_hset(self, space, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise CommandError("ERR wrong number of arguments for 'hset' command")
+        value = self._hash(space, key, create=True)
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += pairs[i] not in value
+            value[pairs[i]] = pairs[i + 1]
+        return added
+
+    def cmd_hdel(self, space, key, *fields):
+        value = self._hash(space, key) or {}
+        return sum(1 for field in fields if value.pop(field, None) is not None)
+
+    def cmd_hincrby(self, space, key, field, amount):
+        value = self._hash(space, key, create=True)
+        result = _int(value.get(field, b'0')) + _int(amount)
+        value[field] = str(result).encode()
+        return result
+
+    def cmd_hgetall(self, space, key):
+        return [item for pair in (self._hash(space, key) or {}).items() for item in pair]
+
+    def cmd_hvals(self, space, key):
+        return list((self._hash(space, key) or {}).values())
+
+    # ---- 有序集合 ----
+
+    def _zset(self, space, key, create=False):
+        value = _typed(self.store.lookup(space, key), ZSet)
+        if value is None and create:
+            value = space['data'][key] = ZSet()
+        return value
+
+    def cmd_zadd(self, space, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise CommandError('ERR syntax error')
+        zset = self._zset(space, key, create=True)
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += zset.add(pairs[i + 1], _float(pairs[i]))
+        return added
+
+    def cmd_zrem(self, space, key, *members):
+        zset = self._zset(space, key)
+        if zset is None:
+            return 0
+        removed = sum(zset.remove(member) for member in members)
+        if not zset.scores:
+            del space['data'][key]
+        return removed
+
+    def cmd_zscore(self, space, key, member):
+        score = (self._zset(space, key) or ZSet()).scores.get(member)
+        return None if score is None else _format_score(score)
+
+    def cmd_zcard(self, space, key):
+        return len((self._zset(space, key) or ZSet()).scores)
+
+    def cmd_zrange(self, space, key, start, stop):
+        members = (self._zset(space, key) or ZSet()).ordered()
+        start, stop = _int(start), _int(stop)
+        if start < 0:
+            start = max(0, len(members) + start)
+        if stop < 0:
+            stop = len(members) + stop
+        return members[start:stop + 1]
+
+    def cmd_zrangebyscore(self, space, key, low, high, *options):
+        zset = self._zset(space, key) or ZSet()
+        low_ok, high_ok = _score_bound(low, lower=True), _score_bound(high, lower=False)
+        members = [member for member in zset.ordered() if low_ok(zset.scores[member]) and high_ok(zset.scores[member])]
+        if options:
+            if len(options) != 3 or options[0].decode().upper() != 'LIMIT':
+                raise CommandError('ERR syntax error')
+            offset, count = _int(options[1]), _int(options[2])
+            members = members[offset:] if count < 0 else members[offset:offset + count]
+        return members
+
+
+def _parse_command(buffer):
+    """从缓冲区解析一条完整命令，返回 (命令, 剩余数据)；数据不完整时命令为 None"""
+    end = buffer.find(b'\r\n')
+    if end < 0:
+        return None, buffer
+    if not buffer.startswith(b'*'):
+        # 内联命令（如 telnet 中输入的 PING）
+        return buffer[:end].split(), buffer[end + 2:]
+    pos, parts = end + 2, []
+    for _ in range(int(buffer[1:end])):
+        end = buffer.find(b'\r\n', pos)
+        if end < 0:
+            return None, buffer
+        length = int(buffer[pos + 1:end])
+        pos = end + 2
+        if len(buffer) < pos + length + 2:
+            return None, buffer
+        parts.append(buffer[pos:pos + length])
+        pos += length + 2
+    return parts, buffer[pos:]
+
+
+def _score_bound(value, lower):
+    """ZRANGEBYSCORE 的分数边界：-inf / +inf / (开区间 / 闭区间"""
+    text = value.decode()
+    exclusive = text.startswith('(')
+    bound = _float(text[1:] if exclusive else text)
+    if lower:
+        return (lambda score: score > bound) if exclusive else (lambda score: score >= bound)
+    return (lambda score: score < bound) if exclusive else (lambda score: score <= bound)
+
+
+class ZSet:
+    """有序集合：按 (分数, 成员) 排序"""
+
+    def __init__(self):
+        self.scores = {}
+
+    def add(self, member, score):
+        added = member not in self.scores
+        self.scores[member] = score
+        return int(added)
+
+    def remove(self, member):
+        return int(self.scores.pop(member, None) is not None)
+
+    def ordered(self):
+        return [member for member, _ in sorted(self.scores.items(), key=lambda item: (item[1], item[0]))]
+
+
+def _encode_reply(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, CommandError):
+        return b'-' + str(reply).encode() + b'\r\n'
+    if isinstance(reply, bool):
+        reply = int(reply)
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, str):
+        return b'+' + reply.encode() + b'\r\n'
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    if isinstance(reply, list):
+        return b'*%d\r\n' % len(reply) + b''.join(_encode_reply(item) for item in reply)
+    raise TypeError(f'Cannot encode reply {reply!r}')
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='本地模拟Redis服务（共享缓存后端测试用）')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=6390, help='监听端口')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    FakeRedisHandler.store = RedisStore()
+    server = FakeRedisServer((args.host, args.port), FakeRedisHandler)
+    print(f"🧪 模拟Redis服务已启动: redis://{args.host}:{args.port}/0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
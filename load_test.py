@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Alethea平台LLM接口压测工具
+以固定并发驱动 /api/llm/ask、/api/llm/ask/stream、/api/llm/generate-related-content 和
+/api/personal-knowledge/chat，统计吞吐量、错误率和延迟分位数（流式接口另计首字节时间），
+结果可保存为 JSON 并与上一次压测对比。
+
+配合模拟LLM使用，无需真实 API 密钥：
+    LLM_FAKE_PROVIDERS=all python src/main.py                    # 进程内模拟所有提供商
+    # 或者：python fake_llm_server.py + OPENAI_API_BASE / OLLAMA_BASE_URL 指向它
+
+    python load_test.py --base-url http://127.0.0.1:8083 --concurrency 20 --requests 200 \\
+        --endpoints ask,related,chat --save results/baseline.json
+    python load_test.py ... --compare results/baseline.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+QUESTIONS = [
+    '什么是基尔霍夫电流定律？',
+    '运算放大器的反相放大电路增益怎么计算？',
+    'PID控制器中积分环节的作用是什么？',
+    '如何用示波器测量RC电路的时间常数？',
+    '二极管的伏安特性曲线有什么特点？',
+    '什么是傅里叶变换？在信号处理中有什么用？',
+    '牛顿第二定律如何解释单摆运动？',
+    '晶体管放大电路的静态工作点如何设置？',
+    '数字电路中的触发器有哪些类型？',
+    '如何设计一个二阶低通滤波器？'
+]
+
+ENDPOINTS = {
+    'ask': '/api/llm/ask',
+    'ask_stream': '/api/llm/ask/stream',
+    'related': '/api/llm/generate-related-content',
+    'chat': '/api/personal-knowledge/chat'
+}
+
+
+def build_payload(endpoint, index, args):
+    """第 index 个请求的请求体（--unique 时每个问题都不同，避免命中缓存）"""
+    question = QUESTIONS[index % len(QUESTIONS)]
+    if args.unique:
+        question = f"{question}（压测#{index}）"
+    if endpoint in ('ask', 'ask_stream'):
+        payload = {'question': question, 'use_knowledge_base': False}
+        if args.provider:
+            payload['provider'] = args.provider
+        if args.no_cache:
+            payload['use_cache'] = False
+        return payload
+    if endpoint == 'related':
+        return {'question': question, 'answer': f"{question}的回答：这是用于压测的示例回答内容，涉及电路、信号和控制系统的基本概念。"}
+    return {'message': question, 'history': []}
+
+
+def percentile(values, q):
+    """最近秩分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class EndpointStats:
+    """单个接口的压测结果"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.first_bytes = []
+        self.status_counts = {}
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, status, latency, first_byte=None, ok=True):
+        with self.lock:
+            self.status_counts[str(status)] = self.status_counts.get(str(status), 0) + 1
+            if ok:
+                self.latencies.append(latency)
+                if first_byte is not None:
+                    self.first_bytes.append(first_byte)
+            else:
+                self.errors += 1
+
+    def summary(self, elapsed):
+        total = sum(self.status_counts.values())
+        result = {
+            'requests': total,
+            'errors': self.errors,
+            'error_rate': round(self.errors / total, 4) if total else 0.0,
+            'throughput_rps': round(len(self.latencies) / elapsed, 2) if elapsed else 0.0,
+            'status_counts': self.status_counts,
+            'latency_ms': self._percentiles(self.latencies)
+        }
+        if self.first_bytes:
+            result['first_byte_ms'] = self._percentiles(self.first_bytes)
+        return result
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {}
+        return {
+            'p50': round(percentile(values, 0.5) * 1000, 1),
+            'p90': round(percentile(values, 0.9) * 1000, 1),
+            'p95': round(percentile(values, 0.95) * 1000, 1),
+            'p99': round(percentile(values, 0.99) * 1000, 1),
+            'max': round(max(values) * 1000, 1),
+            'mean': round(sum(values) / len(values) * 1000, 1)
+        }
+
+
+def run_request(session, base_url, endpoint, index, args, stats):
+    """发送一个请求并记录结果（业务错误，如 success=false 或 error 字段，也计为失败）"""
+    url = base_url + ENDPOINTS[endpoint]
+    payload = build_payload(endpoint, index, args)
+    start = time.monotonic()
+    try:
+        if endpoint == 'ask_stream':
+            first_byte = None
+            failed = False
+            with session.post(url, json=payload, stream=True, timeout=args.timeout) as response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if first_byte is None and line and line.startswith('event: delta'):
+                        first_byte = time.monotonic() - start
+                    if line and line.startswith('event: error'):
+                        failed = True
+                stats.record(response.status_code, time.monotonic() - start, first_byte,
+                             ok=response.status_code == 200 and not failed)
+            return
+
+        response = session.post(url, json=payload, timeout=args.timeout)
+        latency = time.monotonic() - start
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        ok = response.status_code == 200 and body.get('success', True) is not False and 'error' not in body
+        stats.record(response.status_code, latency, ok=ok)
+    except requests.RequestException as e:
+        stats.record(type(e).__name__, time.monotonic() - start, ok=False)
+
+
+def run_endpoint(endpoint, args):
+    """以固定并发压测一个接口"""
+    stats = EndpointStats(endpoint)
+    local = threading.local()
+
+    def worker(index):
+        # 每个线程一个会话，复用连接
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        run_request(local.session, args.base_url.rstrip('/'), endpoint, index, args, stats)
+
+    # 预热请求不计入结果
+    for index in range(args.warmup):
+        run_request(requests.Session(), args.base_url.rstrip('/'), endpoint, index, args, EndpointStats('warmup'))
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, range(args.requests)))
+    return stats.summary(time.monotonic() - start)
+
+
+def print_report(results, baseline=None):
+    print()
+    print("=" * 96)
+    print(f"{'接口':<12}{'请求':>7}{'错误率':>9}{'吞吐(rps)':>11}{'p50':>10}{'p90':>10}{'p95':>10}{'p99':>10}{'首字节p50':>12}")
+    print("-" * 96)
+    for endpoint, result in results['endpoints'].items():
+        latency = result['latency_ms']
+        first_byte = result.get('first_byte_ms', {})
+        print(f"{endpoint:<12}{result['requests']:>7}{result['error_rate'] * 100:>8.1f}%{result['throughput_rps']:>11}"
+              f"{latency.get('p50', '-'):>10}{latency.get('p90', '-'):>10}{latency.get('p95', '-'):>10}"
+              f"{latency.get('p99', '-'):>10}{first_byte.get('p50', '-'):>12}")
+        if baseline and endpoint in baseline.get('endpoints', {}):
+            before = baseline['endpoints'][endpoint]
+            print(f"{'  对比':<12}{'':>7}{_delta(before['error_rate'] * 100, result['error_rate'] * 100, '%'):>9}"
+                  f"{_delta(before['throughput_rps'], result['throughput_rps']):>11}"
+                  + ''.join(f"{_delta(before['latency_ms'].get(q), latency.get(q)):>10}" for q in ('p50', 'p90', 'p95', 'p99')))
+    print("=" * 96)
+    print("延迟单位：毫秒；对比行为与基线的差值")
+
+
+def _delta(before, after, unit=''):
+    if before is None or after is None:
+        return '-'
+    return f"{after - before:+.1f}{unit}"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Alethea平台LLM接口压测工具')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8083', help='平台地址')
+    parser.add_argument('--endpoints', default='ask,related,chat',
+                        help=f"逗号分隔，可选 {', '.join(ENDPOINTS)}")
+    parser.add_argument('--concurrency', type=int, default=10, help='并发数')
+    parser.add_argument('--requests', type=int, default=100, help='每个接口的请求数')
+    parser.add_argument('--warmup', type=int, default=2, help='每个接口的预热请求数（不计入结果）')
+    parser.add_argument('--timeout', type=float, default=120, help='单个请求的超时（秒）')
+    parser.add_argument('--provider', default=None, help='/ask 指定的提供商（默认自动选择）')
+    parser.add_argument('--unique', action='store_true', help='每个请求使用不同的问题，避免命中缓存')
+    parser.add_argument('--no-cache', action='store_true', help='/ask 请求带 use_cache=false')
+    parser.add_argument('--save', help='把结果保存为 JSON 文件')
+    parser.add_argument('--compare', help='与之前保存的结果对比')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        print(f"❌ 未知接口: {', '.join(unknown)}")
+        sys.exit(1)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'base_url': args.base_url,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'unique': args.unique,
+        'endpoints': {}
+    }
+    for endpoint in endpoints:
+        print(f"🚀 压测 {ENDPOINTS[endpoint]}：{args.requests} 个请求，并发 {args.concurrency}")
+        results['endpoints'][endpoint] = run_endpoint(endpoint, args)
+
+    print_report(results, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存到 {args.save}")
+
+
+if __name__ == '__main__':
+    main()
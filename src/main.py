@@ -7,13 +7,14 @@ import os
 import json
 import secrets
 from flask import Flask, render_template, send_from_directory, request, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
 
 # Ensure proper import paths
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from routes.llm_routes import llm_bp
-from services.content_optimization import get_optimization_services
+from services.content_optimization import get_optimization_services, configure_shared_cache
 from routes.user import user_bp
 from routes.analytics_routes import analytics_bp
 from routes.project_routes import project_bp
@@ -21,6 +22,8 @@ from routes.experiment_routes import experiment_bp
 from routes.personal_knowledge_routes import personal_knowledge_bp
 from routes.realtime_analytics import realtime_bp
 from models.llm_models import initialize_llm_providers
+from services.async_runtime import async_runtime
+from services.llm_jobs import job_manager
 from models.user import initialize_user_system, db
 from models.user_analytics import UserAnalyticsManager
 
@@ -32,12 +35,20 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'alethea-demo-secret-key-2024
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///alethea.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Behind reverse proxies, trust only the X-Forwarded-For hops they add (client identity for fair scheduling)
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '0'))
+if TRUSTED_PROXY_COUNT > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT, x_proto=TRUSTED_PROXY_COUNT)
+
 # Initialize database
 db.init_app(app)
 
 # Store database instance in app context
 app.db = db
 
+# Run `async def` views as native coroutines on the per-worker event loop
+app.async_to_sync = async_runtime.async_to_sync
+
 # Load configuration
 def load_config():
     """Load configuration from environment or config file"""
@@ -45,6 +56,7 @@ def load_config():
     config = {
         'openai': {
             'api_key': os.getenv('OPENAI_API_KEY', ''),
+            'api_base': os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1'),
             'default_model': os.getenv('OPENAI_DEFAULT_MODEL', 'gpt-4o')
         },
         'deepseek': {
@@ -84,6 +96,100 @@ def load_config():
             'api_key': os.getenv('LLAMA_API_KEY', ''),
             'default_model': os.getenv('LLAMA_DEFAULT_MODEL', 'llama-3-70b')
         },
+        'http_pool': {
+            'max_connections': int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', '100')),
+            'max_keepalive_connections': int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', '20')),
+            'keepalive_expiry': float(os.getenv('LLM_HTTP_KEEPALIVE_EXPIRY', '30')),
+            'http2': os.getenv('LLM_HTTP2', 'true').lower() in ('1', 'true', 'yes')
+        },
+        'async_mode': os.getenv('LLM_ASYNC_MODE', 'loop'),
+        'health_check': {
+            'interval': float(os.getenv('LLM_HEALTH_INTERVAL', '30')),
+            'timeout': float(os.getenv('LLM_HEALTH_TIMEOUT', '5')),
+            'failure_threshold': int(os.getenv('LLM_HEALTH_FAILURE_THRESHOLD', '1'))
+        },
+        'circuit_breaker': {
+            'failure_rate_threshold': float(os.getenv('LLM_CB_FAILURE_RATE', '0.5')),
+            'slow_call_seconds': float(os.getenv('LLM_CB_SLOW_CALL_SECONDS', '20')),
+            'slow_call_rate_threshold': float(os.getenv('LLM_CB_SLOW_CALL_RATE', '0.8')),
+            'window_size': int(os.getenv('LLM_CB_WINDOW', '20')),
+            'min_calls': int(os.getenv('LLM_CB_MIN_CALLS', '5')),
+            'open_cooldown': float(os.getenv('LLM_CB_COOLDOWN', '30')),
+            'half_open_max_calls': int(os.getenv('LLM_CB_HALF_OPEN_CALLS', '1'))
+        },
+        'rate_limit': {
+            'requests_per_minute': float(os.getenv('LLM_RATE_RPM', '0')),
+            'tokens_per_minute': float(os.getenv('LLM_RATE_TPM', '0')),
+            'max_concurrency': int(os.getenv('LLM_MAX_CONCURRENCY', '32')),
+            'max_queue_wait': float(os.getenv('LLM_RATE_MAX_WAIT', '5'))
+        },
+        'scheduler': {
+            'enabled': os.getenv('LLM_SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            'max_concurrency': int(os.getenv('LLM_SCHEDULER_MAX_CONCURRENCY', '16')),
+            'max_queue_per_user': int(os.getenv('LLM_SCHEDULER_MAX_QUEUE_PER_USER', '20')),
+            'max_queue_wait': float(os.getenv('LLM_SCHEDULER_MAX_WAIT', '30')),
+            'background_max_concurrency': int(os.getenv('LLM_SCHEDULER_BACKGROUND_CONCURRENCY', '4')),
+            'background_provider_share': float(os.getenv('LLM_SCHEDULER_BACKGROUND_PROVIDER_SHARE', '0.5')),
+            'background_max_queue_wait': float(os.getenv('LLM_SCHEDULER_BACKGROUND_MAX_WAIT', '60'))
+        },
+        'deadlines': {
+            'default': float(os.getenv('LLM_DEFAULT_DEADLINE', '60'))
+        },
+        'prompt_budget': {
+            'enabled': os.getenv('LLM_PROMPT_BUDGET_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            'max_prompt_tokens': int(os.getenv('LLM_PROMPT_MAX_TOKENS', '3000'))
+        },
+        'fake_llm': {
+            'providers': [name.strip() for name in os.getenv('LLM_FAKE_PROVIDERS', '').split(',') if name.strip()]
+        },
+        'content_cache': {
+            'ttl_hours': float(os.getenv('CONTENT_CACHE_TTL_HOURS', '24')),
+            'max_entries': int(os.getenv('CONTENT_CACHE_MAX_ENTRIES', '1000')),
+            'max_bytes': int(os.getenv('CONTENT_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            'sweep_interval': float(os.getenv('CONTENT_CACHE_SWEEP_INTERVAL', '60'))
+        },
+        'shared_cache': {
+            'backend': os.getenv('SHARED_CACHE_BACKEND', 'memory').strip().lower(),
+            'sqlite_path': os.getenv('SHARED_CACHE_SQLITE', 'data/shared_cache.db'),
+            'redis_url': os.getenv('SHARED_CACHE_REDIS_URL') or os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+            'key_prefix': os.getenv('SHARED_CACHE_PREFIX', 'alethea')
+        },
+        'jobs': {
+            'max_workers': int(os.getenv('LLM_JOB_WORKERS', '8')),
+            'max_pending': int(os.getenv('LLM_JOB_MAX_PENDING', '200')),
+            'max_pending_per_owner': int(os.getenv('LLM_JOB_MAX_PENDING_PER_USER', '5')),
+            'result_ttl': float(os.getenv('LLM_JOB_RESULT_TTL', '600'))
+        },
+        'model_catalog': {
+            'ttl': float(os.getenv('LLM_MODEL_CATALOG_TTL', '3600')),
+            'timeout': float(os.getenv('LLM_MODEL_CATALOG_TIMEOUT', '5'))
+        },
+        'response_cache': {
+            'enabled': os.getenv('LLM_RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+            'ttl_seconds': float(os.getenv('LLM_RESPONSE_CACHE_TTL', '3600')),
+            'max_entries': int(os.getenv('LLM_RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+            'sqlite_path': os.getenv('LLM_RESPONSE_CACHE_SQLITE') or None
+        },
+        'single_flight': os.getenv('LLM_SINGLE_FLIGHT_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'semantic_cache': {
+            'enabled': os.getenv('LLM_SEMANTIC_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+            'similarity_threshold': float(os.getenv('LLM_SEMANTIC_CACHE_THRESHOLD', '0.92')),
+            'max_entries': int(os.getenv('LLM_SEMANTIC_CACHE_MAX_ENTRIES', '5000')),
+            'ttl_seconds': float(os.getenv('LLM_SEMANTIC_CACHE_TTL', '86400'))
+        },
+        'adaptive_routing': {
+            'alpha': float(os.getenv('LLM_ROUTING_EWMA_ALPHA', '0.2')),
+            'latency_weight': float(os.getenv('LLM_ROUTING_LATENCY_WEIGHT', '1.0')),
+            'ttft_weight': float(os.getenv('LLM_ROUTING_TTFT_WEIGHT', '0.5')),
+            'error_weight': float(os.getenv('LLM_ROUTING_ERROR_WEIGHT', '3.0'))
+        },
+        'hedging': {
+            'enabled': os.getenv('LLM_HEDGE_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            'latency_percentile': float(os.getenv('LLM_HEDGE_PERCENTILE', '0.95')),
+            'default_delay': float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', '8')),
+            'max_parallel': int(os.getenv('LLM_HEDGE_MAX_PARALLEL', '2')),
+            'max_race': int(os.getenv('LLM_RACE_MAX', '3'))
+        },
         'default_provider': os.getenv('DEFAULT_LLM_PROVIDER', 'gemini')
     }
     
@@ -125,6 +231,18 @@ def initialize_app():
     # Load configuration
     config = load_config()
     
+    # Configure the per-worker event loop (or per-request asyncio.run fallback)
+    async_runtime.configure(config.get('async_mode'))
+    
+    # Worker pool for background generation jobs (related content in job mode)
+    job_manager.configure(config.get('jobs', {}))
+    
+    # Related-content cache limits (entries, approximate bytes, TTL and expiry sweep)
+    get_optimization_services()['cache'].configure(config.get('content_cache', {}))
+    
+    # Backend shared by all workers for the related-content cache and user profiles
+    configure_shared_cache(config.get('shared_cache', {}))
+    
     # Initialize LLM providers
     initialize_llm_providers(config)
     
@@ -7,15 +7,39 @@ import os
 import json
 import logging
 import re
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional, Union, Tuple
-import requests
+from typing import Dict, Any, List, Optional, Union, Tuple, AsyncIterator
+import httpx
 import asyncio
+import functools
 from datetime import datetime
 
+from services.async_runtime import async_runtime
+from services.llm_transport import http_client_pool
+from services.provider_health import provider_health
+from services.circuit_breaker import circuit_breakers
+from services.hedging import hedging_policy
+from services.provider_stats import provider_stats
+from services.deadline import Deadline, DEFAULT_DEADLINE
+from services.llm_cache import response_cache
+from services.semantic_cache import semantic_cache
+from services.single_flight import single_flight
+from services.rate_limiter import rate_limiters, estimate_tokens
+from services.llm_scheduler import llm_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from services.keyword_engine import keyword_engine, QUERY_CHARACTERISTICS
+from services.refresh_cache import RefreshAheadCache
+from services.prompt_budget import prompt_budgeter
+from services.llm_metrics import llm_metrics, STATUS_SUCCESS, STATUS_ERROR, STATUS_CANCELLED
+from services.fake_llm import FakeLLM, FakeLLMProfile, OUTCOME_ERROR, OUTCOME_TIMEOUT
+from utils.error_handler import AIProviderError, RateLimitError
+from utils.logger import get_logger
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# Structured per-call log (logs/ai_requests.log)
+ai_request_logger = get_logger("ai_requests")
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers"""
@@ -35,6 +59,15 @@ class LLMProvider(ABC):
         """Get a list of available models from this provider"""
         pass
     
+    async def fetch_available_models(self, timeout: Optional[float] = None) -> List[str]:
+        """
+        Fetch the live model catalog (cached by LLMManager.get_provider_models)
+        
+        Providers without a model list endpoint return their known models. Raises on upstream
+        errors so that the cache keeps serving the last good catalog.
+        """
+        return self.get_available_models()
+    
     @property
     @abstractmethod
     def provider_name(self) -> str:
@@ -52,11 +85,119 @@ class LLMProvider(ABC):
     def provider_cost_tier(self) -> int:
         """Get the cost tier of this provider (1-5, where 1 is lowest cost)"""
         pass
+    
+    # Lightweight endpoint probed by the background health registry (None = not probed)
+    health_check_url: Optional[str] = None
+    
+    async def health_check(self) -> bool:
+        """Probe the provider endpoint; any HTTP answer below 500 means it is reachable"""
+        if hasattr(self, 'api_key') and not self.api_key:
+            # Development mode without API key answers locally
+            return True
+        if not self.health_check_url:
+            return True
+        response = await self._get(self.health_check_url)
+        return response.status_code < 500
+    
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Shared keep-alive HTTP client of this provider on the running event loop"""
+        return http_client_pool.get_client(self.provider_name)
+    
+    @staticmethod
+    def _call_timeout(kwargs: Dict[str, Any], default: Optional[float] = None) -> Optional[float]:
+        """Per-call timeout: the provider default capped by the remaining budget of the request deadline"""
+        deadline = kwargs.get('deadline')
+        if deadline is None:
+            return default
+        return deadline.timeout(default)
+    
+    async def _post_json(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                         timeout: Optional[float] = None) -> httpx.Response:
+        """POST a JSON payload through the pooled client without blocking the event loop"""
+        return await self.http_client.post(
+            url,
+            headers=headers,
+            json=payload,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        )
+    
+    async def _get(self, url: str, headers: Optional[Dict[str, str]] = None,
+                   timeout: Optional[float] = None) -> httpx.Response:
+        """GET through the pooled client without blocking the event loop"""
+        return await self.http_client.get(
+            url,
+            headers=headers,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        )
+    
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the response as events: {"type": "delta"|"reasoning", "content": str}
+        
+        Providers without a streaming API fall back to one chunk with the full answer.
+        """
+        response = await self.generate_response(prompt, **kwargs)
+        if "error" in response:
+            raise AIProviderError(str(response["error"]), provider=self.provider_name)
+        yield {"type": "delta", "content": response.get("content", "")}
+    
+    async def _mock_stream(self, prompt: str, chunk_size: int = 8, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the development (no API key) answer in small chunks"""
+        response = await self.generate_response(prompt, **kwargs)
+        content = response.get("content", "")
+        for i in range(0, len(content), chunk_size):
+            yield {"type": "delta", "content": content[i:i + chunk_size]}
+    
+    async def _stream_events(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                             timeout: Optional[float] = None, ndjson: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """POST with streaming enabled and yield decoded JSON events (SSE `data:` lines or NDJSON lines)"""
+        async with self.http_client.stream(
+            "POST",
+            url,
+            headers=headers,
+            json=payload,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        ) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode('utf-8', errors='replace')
+                logger.error(f"{self.provider_name} streaming API error: {response.status_code} - {body[:500]}")
+                raise AIProviderError(f"API error: {response.status_code}", provider=self.provider_name)
+            
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not ndjson:
+                    if not line.startswith("data:"):
+                        continue
+                    line = line[5:].strip()
+                    if line == "[DONE]":
+                        return
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"{self.provider_name} sent an undecodable stream line: {line[:100]}")
+    
+    async def _stream_chat_completions(self, url: str, headers: Dict[str, str], data: Dict[str, Any],
+                                       timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an OpenAI-compatible chat completion (`stream: true`)"""
+        async for event in self._stream_events(url, headers, {**data, "stream": True}, timeout=timeout):
+            for choice in event.get("choices") or []:
+                delta = choice.get("delta") or {}
+                if delta.get("reasoning_content"):
+                    yield {"type": "reasoning", "content": delta["reasoning_content"]}
+                if delta.get("content"):
+                    yield {"type": "delta", "content": delta["content"]}
 
 
 class OpenAIProvider(LLMProvider):
     """OpenAI API integration"""
     
+    @property
+    def health_check_url(self) -> str:
+        return f"{self.api_base}/models"
+    
     def __init__(self):
         self.api_key = ""
         self.default_model = "gpt-4o"
@@ -102,10 +243,11 @@ class OpenAIProvider(LLMProvider):
             }
             
             # Make the API call
-            response = requests.post(
+            response = await self._post_json(
                 f"{self.api_base}/chat/completions",
                 headers=headers,
-                json=data
+                payload=data,
+                timeout=self._call_timeout(kwargs)
             )
             
             if response.status_code == 200:
@@ -135,28 +277,48 @@ class OpenAIProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from OpenAI models token by token"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 1000)
+        }
+        
+        async for event in self._stream_chat_completions(f"{self.api_base}/chat/completions", headers, data, timeout=self._call_timeout(kwargs)):
+            yield event
+    
     def get_available_models(self) -> List[str]:
-        """Get available OpenAI models"""
-        try:
-            if not self.api_key or self.api_key == "":
-                return ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"]
-                
-            # Make API call to list models
-            headers = {"Authorization": f"Bearer {self.api_key}"}
-            response = requests.get(f"{self.api_base}/models", headers=headers)
-            
-            if response.status_code == 200:
-                models = response.json()["data"]
-                # Filter for chat models
-                chat_models = [model["id"] for model in models if "gpt" in model["id"]]
-                return chat_models
-            else:
-                logger.error(f"Error fetching OpenAI models: {response.status_code}")
-                return ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"]
-                
-        except Exception as e:
-            logger.error(f"Error fetching OpenAI models: {str(e)}")
-            return ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"]
+        """Get known OpenAI models (used until the live catalog has been fetched)"""
+        return ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"]
+    
+    async def fetch_available_models(self, timeout: Optional[float] = None) -> List[str]:
+        """Fetch available OpenAI chat models from the models endpoint"""
+        if not self.api_key or self.api_key == "":
+            return self.get_available_models()
+        
+        # Make API call to list models
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        response = await self._get(f"{self.api_base}/models", headers=headers, timeout=timeout)
+        
+        if response.status_code != 200:
+            logger.error(f"Error fetching OpenAI models: {response.status_code}")
+            raise AIProviderError(f"API error: {response.status_code}", provider=self.provider_name)
+        
+        models = response.json()["data"]
+        # Filter for chat models
+        return [model["id"] for model in models if "gpt" in model["id"]]
     
     @property
     def provider_name(self) -> str:
@@ -174,6 +336,8 @@ class OpenAIProvider(LLMProvider):
 class DeepSeekProvider(LLMProvider):
     """DeepSeek API integration"""
     
+    health_check_url = "https://api.deepseek.com/v1/models"
+    
     def __init__(self):
         self.api_key = ""
         self.default_model = "deepseek-chat"
@@ -217,11 +381,11 @@ class DeepSeekProvider(LLMProvider):
             }
             
             # Make the API call (adjust endpoint as needed)
-            response = requests.post(
+            response = await self._post_json(
                 "https://api.deepseek.com/v1/chat/completions",
                 headers=headers,
-                json=data,
-                timeout=30
+                payload=data,
+                timeout=self._call_timeout(kwargs, 30)
             )
             
             if response.status_code == 200:
@@ -251,6 +415,28 @@ class DeepSeekProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from DeepSeek models token by token"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 1000)
+        }
+        
+        async for event in self._stream_chat_completions("https://api.deepseek.com/v1/chat/completions", headers, data, timeout=self._call_timeout(kwargs, 30)):
+            yield event
+    
     def get_available_models(self) -> List[str]:
         """Get available DeepSeek models"""
         # DeepSeek API might not provide a model list endpoint
@@ -273,6 +459,10 @@ class DeepSeekProvider(LLMProvider):
 class VolcesDeepSeekProvider(LLMProvider):
     """Volces DeepSeek API integration (火山引擎DeepSeek)"""
     
+    @property
+    def health_check_url(self) -> str:
+        return self.api_url
+    
     def __init__(self):
         self.api_key = ""
         self.api_url = ""
@@ -318,11 +508,11 @@ class VolcesDeepSeekProvider(LLMProvider):
             }
             
             # Make the API call
-            response = requests.post(
+            response = await self._post_json(
                 self.api_url,
                 headers=headers,
-                json=data,
-                timeout=60  # Increased timeout for better reliability
+                payload=data,
+                timeout=self._call_timeout(kwargs, 60)  # Increased timeout for better reliability
             )
             
             if response.status_code == 200:
@@ -352,6 +542,28 @@ class VolcesDeepSeekProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from Volces DeepSeek models token by token"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 16191)
+        }
+        
+        async for event in self._stream_chat_completions(self.api_url, headers, data, timeout=self._call_timeout(kwargs, 60)):
+            yield event
+    
     def get_available_models(self) -> List[str]:
         """Get available Volces DeepSeek models"""
         return ["deepseek-r1-250528", "deepseek-r1", "deepseek-chat"]
@@ -372,18 +584,27 @@ class VolcesDeepSeekProvider(LLMProvider):
 class BaiduProvider(LLMProvider):
     """百度文心一言 API integration"""
     
+    health_check_url = "https://aip.baidubce.com/oauth/2.0/token"
+    token_url = "https://aip.baidubce.com/oauth/2.0/token"
+    # Access tokens are valid for 30 days; refresh in the background during the last day
+    default_token_ttl = 30 * 24 * 3600
+    # error_code values meaning the access token is invalid or expired
+    invalid_token_errors = (110, 111)
+    
     def __init__(self):
         self.api_key = ""
         self.secret_key = ""
         self.default_model = "ERNIE-Bot-4"
         self._capabilities = ["general", "chinese", "reasoning", "multimodal"]
         self._cost_tier = 2
+        self._tokens = RefreshAheadCache("Baidu access token", refresh_ahead=0.1, max_refresh_ahead=24 * 3600)
     
     def initialize(self, api_key: str, **kwargs) -> None:
         """Initialize Qianwen client with API key"""
         self.api_key = api_key
         self.secret_key = kwargs.get('secret_key', '')
         self.default_model = kwargs.get('default_model', 'ERNIE-Bot-4')
+        self._tokens.invalidate()
         logger.info("Qianwen provider initialized")
     
     async def generate_response(self, prompt: str, **kwargs) -> Dict[str, Any]:
@@ -414,15 +635,27 @@ class BaiduProvider(LLMProvider):
             
             # Make the API call (adjust endpoint as needed)
             # Note: Qianwen/Baidu API might require different authentication method
-            response = requests.post(
-                f"https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/{model}?access_token={self._get_access_token()}",
+            access_token = await self._get_access_token(timeout=self._call_timeout(kwargs, 10))
+            response = await self._post_json(
+                f"https://aip.baidubce.com/rpc/2.0/ai_custom/v1/wenxinworkshop/chat/{model}?access_token={access_token}",
                 headers=headers,
-                json=data,
-                timeout=30
+                payload=data,
+                timeout=self._call_timeout(kwargs, 30)
             )
             
             if response.status_code == 200:
                 result = response.json()
+                if "error_code" in result:
+                    if result["error_code"] in self.invalid_token_errors:
+                        # Token revoked or expired early: fetch a new one on the next call
+                        self._tokens.invalidate()
+                    logger.error(f"Qianwen API error: {result['error_code']} - {result.get('error_msg')}")
+                    return {
+                        "provider": self.provider_name,
+                        "error": f"API error: {result['error_code']} - {result.get('error_msg')}",
+                        "content": "抱歉，在处理您的请求时遇到了问题。",
+                        "timestamp": datetime.now().isoformat()
+                    }
                 return {
                     "provider": self.provider_name,
                     "model": model,
@@ -448,19 +681,28 @@ class BaiduProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
-    def _get_access_token(self) -> str:
-        """Get access token for Baidu API"""
-        try:
-            url = f"https://aip.baidubce.com/oauth/2.0/token?grant_type=client_credentials&client_id={self.api_key}&client_secret={self.secret_key}"
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.json()["access_token"]
-            else:
-                logger.error(f"Error getting Baidu access token: {response.status_code} - {response.text}")
-                return ""
-        except Exception as e:
-            logger.error(f"Error getting Baidu access token: {str(e)}")
-            return ""
+    async def _get_access_token(self, timeout: Optional[float] = None) -> str:
+        """
+        Get access token for Baidu API
+        
+        The token is cached until it expires and refreshed in the background shortly before;
+        concurrent callers share a single OAuth request. Raises AIProviderError when no token can be obtained.
+        """
+        return await self._tokens.get((self.api_key, self.secret_key), self._fetch_access_token, timeout=timeout)
+    
+    async def _fetch_access_token(self) -> Tuple[str, float]:
+        """OAuth client-credentials round trip, returns (token, lifetime in seconds)"""
+        url = f"{self.token_url}?grant_type=client_credentials&client_id={self.api_key}&client_secret={self.secret_key}"
+        response = await self._get(url, timeout=10)
+        if response.status_code != 200:
+            logger.error(f"Error getting Baidu access token: {response.status_code} - {response.text}")
+            raise AIProviderError(f"Access token error: {response.status_code}", provider=self.provider_name)
+        result = response.json()
+        if not result.get("access_token"):
+            logger.error(f"Error getting Baidu access token: {result.get('error_description') or result}")
+            raise AIProviderError("Access token error", provider=self.provider_name)
+        logger.info("Baidu access token refreshed")
+        return result["access_token"], float(result.get("expires_in") or self.default_token_ttl)
     
     def get_available_models(self) -> List[str]:
         """Get available Qianwen models"""
@@ -484,6 +726,10 @@ class BaiduProvider(LLMProvider):
 class AliQwenProvider(LLMProvider):
     """阿里云通义千问 API integration"""
     
+    @property
+    def health_check_url(self) -> str:
+        return self.api_url
+    
     def __init__(self):
         self.api_key = ""
         self.api_url = ""
@@ -529,11 +775,11 @@ class AliQwenProvider(LLMProvider):
             }
             
             # Make the API call
-            response = requests.post(
+            response = await self._post_json(
                 self.api_url,
                 headers=headers,
-                json=data,
-                timeout=30
+                payload=data,
+                timeout=self._call_timeout(kwargs, 30)
             )
             
             if response.status_code == 200:
@@ -563,6 +809,28 @@ class AliQwenProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from AliQwen models token by token"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 16191)
+        }
+        
+        async for event in self._stream_chat_completions(self.api_url, headers, data, timeout=self._call_timeout(kwargs, 30)):
+            yield event
+    
     def get_available_models(self) -> List[str]:
         """Get available AliQwen models"""
         return ["qwen-plus-2025-04-28", "qwen-plus", "qwen-turbo", "qwen-max"]
@@ -583,6 +851,8 @@ class AliQwenProvider(LLMProvider):
 class ClaudeProvider(LLMProvider):
     """Anthropic Claude API integration"""
     
+    health_check_url = "https://api.anthropic.com/v1/models"
+    
     def __init__(self):
         self.api_key = ""
         self.default_model = "claude-3-opus"
@@ -627,10 +897,11 @@ class ClaudeProvider(LLMProvider):
             }
             
             # Make the API call
-            response = requests.post(
+            response = await self._post_json(
                 "https://api.anthropic.com/v1/messages",
                 headers=headers,
-                json=data
+                payload=data,
+                timeout=self._call_timeout(kwargs)
             )
             
             if response.status_code == 200:
@@ -660,6 +931,35 @@ class ClaudeProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from Claude models via Anthropic's SSE events"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        headers = {
+            "x-api-key": self.api_key,
+            "Content-Type": "application/json",
+            "anthropic-version": "2023-06-01"
+        }
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 1000),
+            "stream": True
+        }
+        
+        async for event in self._stream_events("https://api.anthropic.com/v1/messages", headers, data, timeout=self._call_timeout(kwargs)):
+            if event.get("type") == "content_block_delta":
+                text = (event.get("delta") or {}).get("text")
+                if text:
+                    yield {"type": "delta", "content": text}
+            elif event.get("type") == "error":
+                raise AIProviderError(str(event.get("error")), provider=self.provider_name)
+    
     def get_available_models(self) -> List[str]:
         """Get available Claude models"""
         return ["claude-3-opus", "claude-3-sonnet", "claude-3-haiku", "claude-2.1"]
@@ -680,6 +980,8 @@ class ClaudeProvider(LLMProvider):
 class GeminiProvider(LLMProvider):
     """Google Gemini API integration"""
     
+    health_check_url = "https://generativelanguage.googleapis.com/v1beta/models"
+    
     def __init__(self):
         self.api_key = ""
         self.default_model = "gemini-pro"
@@ -722,7 +1024,7 @@ class GeminiProvider(LLMProvider):
             }
             
             # Make the API call
-            response = requests.post(url, headers=headers, json=data)
+            response = await self._post_json(url, headers=headers, payload=data, timeout=self._call_timeout(kwargs))
             
             if response.status_code == 200:
                 result = response.json()
@@ -751,6 +1053,31 @@ class GeminiProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from Gemini models via streamGenerateContent (SSE)"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        model = kwargs.get('model', self.default_model)
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse&key={self.api_key}"
+        headers = {"Content-Type": "application/json"}
+        
+        data = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "temperature": kwargs.get('temperature', 0.7),
+                "maxOutputTokens": kwargs.get('max_tokens', 1000)
+            }
+        }
+        
+        async for event in self._stream_events(url, headers, data, timeout=self._call_timeout(kwargs)):
+            for candidate in event.get("candidates") or []:
+                for part in (candidate.get("content") or {}).get("parts") or []:
+                    if part.get("text"):
+                        yield {"type": "delta", "content": part["text"]}
+    
     def get_available_models(self) -> List[str]:
         """Get available Gemini models"""
         return ["gemini-pro", "gemini-ultra", "gemini-pro-vision"]
@@ -771,6 +1098,8 @@ class GeminiProvider(LLMProvider):
 class LlamaProvider(LLMProvider):
     """Meta Llama API integration"""
     
+    health_check_url = "https://api.meta.ai/v1/models"
+    
     def __init__(self):
         self.api_key = ""
         self.default_model = "llama-3-70b"
@@ -814,10 +1143,11 @@ class LlamaProvider(LLMProvider):
             }
             
             # Make the API call (adjust endpoint as needed)
-            response = requests.post(
+            response = await self._post_json(
                 "https://api.meta.ai/v1/chat/completions",
                 headers=headers,
-                json=data
+                payload=data,
+                timeout=self._call_timeout(kwargs)
             )
             
             if response.status_code == 200:
@@ -847,6 +1177,28 @@ class LlamaProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from Llama models token by token"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 1000)
+        }
+        
+        async for event in self._stream_chat_completions("https://api.meta.ai/v1/chat/completions", headers, data, timeout=self._call_timeout(kwargs)):
+            yield event
+    
     def get_available_models(self) -> List[str]:
         """Get available Llama models"""
         return ["llama-3-70b", "llama-3-8b", "llama-2-70b", "llama-2-13b"]
@@ -867,6 +1219,8 @@ class LlamaProvider(LLMProvider):
 class TencentHunyuanProvider(LLMProvider):
     """腾讯混元 API integration"""
     
+    health_check_url = "https://hunyuan.tencentcloudapi.com"
+    
     def __init__(self):
         self.api_key = ""
         self.default_model = "hunyuan-lite"
@@ -910,11 +1264,11 @@ class TencentHunyuanProvider(LLMProvider):
             }
             
             # Make the API call
-            response = requests.post(
+            response = await self._post_json(
                 "https://hunyuan.tencentcloudapi.com/v1/chat/completions",
                 headers=headers,
-                json=data,
-                timeout=30
+                payload=data,
+                timeout=self._call_timeout(kwargs, 30)
             )
             
             if response.status_code == 200:
@@ -944,6 +1298,28 @@ class TencentHunyuanProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from Tencent Hunyuan models token by token"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 1000)
+        }
+        
+        async for event in self._stream_chat_completions("https://hunyuan.tencentcloudapi.com/v1/chat/completions", headers, data, timeout=self._call_timeout(kwargs, 30)):
+            yield event
+    
     def get_available_models(self) -> List[str]:
         """Get available Tencent Hunyuan models"""
         return ["hunyuan-lite", "hunyuan-standard", "hunyuan-pro"]
@@ -964,6 +1340,8 @@ class TencentHunyuanProvider(LLMProvider):
 class ZhipuAIProvider(LLMProvider):
     """智谱AI API integration"""
     
+    health_check_url = "https://open.bigmodel.cn/api/paas/v4/models"
+    
     def __init__(self):
         self.api_key = ""
         self.default_model = "glm-4"
@@ -1007,11 +1385,11 @@ class ZhipuAIProvider(LLMProvider):
             }
             
             # Make the API call
-            response = requests.post(
+            response = await self._post_json(
                 "https://open.bigmodel.cn/api/paas/v4/chat/completions",
                 headers=headers,
-                json=data,
-                timeout=30
+                payload=data,
+                timeout=self._call_timeout(kwargs, 30)
             )
             
             if response.status_code == 200:
@@ -1041,6 +1419,28 @@ class ZhipuAIProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from Zhipu AI models token by token"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 1000)
+        }
+        
+        async for event in self._stream_chat_completions("https://open.bigmodel.cn/api/paas/v4/chat/completions", headers, data, timeout=self._call_timeout(kwargs, 30)):
+            yield event
+    
     def get_available_models(self) -> List[str]:
         """Get available Zhipu AI models"""
         return ["glm-4", "glm-4v", "glm-3-turbo"]
@@ -1061,6 +1461,8 @@ class ZhipuAIProvider(LLMProvider):
 class MoonshotAIProvider(LLMProvider):
     """月之暗面 API integration"""
     
+    health_check_url = "https://api.moonshot.cn/v1/models"
+    
     def __init__(self):
         self.api_key = ""
         self.default_model = "moonshot-v1-8k"
@@ -1104,11 +1506,11 @@ class MoonshotAIProvider(LLMProvider):
             }
             
             # Make the API call
-            response = requests.post(
+            response = await self._post_json(
                 "https://api.moonshot.cn/v1/chat/completions",
                 headers=headers,
-                json=data,
-                timeout=30
+                payload=data,
+                timeout=self._call_timeout(kwargs, 30)
             )
             
             if response.status_code == 200:
@@ -1138,6 +1540,28 @@ class MoonshotAIProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from Moonshot AI models token by token"""
+        if not self.api_key or self.api_key == "":
+            async for event in self._mock_stream(prompt, **kwargs):
+                yield event
+            return
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 1000)
+        }
+        
+        async for event in self._stream_chat_completions("https://api.moonshot.cn/v1/chat/completions", headers, data, timeout=self._call_timeout(kwargs, 30)):
+            yield event
+    
     def get_available_models(self) -> List[str]:
         """Get available Moonshot AI models"""
         return ["moonshot-v1-8k", "moonshot-v1-32k", "moonshot-v1-128k"]
@@ -1158,6 +1582,10 @@ class MoonshotAIProvider(LLMProvider):
 class OllamaDeepSeekProvider(LLMProvider):
     """Ollama DeepSeek local deployment integration"""
     
+    @property
+    def health_check_url(self) -> str:
+        return f"{self.base_url}/api/tags"
+    
     def __init__(self):
         self.base_url = "http://localhost:11434"
         self.default_model = "deepseek-r1:7b"
@@ -1177,13 +1605,10 @@ class OllamaDeepSeekProvider(LLMProvider):
             temperature = kwargs.get('temperature', 0.7)
             max_tokens = kwargs.get('max_tokens', 1000)
             
-            # Check if Ollama is running
-            try:
-                health_response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-                if health_response.status_code != 200:
-                    raise Exception("Ollama service not available")
-            except Exception as e:
-                logger.warning(f"Ollama health check failed: {str(e)}")
+            # Check if Ollama is running (state kept by the background health registry)
+            if not provider_health.is_available(self.provider_name):
+                health = provider_health.get_health(self.provider_name)
+                logger.warning(f"Ollama health check failed: {health.last_error if health else 'unavailable'}")
                 return {
                     "provider": self.provider_name,
                     "model": model,
@@ -1206,11 +1631,11 @@ class OllamaDeepSeekProvider(LLMProvider):
             }
             
             # Make the API call to Ollama
-            response = requests.post(
+            response = await self._post_json(
                 f"{self.base_url}/api/generate",
                 headers=headers,
-                json=data,
-                timeout=60  # Longer timeout for local generation
+                payload=data,
+                timeout=self._call_timeout(kwargs, 60)  # Longer timeout for local generation
             )
             
             if response.status_code == 200:
@@ -1232,7 +1657,7 @@ class OllamaDeepSeekProvider(LLMProvider):
                     "timestamp": datetime.now().isoformat()
                 }
                 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error("Ollama DeepSeek request timeout")
             return {
                 "provider": self.provider_name,
@@ -1249,31 +1674,56 @@ class OllamaDeepSeekProvider(LLMProvider):
                 "timestamp": datetime.now().isoformat()
             }
     
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a response from local Ollama models (`/api/generate` with "stream": true, NDJSON)"""
+        if not provider_health.is_available(self.provider_name):
+            raise AIProviderError("Ollama service not available", provider=self.provider_name)
+        
+        data = {
+            "model": kwargs.get('model', self.default_model),
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "temperature": kwargs.get('temperature', 0.7),
+                "num_predict": kwargs.get('max_tokens', 1000)
+            }
+        }
+        
+        async for event in self._stream_events(
+            f"{self.base_url}/api/generate",
+            {"Content-Type": "application/json"},
+            data,
+            timeout=self._call_timeout(kwargs, 60),
+            ndjson=True
+        ):
+            if event.get("error"):
+                raise AIProviderError(str(event["error"]), provider=self.provider_name)
+            if event.get("response"):
+                yield {"type": "delta", "content": event["response"]}
+            if event.get("done"):
+                return
+    
     def get_available_models(self) -> List[str]:
-        """Get available Ollama DeepSeek models"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                models_data = response.json()
-                # Filter for DeepSeek models
-                deepseek_models = []
-                for model in models_data.get("models", []):
-                    model_name = model.get("name", "")
-                    if "deepseek" in model_name.lower():
-                        deepseek_models.append(model_name)
-                
-                if deepseek_models:
-                    return deepseek_models
-                else:
-                    # Return common DeepSeek model names if none found
-                    return ["deepseek-r1:7b", "deepseek-r1:1.5b", "deepseek-coder:6.7b"]
-            else:
-                logger.warning(f"Failed to fetch Ollama models: {response.status_code}")
-                return ["deepseek-r1:7b", "deepseek-r1:1.5b", "deepseek-coder:6.7b"]
-                
-        except Exception as e:
-            logger.warning(f"Error fetching Ollama models: {str(e)}")
-            return ["deepseek-r1:7b", "deepseek-r1:1.5b", "deepseek-coder:6.7b"]
+        """Get common Ollama DeepSeek models (used until the local catalog has been fetched)"""
+        return ["deepseek-r1:7b", "deepseek-r1:1.5b", "deepseek-coder:6.7b"]
+    
+    async def fetch_available_models(self, timeout: Optional[float] = None) -> List[str]:
+        """Fetch the DeepSeek models installed in the local Ollama service"""
+        response = await self._get(f"{self.base_url}/api/tags", timeout=timeout or 5)
+        if response.status_code != 200:
+            logger.warning(f"Failed to fetch Ollama models: {response.status_code}")
+            raise AIProviderError(f"Ollama API error: {response.status_code}", provider=self.provider_name)
+        
+        models_data = response.json()
+        # Filter for DeepSeek models
+        deepseek_models = []
+        for model in models_data.get("models", []):
+            model_name = model.get("name", "")
+            if "deepseek" in model_name.lower():
+                deepseek_models.append(model_name)
+        
+        # Return common DeepSeek model names if none found
+        return deepseek_models or self.get_available_models()
     
     @property
     def provider_name(self) -> str:
@@ -1288,20 +1738,116 @@ class OllamaDeepSeekProvider(LLMProvider):
         return self._cost_tier
 
 
+class FakeLLMProvider(LLMProvider):
+    """
+    Local fake LLM for load testing without API keys
+    
+    Unlike the instant "no API key" mock answers, it simulates upstream latency, token-by-token
+    streaming, errors and hangs as configured by a FakeLLMProfile (see services.fake_llm).
+    Registered under a real provider's name it keeps that provider's capabilities and cost tier,
+    so routing, fallback and the circuit breakers behave as in production.
+    """
+    
+    def __init__(self, name: str = "fake", capabilities: Optional[List[str]] = None, cost_tier: int = 1,
+                 profile: Optional[FakeLLMProfile] = None):
+        self.api_key = "fake"
+        self.default_model = f"{name}-sim"
+        self._name = name
+        self._capabilities = capabilities or ["general", "chinese", "reasoning", "code", "math"]
+        self._cost_tier = cost_tier
+        self.engine = FakeLLM(name, profile)
+    
+    def initialize(self, api_key: str = "", **kwargs) -> None:
+        """Initialize the fake provider; keyword arguments override fields of its FakeLLMProfile"""
+        self.default_model = kwargs.get('default_model', self.default_model)
+        self.engine.profile = self.engine.profile.merged(kwargs)
+        logger.info(f"Fake provider '{self._name}' initialized: {self.engine.profile}")
+    
+    async def health_check(self) -> bool:
+        return True
+    
+    async def _wait(self, seconds: float, kwargs: Dict[str, Any]) -> bool:
+        """Sleep for the simulated time; False when the call timeout is reached first"""
+        timeout = self._call_timeout(kwargs)
+        if timeout is not None and seconds > timeout:
+            await asyncio.sleep(max(0.0, timeout))
+            return False
+        await asyncio.sleep(seconds)
+        return True
+    
+    async def generate_response(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        """Generate a simulated response after the sampled latency and generation time"""
+        model = kwargs.get('model', self.default_model)
+        call = self.engine.plan(prompt, kwargs.get('max_tokens'))
+        
+        if call.outcome == OUTCOME_ERROR:
+            await self._wait(call.ttft, kwargs)
+            return {
+                "provider": self.provider_name,
+                "error": "API error: 500 (simulated)",
+                "content": "抱歉，在处理您的请求时遇到了问题。",
+                "timestamp": datetime.now().isoformat()
+            }
+        # A simulated timeout hangs for timeout_seconds (or until the call timeout) before failing
+        hang = call.ttft if call.outcome == OUTCOME_TIMEOUT else call.duration
+        if not await self._wait(hang, kwargs) or call.outcome == OUTCOME_TIMEOUT:
+            return {
+                "provider": self.provider_name,
+                "error": "Request timeout (simulated)",
+                "content": "抱歉，AI服务响应超时，请稍后重试。",
+                "timestamp": datetime.now().isoformat()
+            }
+        
+        return {
+            "provider": self.provider_name,
+            "model": model,
+            "content": call.content,
+            "raw_response": {
+                "usage": {
+                    "prompt_tokens": estimate_tokens(prompt, self._name),
+                    "completion_tokens": len(call.tokens)
+                }
+            },
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    async def stream_response(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the simulated answer token by token at the configured rate"""
+        call = self.engine.plan(prompt, kwargs.get('max_tokens'))
+        if not await self._wait(call.ttft, kwargs) or call.outcome == OUTCOME_TIMEOUT:
+            raise AIProviderError("Request timeout (simulated)", provider=self.provider_name)
+        if call.outcome == OUTCOME_ERROR:
+            raise AIProviderError("API error: 500 (simulated)", provider=self.provider_name)
+        for token in call.tokens:
+            # The call timeout covers the whole stream, not just the first token
+            if not await self._wait(call.token_delay, kwargs):
+                raise AIProviderError("Request timeout (simulated)", provider=self.provider_name)
+            yield {"type": "delta", "content": token}
+    
+    def get_available_models(self) -> List[str]:
+        return [self.default_model]
+    
+    @property
+    def provider_name(self) -> str:
+        return self._name
+    
+    @property
+    def provider_capabilities(self) -> List[str]:
+        return self._capabilities
+    
+    @property
+    def provider_cost_tier(self) -> int:
+        return self._cost_tier
+
+
 class ModelSelector:
     """Intelligent model selector for choosing the best model based on query content"""
     
+    # At least 10 consecutive Chinese characters
+    CHINESE_PATTERN = re.compile(r"[\u4e00-\u9fa5]{10,}")
+    
     def __init__(self, llm_manager):
         self.llm_manager = llm_manager
-        self.patterns = {
-            "math": r"(数学|方程|计算|积分|微分|导数|矩阵|向量|概率|统计|几何|代数|三角|函数)",
-            "code": r"(代码|编程|函数|算法|程序|开发|软件|编写|实现|调试|API|接口|类|对象|变量|循环|条件|语法)",
-            "electronics": r"(电路|电子|电工|电压|电流|电阻|电容|电感|晶体管|二极管|逻辑门|数字电路|模拟电路|信号|频率|波形|示波器|仿真)",
-            "physics": r"(物理|力学|动力学|热力学|电磁学|光学|量子|相对论|能量|功率|速度|加速度|质量|动量|波动|振动)",
-            "chemistry": r"(化学|元素|分子|原子|化合物|反应|酸碱|氧化|还原|溶液|浓度|催化剂|有机|无机|物质)",
-            "biology": r"(生物|细胞|基因|蛋白质|DNA|RNA|酶|代谢|遗传|进化|生态|微生物|植物|动物|人体|组织|器官)",
-            "chinese": r"[\u4e00-\u9fa5]{10,}"  # At least 10 Chinese characters
-        }
     
     def select_model(self, query: str, user_preference: Optional[str] = None) -> Tuple[str, str, str]:
         """
@@ -1353,16 +1899,11 @@ class ModelSelector:
                     logger.info("Using Ollama DeepSeek as fallback (no cloud providers available)")
             
             if should_use_ollama:
-                try:
-                    # Quick health check for Ollama
-                    import requests
-                    health_response = requests.get("http://localhost:11434/api/tags", timeout=2)
-                    if health_response.status_code == 200:
-                        logger.info(f"Selected Ollama DeepSeek, model: {ollama_provider.default_model}")
-                        return 'ollama_deepseek', ollama_provider.default_model, reason
-                    else:
-                        logger.info("Ollama DeepSeek not available, falling back to cloud providers")
-                except:
+                # Health state comes from the background registry, no request-path probe
+                if self.llm_manager.is_provider_available('ollama_deepseek'):
+                    logger.info(f"Selected Ollama DeepSeek, model: {ollama_provider.default_model}")
+                    return 'ollama_deepseek', ollama_provider.default_model, reason
+                else:
                     logger.info("Ollama DeepSeek not available, falling back to cloud providers")
         
         # 优先级顺序：主力中国AI服务 > 备用AI服务 > 其他
@@ -1370,14 +1911,14 @@ class ModelSelector:
         backup_providers = ['deepseek', 'openai']  # 备用AI服务
         
         # 首先尝试主力中国AI服务
-        available_primary_providers = [p for p in primary_providers if p in self.llm_manager.get_all_providers()]
+        available_primary_providers = [p for p in primary_providers if self.llm_manager.is_provider_available(p)]
         
         if available_primary_providers:
             # 评分主力提供商
             providers = {name: self.llm_manager.providers[name] for name in available_primary_providers}
             scores = {}
             for name, provider in providers.items():
-                score = self._calculate_provider_score(provider, characteristics)
+                score = self._calculate_provider_score(provider, characteristics, name)
                 scores[name] = score
             
             logger.info(f"Primary provider scores: {scores}")
@@ -1424,14 +1965,14 @@ class ModelSelector:
             return best_provider_name, best_provider.default_model, reason
         
         # 如果主力提供商不可用，尝试备用AI服务
-        available_backup_providers = [p for p in backup_providers if p in self.llm_manager.get_all_providers()]
+        available_backup_providers = [p for p in backup_providers if self.llm_manager.is_provider_available(p)]
         
         if available_backup_providers:
             # 评分备用提供商
             providers = {name: self.llm_manager.providers[name] for name in available_backup_providers}
             scores = {}
             for name, provider in providers.items():
-                score = self._calculate_provider_score(provider, characteristics)
+                score = self._calculate_provider_score(provider, characteristics, name)
                 scores[name] = score
             
             logger.info(f"Backup provider scores: {scores}")
@@ -1469,7 +2010,7 @@ class ModelSelector:
         providers = {name: self.llm_manager.providers[name] for name in self.llm_manager.get_all_providers()}
         scores = {}
         for name, provider in providers.items():
-            score = self._calculate_provider_score(provider, characteristics)
+            score = self._calculate_provider_score(provider, characteristics, name)
             scores[name] = score
         
         logger.info(f"Fallback provider scores: {scores}")
@@ -1487,12 +2028,10 @@ class ModelSelector:
     
     def _detect_characteristics(self, query: str) -> List[str]:
         """Detect characteristics of the query"""
-        characteristics = []
-        
-        # Check for each pattern
-        for category, pattern in self.patterns.items():
-            if re.search(pattern, query):
-                characteristics.append(category)
+        # Subject keywords come from the shared single-pass keyword engine
+        characteristics = keyword_engine.match(query).labels(QUERY_CHARACTERISTICS)
+        if self.CHINESE_PATTERN.search(query):
+            characteristics.append("chinese")
         
         # Add general by default
         characteristics.append("general")
@@ -1503,8 +2042,13 @@ class ModelSelector:
         
         return characteristics
     
-    def _calculate_provider_score(self, provider: LLMProvider, characteristics: List[str]) -> float:
-        """Calculate score for a provider based on characteristics match"""
+    def _calculate_provider_score(self, provider: LLMProvider, characteristics: List[str],
+                                  name: Optional[str] = None) -> float:
+        """
+        Calculate score for a provider based on characteristics match, cost tier and
+        live EWMA latency / time-to-first-token / error-rate statistics of the
+        registered provider `name` (weights in RoutingSettings, see services.provider_stats)
+        """
         score = 0.0
         
         # Base score from capabilities match
@@ -1519,21 +2063,39 @@ class ModelSelector:
             # For simple queries, prefer lower cost models
             score += (6 - provider.provider_cost_tier) * 0.1
         
+        # Steer traffic toward whatever is fastest and healthy right now
+        if name:
+            score -= provider_stats.routing_penalty(name, provider.default_model)
+        
         return score
 
 
 class LLMManager:
     """Manager class to handle multiple LLM providers with intelligent model selection"""
     
+    # 备用服务优先级：火山引擎DeepSeek > 阿里云通义千问 > 本地DeepSeek
+    BACKUP_SERVICES = ['volces_deepseek', 'ali_qwen', 'ollama_deepseek']
+    BACKUP_SERVICE_NAMES = {
+        'volces_deepseek': '火山引擎DeepSeek',
+        'ali_qwen': '阿里云通义千问',
+        'ollama_deepseek': '本地DeepSeek'
+    }
+    
     def __init__(self):
         """Initialize LLM manager"""
         self.providers = {}
         self.default_provider = None
         self.model_selector = None
+        self.default_deadline = DEFAULT_DEADLINE
+        # Per-provider model catalogs: refreshed in the background, last good list served during outages
+        self.model_catalog = RefreshAheadCache("model catalog", refresh_ahead=0.2, retry_after=60, stale_on_error=True)
+        self.model_catalog_ttl = 3600.0
+        self.model_catalog_timeout = 5.0
     
     def register_provider(self, name: str, provider: LLMProvider) -> None:
         """Register a new LLM provider"""
         self.providers[name] = provider
+        provider_health.register(name, provider.health_check)
         if self.default_provider is None:
             self.default_provider = name
         logger.info(f"Registered provider: {name}")
@@ -1551,8 +2113,8 @@ class LLMManager:
         self.model_selector = ModelSelector(self)
         logger.info("Model selector initialized")
     
-    async def generate_response(self, prompt: str, provider: Optional[str] = None, **kwargs) -> Dict[str, Any]:
-        """Generate a response using the specified or auto-selected provider"""
+    def _resolve_provider(self, prompt: str, provider: Optional[str], kwargs: Dict[str, Any]) -> Tuple[Optional[str], str]:
+        """Pick the provider for a request; updates kwargs['model'] when auto-selecting"""
         selection_reason = "默认模型"
         
         # Use model selector if available and no specific provider requested
@@ -1562,9 +2124,185 @@ class LLMManager:
             kwargs['model'] = selected_model
             logger.info(f"Auto-selected provider: {selected_provider}, model: {selected_model}")
         else:
-            provider_name = provider or self.default_provider
             if provider:
                 selection_reason = "用户指定模型"
+            provider = provider or self.default_provider
+        
+        return provider, selection_reason
+    
+    def is_provider_available(self, name: str) -> bool:
+        """Whether a provider is registered, passing health checks and not tripped by its circuit breaker"""
+        return (
+            name in self.providers
+            and provider_health.is_available(name)
+            and not circuit_breakers.get(name).is_open()
+        )
+    
+    async def _call_provider(self, name: str, prompt: str, **kwargs) -> Dict[str, Any]:
+        """Call a single provider through its circuit breaker, bounded by the request deadline"""
+        deadline = kwargs.get('deadline')
+        if deadline is not None and deadline.expired():
+            return {
+                "provider": name,
+                "error": "Request deadline exceeded (timeout)",
+                "deadline_exceeded": True,
+                "content": "抱歉，AI服务响应超时，请稍后重试。",
+                "timestamp": datetime.now().isoformat()
+            }
+        
+        breaker = circuit_breakers.get(name)
+        if not breaker.allow_request():
+            logger.info(f"Circuit for {name} is open, skipping call")
+            return {
+                "provider": name,
+                "error": f"Circuit open for provider '{name}'",
+                "circuit_open": True,
+                "content": "该AI服务暂时不可用，请稍后再试。",
+                "timestamp": datetime.now().isoformat()
+            }
+        
+        # Queue briefly for the provider's RPM/TPM/concurrency limits; rejections
+        # are not provider failures and do not count against the circuit breaker
+        limiter = rate_limiters.get(name)
+        try:
+            await limiter.acquire(self._estimate_tokens(prompt, kwargs, name),
+                                  timeout=deadline.remaining() if deadline is not None else None)
+        except RateLimitError as e:
+            breaker.release()
+            logger.warning(f"Rate limit reached for {name}: {e.message}")
+            return {
+                "provider": name,
+                "error": e.message,
+                "rate_limited": True,
+                "retry_after": e.details.get('retry_after'),
+                "content": "当前请求较多，请稍后再试。",
+                "timestamp": datetime.now().isoformat()
+            }
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        
+        start = time.monotonic()
+        try:
+            call = self.providers[name].generate_response(prompt, **kwargs)
+            response = await (asyncio.wait_for(call, deadline.remaining()) if deadline is not None else call)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            breaker.record_failure(time.monotonic() - start, "deadline exceeded")
+            provider_stats.record_call(name, kwargs.get('model') or self.providers[name].default_model,
+                                       time.monotonic() - start, success=False)
+            logger.warning(f"{name} did not answer before the request deadline ({deadline.budget}s)")
+            return {
+                "provider": name,
+                "error": "Request deadline exceeded (timeout)",
+                "deadline_exceeded": True,
+                "content": "抱歉，AI服务响应超时，请稍后重试。",
+                "timestamp": datetime.now().isoformat()
+            }
+        except Exception as e:
+            breaker.record_failure(time.monotonic() - start, str(e))
+            provider_stats.record_call(name, kwargs.get('model') or self.providers[name].default_model,
+                                       time.monotonic() - start, success=False)
+            raise
+        finally:
+            limiter.release()
+        
+        duration = time.monotonic() - start
+        model = kwargs.get('model') or self.providers[name].default_model
+        if "error" in response:
+            breaker.record_failure(duration, str(response["error"]))
+            provider_stats.record_call(name, model, duration, success=False)
+        else:
+            breaker.record_success(duration)
+            provider_stats.record_call(name, model, duration, success=True)
+        return response
+    
+    @staticmethod
+    def _estimate_tokens(prompt: str, kwargs: Dict[str, Any], provider: Optional[str] = None) -> int:
+        """Tokens a call counts against the provider's TPM budget: prompt plus requested completion"""
+        return estimate_tokens(prompt, provider) + int(kwargs.get('max_tokens') or 1000)
+    
+    async def _generate_hedged(self, prompt: str, provider: str, selection_reason: str,
+                               race: int = 0, **kwargs) -> Dict[str, Any]:
+        """
+        Run the primary and backup providers under the hedging policy: a backup is
+        fired in parallel once the primary exceeds its latency percentile (or fails),
+        or the first `race` candidates are requested at once. First success wins.
+        """
+        backups = [name for name in self.BACKUP_SERVICES if name != provider and self.is_provider_available(name)]
+        attempts = [(provider, functools.partial(self._call_provider, provider, prompt, **kwargs))]
+        for backup_service in backups:
+            backup_kwargs = kwargs.copy()
+            backup_kwargs['model'] = self.providers[backup_service].default_model
+            attempts.append((backup_service, functools.partial(self._call_provider, backup_service, prompt, **backup_kwargs)))
+        
+        response, winner, errors = await hedging_policy.run(attempts, race=race)
+        
+        if response is None:
+            response = dict(errors[0][1]) if errors else {"error": "All providers failed", "content": "抱歉，AI服务暂时不可用，请稍后再试。"}
+            response["fallback_attempted"] = bool(backups)
+            response["fallback_services_tried"] = backups
+            response["selection_reason"] = "所有AI服务均不可用"
+            response["selected_provider"] = provider
+            return response
+        
+        if winner == provider:
+            response["selection_reason"] = selection_reason
+        elif race:
+            response["selection_reason"] = f"竞速模式，{self.BACKUP_SERVICE_NAMES.get(winner, winner)}最先返回"
+            response["fallback_from"] = provider
+        else:
+            response["selection_reason"] = f"主要AI服务响应缓慢或失败，自动切换到备用AI服务({self.BACKUP_SERVICE_NAMES.get(winner, winner)})"
+            response["fallback_from"] = provider
+        response["selected_provider"] = winner
+        response["fallback_hops"] = len(({name for name, _ in errors} | {winner}) - {provider})
+        if errors:
+            response["failed_providers"] = [name for name, _ in errors]
+        return response
+    
+    async def generate_response(self, prompt: str, provider: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Generate a response using the specified or auto-selected provider
+        
+        Manager options (not passed to providers):
+            hedge: override the global hedging policy for this request
+            race: request the first N candidate providers at once and keep the fastest answer
+            use_cache: set to False to bypass the response cache for this request
+            user_id, tenant_id: who the call is made for; calls are queued per user and
+                tenant and dispatched by weighted fair share (see services.llm_scheduler)
+            priority: 'interactive' (default) or 'background' for content generation nobody
+                is waiting on; background calls get their own concurrency budget, yield to
+                queued interactive calls and are not hedged unless hedge=True
+        
+        deadline (Deadline or seconds) is the total time budget for the call including
+        fallbacks; it is handed to every provider so each upstream timeout fits the budget.
+        
+        Every call is recorded in llm_metrics (latency, tokens, fallback hops, cache status).
+        """
+        start = time.monotonic()
+        try:
+            response = await self._generate_response(prompt, provider, **kwargs)
+        except Exception as e:
+            self._record_metrics(prompt, provider, {"error": str(e)}, time.monotonic() - start)
+            raise
+        self._record_metrics(prompt, provider, response, time.monotonic() - start)
+        return response
+    
+    async def _generate_response(self, prompt: str, provider: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        """Cache lookup, single-flight and fair-share scheduling around _dispatch (see generate_response)"""
+        hedge = kwargs.pop('hedge', None)
+        race = int(kwargs.pop('race', 0) or 0)
+        use_cache = kwargs.pop('use_cache', True)
+        user_id = kwargs.pop('user_id', None)
+        tenant_id = kwargs.pop('tenant_id', None)
+        priority = kwargs.pop('priority', PRIORITY_INTERACTIVE)
+        if priority == PRIORITY_BACKGROUND and hedge is None:
+            # Duplicate background requests would only take capacity from interactive ones
+            hedge = False
+        kwargs['deadline'] = Deadline.coerce(kwargs.get('deadline')) or Deadline(self.default_deadline)
+        provider, selection_reason = self._resolve_provider(prompt, provider, kwargs)
             
         if provider not in self.providers:
             logger.error(f"Provider '{provider}' not found")
@@ -1575,8 +2313,83 @@ class LLMManager:
                 "selection_reason": "模型不可用"
             }
         
+        request_key = response_cache.make_key(
+            prompt,
+            provider,
+            kwargs.get('model', self.providers[provider].default_model),
+            kwargs.get('temperature'),
+            kwargs.get('max_tokens')
+        )
+        
+        # Exact-match response cache (opt-in)
+        use_response_cache = use_cache and response_cache.enabled
+        if use_response_cache:
+            cached = response_cache.get(request_key)
+            if cached is not None:
+                logger.info(f"Response cache hit for {provider} ({request_key[:8]}...)")
+                return cached
+        
+        # Identical concurrent requests share one upstream call (single-flight);
+        # the shared call waits for its fair-share slot in the scheduler
+        start = time.monotonic()
+        dispatch = functools.partial(self._dispatch, prompt, provider, selection_reason, hedge=hedge, race=race, **kwargs)
+        scheduled = functools.partial(
+            llm_scheduler.run, dispatch,
+            user=user_id, tenant=tenant_id, provider=provider,
+            cost=self._estimate_tokens(prompt, kwargs) / 1000,
+            timeout=kwargs['deadline'].remaining(),
+            priority=priority
+        )
+        try:
+            response = await single_flight.run(request_key, scheduled, timeout=kwargs['deadline'].remaining())
+        except RateLimitError as e:
+            logger.warning(f"{priority} request from {tenant_id}/{user_id} rejected by scheduler: {e.message}")
+            return {
+                "provider": provider,
+                "error": e.message,
+                "rate_limited": True,
+                "retry_after": e.details.get('retry_after'),
+                "content": "当前请求较多，请稍后再试。",
+                "timestamp": datetime.now().isoformat(),
+                "selected_provider": provider
+            }
+        except asyncio.TimeoutError:
+            return {
+                "provider": provider,
+                "error": "Request deadline exceeded (timeout)",
+                "deadline_exceeded": True,
+                "content": "抱歉，AI服务响应超时，请稍后重试。",
+                "timestamp": datetime.now().isoformat(),
+                "selected_provider": provider
+            }
+        
+        if use_response_cache and "error" not in response and not response.get("coalesced"):
+            response_cache.set(request_key, response, time.monotonic() - start)
+        
+        return response
+    
+    def _record_metrics(self, prompt: str, provider: Optional[str], response: Dict[str, Any], duration: float) -> None:
+        """Feed a finished generate_response call into the metrics histograms and the AI request log"""
+        served_by = response.get("selected_provider") or response.get("provider") or provider
+        model = response.get("model") or getattr(self.providers.get(served_by), "default_model", None) or "unknown"
+        llm_metrics.record_response(prompt, provider, response, duration, model=model)
+        if "error" not in response and not response.get("cached") and not response.get("coalesced"):
+            ai_request_logger.log_ai_request(
+                served_by or "unknown",
+                model,
+                len(prompt),
+                len(response.get("content") or ""),
+                duration
+            )
+    
+    async def _dispatch(self, prompt: str, provider: str, selection_reason: str,
+                        hedge: Optional[bool] = None, race: int = 0, **kwargs) -> Dict[str, Any]:
+        """Call the resolved provider, falling back to backups either hedged or one after another"""
+        if race > 1 or hedging_policy.is_enabled(hedge):
+            return await self._generate_hedged(prompt, provider, selection_reason, race=race if race > 1 else 0, **kwargs)
+        
         # Generate response and add selection information
-        response = await self.providers[provider].generate_response(prompt, **kwargs)
+        response = await self._call_provider(provider, prompt, **kwargs)
         
         # 智能备用机制：当主要AI服务失败时自动切换到备用服务
         if "error" in response:
@@ -1585,7 +2398,15 @@ class LLMManager:
             fallback_reason = ""
             
             # 检查是否需要备用服务
-            if provider in ['claude', 'gemini']:  # 主要AI服务失败
+            if response.get("circuit_open"):  # 熔断中，直接切换，不再等待超时
+                should_fallback = True
+                fallback_reason = "主要AI服务熔断中，自动切换到备用AI服务"
+                logger.warning(f"Circuit for {provider} is open, going straight to backup services")
+            elif response.get("rate_limited"):  # 达到限流上限，交给有余量的备用服务
+                should_fallback = True
+                fallback_reason = "主要AI服务请求繁忙，自动切换到备用AI服务"
+                logger.warning(f"{provider} is at its rate limit, attempting fallback")
+            elif provider in ['claude', 'gemini']:  # 主要AI服务失败
                 should_fallback = True
                 fallback_reason = "主要AI服务不可用，自动切换到备用AI服务"
                 logger.warning(f"Primary AI service {provider} failed, attempting fallback to backup services")
@@ -1595,37 +2416,34 @@ class LLMManager:
                 logger.warning(f"Network error detected with {provider}, attempting fallback")
             
             if should_fallback:
-                # 备用服务优先级：火山引擎DeepSeek > 阿里云通义千问 > 本地DeepSeek
-                backup_services = ['volces_deepseek', 'ali_qwen', 'ollama_deepseek']
+                backup_services = self.BACKUP_SERVICES
+                hops = 0
                 
                 for backup_service in backup_services:
+                    if kwargs['deadline'].expired():
+                        logger.warning("Request deadline reached, no further fallback attempts")
+                        break
                     if backup_service in self.providers:
                         try:
                             logger.info(f"Attempting fallback to {backup_service}")
                             
-                            # 特殊处理本地DeepSeek的健康检查
-                            if backup_service == 'ollama_deepseek':
-                                import requests
-                                health_response = requests.get("http://localhost:11434/api/tags", timeout=2)
-                                if health_response.status_code != 200:
-                                    logger.warning("Ollama DeepSeek not available, trying next backup")
-                                    continue
+                            # 跳过健康检查标记为不可用或已熔断的备用服务
+                            if not self.is_provider_available(backup_service):
+                                logger.warning(f"{backup_service} not available, trying next backup")
+                                continue
                             
                             # 使用备用服务生成回答
                             fallback_kwargs = kwargs.copy()
                             fallback_kwargs['model'] = self.providers[backup_service].default_model
-                            fallback_response = await self.providers[backup_service].generate_response(prompt, **fallback_kwargs)
+                            hops += 1
+                            fallback_response = await self._call_provider(backup_service, prompt, **fallback_kwargs)
                             
                             # 如果备用服务成功，返回结果
                             if "error" not in fallback_response:
-                                service_names = {
-                                    'volces_deepseek': '火山引擎DeepSeek',
-                                    'ali_qwen': '阿里云通义千问',
-                                    'ollama_deepseek': '本地DeepSeek'
-                                }
-                                fallback_response["selection_reason"] = f"{fallback_reason}({service_names.get(backup_service, backup_service)})"
+                                fallback_response["selection_reason"] = f"{fallback_reason}({self.BACKUP_SERVICE_NAMES.get(backup_service, backup_service)})"
                                 fallback_response["selected_provider"] = backup_service
                                 fallback_response["fallback_from"] = provider
+                                fallback_response["fallback_hops"] = hops
                                 logger.info(f"Successfully fell back to {backup_service}")
                                 return fallback_response
                             else:
@@ -1638,6 +2456,7 @@ class LLMManager:
                 # 如果所有备用服务都失败，在原始错误响应中添加备用尝试信息
                 response["fallback_attempted"] = True
                 response["fallback_services_tried"] = backup_services
+                response["fallback_hops"] = hops
                 response["selection_reason"] = "所有AI服务均不可用"
         
         response["selection_reason"] = selection_reason
@@ -1645,17 +2464,266 @@ class LLMManager:
         
         return response
     
+    async def stream_response(self, prompt: str, provider: Optional[str] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a response as events using the specified or auto-selected provider.
+        
+        Yields a "meta" event first, then "reasoning"/"delta" events, and finally a
+        "done" or "error" event. If the provider fails before sending any content,
+        the same backup services as generate_response are tried in order.
+        
+        deadline (Deadline or seconds) bounds the wait for the first token, including
+        scheduling, rate limiting and fallbacks; providers also cap their own call
+        timeouts by its remaining budget.
+        """
+        # Hedging/racing does not apply once tokens are being streamed
+        kwargs.pop('hedge', None)
+        kwargs.pop('race', None)
+        kwargs.pop('use_cache', None)
+        user_id = kwargs.pop('user_id', None)
+        tenant_id = kwargs.pop('tenant_id', None)
+        priority = kwargs.pop('priority', PRIORITY_INTERACTIVE)
+        if kwargs.get('deadline') is not None:
+            kwargs['deadline'] = Deadline.coerce(kwargs['deadline'])
+        provider, selection_reason = self._resolve_provider(prompt, provider, kwargs)
+        
+        if provider not in self.providers:
+            logger.error(f"Provider '{provider}' not found")
+            yield {
+                "type": "error",
+                "error": f"Provider '{provider}' not found",
+                "content": "抱歉，请求的AI模型不可用。",
+                "selection_reason": "模型不可用"
+            }
+            return
+        
+        # A stream holds its fair-share scheduler slot until the last token
+        ticket = None
+        if llm_scheduler.enabled:
+            deadline = kwargs.get('deadline')
+            try:
+                ticket = await llm_scheduler.acquire(
+                    user_id, tenant_id, provider,
+                    cost=self._estimate_tokens(prompt, kwargs) / 1000,
+                    timeout=deadline.remaining() if deadline is not None else None,
+                    priority=priority
+                )
+            except RateLimitError as e:
+                yield {
+                    "type": "error",
+                    "error": e.message,
+                    "rate_limited": True,
+                    "retry_after": e.details.get('retry_after'),
+                    "content": "当前请求较多，请稍后再试。"
+                }
+                return
+            except asyncio.TimeoutError:
+                yield {
+                    "type": "error",
+                    "error": "Request deadline exceeded (timeout)",
+                    "deadline_exceeded": True,
+                    "content": "抱歉，AI服务响应超时，请稍后重试。"
+                }
+                return
+        
+        start = time.monotonic()
+        first_byte = None
+        served = {}
+        completion = []
+        status = STATUS_CANCELLED
+        try:
+            async for event in self._stream_candidates(prompt, provider, selection_reason, **kwargs):
+                event_type = event.get("type")
+                if event_type == "meta":
+                    served = event
+                elif event_type in ("delta", "reasoning") and event.get("content"):
+                    if first_byte is None:
+                        first_byte = time.monotonic() - start
+                    if event_type == "delta":
+                        completion.append(event["content"])
+                elif event_type == "done":
+                    status = STATUS_SUCCESS
+                elif event_type == "error":
+                    status = STATUS_ERROR
+                yield event
+        finally:
+            if ticket is not None:
+                llm_scheduler.release(ticket)
+            duration = time.monotonic() - start
+            served_by = served.get("selected_provider", provider)
+            content = "".join(completion)
+            llm_metrics.record(
+                served_by, served.get("model"), status,
+                duration=duration, ttfb=first_byte,
+                prompt_tokens=estimate_tokens(prompt, served_by),
+                completion_tokens=estimate_tokens(content, served_by),
+                fallback_hops=served.get("fallback_hops", 0)
+            )
+            if status == STATUS_SUCCESS:
+                ai_request_logger.log_ai_request(served_by, served.get("model") or "unknown", len(prompt), len(content), duration)
+    
+    async def _stream_candidates(self, prompt: str, provider: str, selection_reason: str,
+                                 **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream from the provider, falling back to backups until the first token arrives"""
+        candidates = [provider] + [name for name in self.BACKUP_SERVICES if name != provider and name in self.providers]
+        last_error = None
+        backup_attempts = 0
+        
+        deadline = kwargs.get('deadline')
+        
+        for index, candidate in enumerate(candidates):
+            if deadline is not None and deadline.expired():
+                logger.warning("Request deadline reached, no further streaming fallback attempts")
+                last_error = "Request deadline exceeded (timeout)"
+                break
+            candidate_kwargs = kwargs.copy()
+            if index > 0:
+                candidate_kwargs['model'] = self.providers[candidate].default_model
+                logger.info(f"Attempting streaming fallback to {candidate}")
+            
+            model = candidate_kwargs.get('model', self.providers[candidate].default_model)
+            meta = {
+                "type": "meta",
+                "selected_provider": candidate,
+                "model": model,
+                "selection_reason": selection_reason if index == 0 else "主要AI服务不可用，自动切换到备用AI服务"
+            }
+            if index > 0:
+                meta["fallback_from"] = provider
+                meta["fallback_hops"] = backup_attempts + 1
+            
+            breaker = circuit_breakers.get(candidate)
+            if (index > 0 and not provider_health.is_available(candidate)) or not breaker.allow_request():
+                last_error = last_error or f"Provider '{candidate}' not available"
+                logger.info(f"Skipping {candidate} for streaming: unavailable or circuit open")
+                continue
+            
+            limiter = rate_limiters.get(candidate)
+            try:
+                await limiter.acquire(self._estimate_tokens(prompt, candidate_kwargs, candidate),
+                                      timeout=deadline.remaining() if deadline is not None else None)
+            except RateLimitError as e:
+                breaker.release()
+                last_error = last_error or e.message
+                logger.info(f"Skipping {candidate} for streaming: {e.message}")
+                continue
+            except BaseException:
+                breaker.release()
+                raise
+            
+            start = time.monotonic()
+            first_token_time = None
+            started = False
+            if index > 0:
+                backup_attempts += 1
+            try:
+                stream = self.providers[candidate].stream_response(prompt, **candidate_kwargs)
+                async for event in self._bound_first_event(stream, deadline, candidate):
+                    if not started:
+                        started = True
+                        first_token_time = time.monotonic() - start
+                        yield meta
+                    yield event
+            except Exception as e:
+                last_error = str(e)
+                breaker.record_failure(time.monotonic() - start, last_error)
+                provider_stats.record_call(candidate, model, time.monotonic() - start, success=False)
+                if started:
+                    # 内容已经发送给客户端，无法再切换服务
+                    logger.error(f"Streaming from {candidate} interrupted: {last_error}")
+                    yield {"type": "error", "error": last_error, "selected_provider": candidate}
+                    return
+                logger.warning(f"Streaming from {candidate} failed before first token: {last_error}")
+                continue
+            except BaseException:
+                # 客户端断开或任务取消，不计入熔断统计
+                breaker.release()
+                raise
+            finally:
+                limiter.release()
+            
+            # 流式调用按首个token耗时判断是否为慢调用
+            breaker.record_success(first_token_time if first_token_time is not None else time.monotonic() - start)
+            provider_stats.record_call(candidate, model, time.monotonic() - start, success=True, ttft=first_token_time)
+            if not started:
+                yield meta
+            yield {"type": "done", "selected_provider": candidate, "model": model}
+            return
+        
+        if deadline is not None and deadline.expired():
+            yield {
+                "type": "error",
+                "error": "Request deadline exceeded (timeout)",
+                "deadline_exceeded": True,
+                "content": "抱歉，AI服务响应超时，请稍后重试。",
+                "fallback_services_tried": candidates[1:]
+            }
+            return
+        yield {
+            "type": "error",
+            "error": last_error or "All providers failed",
+            "content": "抱歉，AI服务暂时不可用，请稍后再试。",
+            "fallback_services_tried": candidates[1:],
+            "selection_reason": "所有AI服务均不可用"
+        }
+    
+    @staticmethod
+    async def _bound_first_event(stream: AsyncIterator[Dict[str, Any]], deadline: Optional[Deadline],
+                                 provider: str) -> AsyncIterator[Dict[str, Any]]:
+        """Re-yield a provider stream whose first event must arrive before the request deadline"""
+        try:
+            if deadline is not None:
+                try:
+                    first = await asyncio.wait_for(stream.__anext__(), deadline.remaining())
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise AIProviderError("Request deadline exceeded before the first token (timeout)", provider=provider)
+                yield first
+            async for event in stream:
+                yield event
+        finally:
+            await stream.aclose()
+    
     def get_all_providers(self) -> List[str]:
         """Get a list of all registered providers"""
         return list(self.providers.keys())
     
     def get_provider_models(self, provider: str) -> List[str]:
-        """Get available models for a specific provider"""
+        """
+        Get available models for a specific provider
+        
+        Served from the model catalog cache. A catalog past its refresh time is still returned
+        immediately and refreshed in the background; only the first lookup of a provider waits
+        for the upstream list (falling back to the provider's known models on errors).
+        """
         if provider not in self.providers:
             logger.error(f"Provider '{provider}' not found")
             return []
         
-        return self.providers[provider].get_available_models()
+        models, fresh = self.model_catalog.lookup(provider)
+        if fresh:
+            return list(models)
+        
+        loader = functools.partial(self._fetch_provider_models, provider)
+        if models is not None:
+            async_runtime.submit(self.model_catalog.refresh(provider, loader))
+            return list(models)
+        
+        try:
+            pending = async_runtime.submit(self.model_catalog.get(provider, loader, timeout=self.model_catalog_timeout))
+            return list(pending.result(timeout=self.model_catalog_timeout + 1))
+        except Exception as e:
+            logger.warning(f"Fetching models for '{provider}' failed, using known models: {str(e)}")
+            fallback = self.providers[provider].get_available_models()
+            # Retry later instead of waiting on the upstream again for every lookup
+            self.model_catalog.set(provider, fallback, self.model_catalog.retry_after)
+            return list(fallback)
+    
+    async def _fetch_provider_models(self, provider: str) -> Tuple[List[str], float]:
+        """Model catalog loader: (models, time to live)"""
+        models = await self.providers[provider].fetch_available_models(timeout=self.model_catalog_timeout)
+        return models, self.model_catalog_ttl
     
     def get_provider_capabilities(self, provider: str) -> List[str]:
         """Get capabilities for a specific provider"""
@@ -1671,10 +2739,67 @@ llm_manager = LLMManager()
 
 def initialize_llm_providers(config: Dict[str, Any]) -> None:
     """Initialize all LLM providers from configuration"""
+    # Configure shared keep-alive HTTP pools (global defaults + per-provider overrides)
+    http_client_pool.configure(
+        defaults=config.get('http_pool', {}),
+        overrides={
+            name: provider_config['http_pool']
+            for name, provider_config in config.items()
+            if isinstance(provider_config, dict) and isinstance(provider_config.get('http_pool'), dict)
+        }
+    )
+    async_runtime.add_shutdown_hook(http_client_pool.aclose)
+    
+    # Total time budget for calls that do not pass their own deadline
+    llm_manager.default_deadline = float(config.get('deadlines', {}).get('default', DEFAULT_DEADLINE))
+    
+    # Model catalog cache behind /api/llm/models/<provider>
+    catalog_config = config.get('model_catalog', {})
+    llm_manager.model_catalog_ttl = float(catalog_config.get('ttl', llm_manager.model_catalog_ttl))
+    llm_manager.model_catalog_timeout = float(catalog_config.get('timeout', llm_manager.model_catalog_timeout))
+    
+    # Exact-match response cache (opt-in, optional SQLite tier)
+    response_cache.configure(config.get('response_cache', {}))
+    single_flight.configure(config.get('single_flight'))
+    semantic_cache.configure(config.get('semantic_cache', {}))
+    
+    # Latency/error-aware scoring weights for automatic model selection
+    provider_stats.configure(config.get('adaptive_routing', {}))
+    
+    # Hedged/parallel fallback across backup providers
+    hedging_policy.configure(config.get('hedging', {}))
+    
+    # Token budget for assembled /ask prompts (knowledge base and context sections are trimmed to fit)
+    prompt_budgeter.configure(config.get('prompt_budget', {}))
+    
+    # Weighted fair queuing of LLM calls per tenant and user
+    llm_scheduler.configure(config.get('scheduler', {}))
+    
+    # Per-provider RPM/TPM token buckets and concurrency caps
+    rate_limiters.configure(
+        defaults=config.get('rate_limit', {}),
+        overrides={
+            name: provider_config['rate_limit']
+            for name, provider_config in config.items()
+            if isinstance(provider_config, dict) and isinstance(provider_config.get('rate_limit'), dict)
+        }
+    )
+    
+    # Per-provider circuit breakers (global defaults + per-provider overrides)
+    circuit_breakers.configure(
+        defaults=config.get('circuit_breaker', {}),
+        overrides={
+            name: provider_config['circuit_breaker']
+            for name, provider_config in config.items()
+            if isinstance(provider_config, dict) and isinstance(provider_config.get('circuit_breaker'), dict)
+        }
+    )
+    
     # Initialize OpenAI
     openai_provider = OpenAIProvider()
     openai_provider.initialize(
         api_key=config.get('openai', {}).get('api_key', ''),
+        api_base=config.get('openai', {}).get('api_base', 'https://api.openai.com/v1'),
         default_model=config.get('openai', {}).get('default_model', 'gpt-4o')
     )
     llm_manager.register_provider('openai', openai_provider)
@@ -1772,6 +2897,27 @@ def initialize_llm_providers(config: Dict[str, Any]) -> None:
     )
     llm_manager.register_provider('moonshot_ai', moonshot_provider)
     
+    # Fake providers for load testing without API keys: 'fake' adds a provider of that name,
+    # real provider names (or 'all') are replaced by fakes with the same capabilities and cost tier
+    fake_config = config.get('fake_llm', {})
+    fake_names = fake_config.get('providers') or []
+    if fake_names:
+        profile = FakeLLMProfile.from_env().merged(fake_config)
+        if 'all' in fake_names:
+            fake_names = llm_manager.get_all_providers()
+        for name in fake_names:
+            real_provider = llm_manager.providers.get(name)
+            fake_provider = FakeLLMProvider(
+                name,
+                capabilities=real_provider.provider_capabilities if real_provider else None,
+                cost_tier=real_provider.provider_cost_tier if real_provider else 1,
+                profile=profile
+            )
+            # Per-provider overrides, e.g. fake_llm.deepseek = {"latency_median": 3, "error_rate": 0.2}
+            fake_provider.initialize(**fake_config.get(name, {}))
+            llm_manager.register_provider(name, fake_provider)
+        logger.warning(f"Using fake LLM providers: {fake_names}")
+    
     # Set default provider if specified
     default_provider = config.get('default_provider', 'claude')
     if default_provider in llm_manager.get_all_providers():
@@ -1780,4 +2926,7 @@ def initialize_llm_providers(config: Dict[str, Any]) -> None:
     # Initialize model selector
     llm_manager.initialize_model_selector()
     
+    # Probe provider health in the background so routing never blocks on it
+    provider_health.start(**config.get('health_check', {}))
+    
     logger.info(f"Initialized LLM providers: {llm_manager.get_all_providers()}")
@@ -10,6 +10,7 @@ from typing import Dict, Any, List, Optional
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, JSON
 from sqlalchemy.orm import relationship
 from models.user import db, User, Subject
+from services.keyword_engine import keyword_engine, TRACKED_CONCEPTS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -271,10 +272,7 @@ class UserAnalyticsManager:
                 content = action_data.get('content', '') or action_data.get('query', '')
                 if content:
                     # Simple keyword extraction (can be enhanced with NLP)
-                    keywords = ['Arduino', 'PID', '传感器', '电机', '控制', '编程', '电路', '算法']
-                    for keyword in keywords:
-                        if keyword.lower() in content.lower():
-                            knowledge_points.append(keyword)
+                    knowledge_points = keyword_engine.match(content).labels(TRACKED_CONCEPTS)
             
             # Update knowledge points
             for point in knowledge_points:
@@ -8,7 +8,10 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from models.llm_models import llm_manager
-import json
+from services.async_runtime import run_async
+from services.llm_scheduler import PRIORITY_BACKGROUND
+from services.json_stream import extract_json
+from utils.request_context import get_request_identity
 import logging
 from datetime import datetime
 
@@ -349,8 +352,7 @@ def generate_experiment():
 """
 
         # 调用LLM生成实验内容
-        import asyncio
-        response = asyncio.run(llm_manager.generate_response(prompt))
+        response = run_async(llm_manager.generate_response(prompt, priority=PRIORITY_BACKGROUND, **get_request_identity()))
         
         # 检查响应格式
         if isinstance(response, dict) and 'content' in response:
@@ -358,25 +360,28 @@ def generate_experiment():
         else:
             response_content = str(response)
         
-        try:
-            # 尝试解析JSON响应
-            experiment_data = json.loads(response_content)
-            
-            # 验证必要字段
-            required_fields = ['overview', 'objectives', 'theory', 'steps', 'expected_results']
-            if all(field in experiment_data for field in required_fields):
-                return jsonify({
-                    'success': True,
-                    'experiment': experiment_data
-                })
-            else:
-                # 字段不完整，使用备用方案
-                return generate_fallback_experiment(experiment_id, title, description, subject)
-                
-        except json.JSONDecodeError:
+        # 解析JSON响应（容忍代码块、前后文字和截断）
+        experiment_data = extract_json(response_content)
+        if not isinstance(experiment_data, dict):
             # JSON解析失败，使用备用方案
             logger.warning("无法解析AI生成的实验内容，使用备用方案")
             return generate_fallback_experiment(experiment_id, title, description, subject)
+        
+        # 验证必要字段
+        required_fields = ['overview', 'objectives', 'theory', 'steps', 'expected_results']
+        missing_fields = [field for field in required_fields if field not in experiment_data]
+        if len(missing_fields) == len(required_fields):
+            return generate_fallback_experiment(experiment_id, title, description, subject)
+        if missing_fields:
+            # 字段不完整（如输出被截断），保留AI生成的部分，缺少的字段用备用内容补齐
+            logger.info(f"AI生成的实验内容缺少字段 {missing_fields}，使用备用内容补齐")
+            fallback_data = build_fallback_experiment(experiment_id, title, description, subject)
+            experiment_data.update({field: fallback_data[field] for field in missing_fields})
+        
+        return jsonify({
+            'success': True,
+            'experiment': experiment_data
+        })
             
     except Exception as e:
         logger.error(f"生成实验内容错误: {e}")
@@ -387,7 +392,15 @@ def generate_experiment():
 
 def generate_fallback_experiment(experiment_id, title, description, subject):
     """生成备用实验内容"""
-    fallback_data = {
+    return jsonify({
+        'success': True,
+        'experiment': build_fallback_experiment(experiment_id, title, description, subject),
+        'fallback': True
+    })
+
+def build_fallback_experiment(experiment_id, title, description, subject):
+    """备用实验内容数据"""
+    return {
         'overview': f'这是一个关于{title}的实验。{description}',
         'objectives': [
             f'理解{title}的基本原理',
@@ -408,12 +421,6 @@ def generate_fallback_experiment(experiment_id, title, description, subject):
         'expected_results': f'通过本实验，学生将掌握{title}的实际应用，理解相关理论知识，并获得宝贵的实践经验。',
         'simulation_type': get_simulation_type(subject)
     }
-    
-    return jsonify({
-        'success': True,
-        'experiment': fallback_data,
-        'fallback': True
-    })
 
 def get_simulation_type(subject):
     """根据学科获取仿真类型"""
@@ -538,8 +545,7 @@ def get_experiment_help():
 """
 
         # 调用LLM生成帮助内容
-        import asyncio
-        response = asyncio.run(llm_manager.generate_response(prompt))
+        response = run_async(llm_manager.generate_response(prompt, **get_request_identity()))
         
         # 检查响应格式
         if isinstance(response, dict) and 'content' in response:
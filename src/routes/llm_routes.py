@@ -3,12 +3,30 @@ API routes for LLM integration in Alethea platform
 Enhanced with optimization services
 """
 
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context, url_for
 import json
 import os
 import asyncio
 from datetime import datetime
 from models.llm_models import llm_manager
+from services.async_runtime import run_async, async_runtime
+from services.provider_health import provider_health
+from services.circuit_breaker import circuit_breakers
+from services.hedging import hedging_policy
+from services.deadline import Deadline, ASK_DEADLINE, RELATED_CONTENT_DEADLINE, DEADLINE_GRACE
+from services.llm_cache import response_cache
+from services.semantic_cache import semantic_cache
+from services.single_flight import single_flight
+from services.provider_stats import provider_stats
+from services.rate_limiter import rate_limiters
+from services.llm_scheduler import llm_scheduler, PRIORITY_BACKGROUND
+from services.keyword_engine import keyword_engine, SUBJECT_DOMAINS
+from services.prompt_budget import prompt_budgeter, PromptSection
+from services.llm_metrics import llm_metrics
+from services.llm_jobs import job_manager, JOB_SUCCEEDED, JOB_FAILED
+from services.json_stream import IncrementalJSONParser, extract_json, parse_llm_json, EVENT_ITEM
+from utils.error_handler import RateLimitError
+from utils.request_context import get_request_identity, get_client_id
 from services.content_optimization import (
     content_cache, quality_validator, user_profile_manager, 
     multimedia_enhancer, performance_monitor
@@ -17,6 +35,9 @@ from services.content_optimization import (
 # Create blueprint
 llm_bp = Blueprint('llm', __name__, url_prefix='/api/llm')
 
+# Lists in the related-content JSON that are streamed item by item
+RELATED_CONTENT_ITEM_KEYS = ('knowledge_points', 'experiments')
+
 @llm_bp.route('/ask', methods=['POST'])
 def ask_question():
     """
@@ -32,7 +53,12 @@ def ask_question():
             "max_tokens": 1000
         },
         "use_knowledge_base": true, // optional, whether to search personal knowledge base
-        "context": "additional context" // optional
+        "context": "additional context", // optional
+        "race_providers": 2,  // optional, ask N providers at once and return the fastest answer (latency-critical sessions)
+        "hedge": true,        // optional, override the global hedging policy
+        "use_cache": true,    // optional, set false to bypass the LLM response cache
+        "prefetch_related": true // optional, start related-content generation as soon as the answer is ready
+                                 // (default LLM_RELATED_PREFETCH); the job id is returned as "related_content_job"
     }
     """
     try:
@@ -43,51 +69,56 @@ def ask_question():
                 'error': 'Missing required parameter: question'
             }), 400
         
-        question = data['question']
-        provider = data.get('provider')
-        model = data.get('model')
-        options = data.get('options', {})
-        use_knowledge_base = data.get('use_knowledge_base', True)
-        context = data.get('context', '')
-        
-        # Get user personalized settings
-        user_id = session.get('user_id', 1)
-        user_settings = get_user_ai_settings(user_id)
+        deadline = Deadline(ASK_DEADLINE)
+        ask = prepare_ask_request(data)
         
-        # Apply user preferences if not explicitly provided
-        if not provider and user_settings.get('ai_preferences', {}).get('preferred_provider') != 'auto':
-            provider = user_settings.get('ai_preferences', {}).get('preferred_provider')
+        # Near-duplicate questions (paraphrases) reuse a cached answer
+        semantic_scope = None
+        semantic_hit = None
+        if semantic_cache.enabled and ask['options'].get('use_cache', True):
+            semantic_scope = get_semantic_cache_scope(ask)
+            semantic_hit = semantic_cache.lookup(ask['question'], semantic_scope)
         
-        # Adjust options based on user settings
-        response_length = user_settings.get('ai_preferences', {}).get('response_length', 'medium')
-        if response_length == 'short':
-            options['max_tokens'] = options.get('max_tokens', 500)
-        elif response_length == 'long':
-            options['max_tokens'] = options.get('max_tokens', 2000)
-        else:  # medium
-            options['max_tokens'] = options.get('max_tokens', 1000)
-        
-        # Combine options with model if provided
-        if model:
-            options['model'] = model
-        
-        # Build enhanced prompt with user preferences and knowledge base
-        enhanced_prompt = build_enhanced_prompt(question, user_settings, use_knowledge_base, context, user_id)
+        if semantic_hit:
+            response, similarity, matched_question = semantic_hit
+            response['cached'] = True
+            response['semantic_cache'] = {
+                'similarity': round(similarity, 4),
+                'matched_question': matched_question
+            }
+        else:
+            # Generate response from LLM on the shared event loop within the request deadline
+            response = run_async(llm_manager.generate_response(
+                prompt=ask['prompt'],
+                provider=ask['provider'],
+                deadline=deadline,
+                **ask['options']
+            ), timeout=deadline.remaining() + DEADLINE_GRACE)
+            
+            if semantic_scope is not None and 'error' not in response:
+                semantic_cache.add(ask['question'], response, semantic_scope)
+            
+            # Every candidate provider is at its rate limit: tell the client when to retry
+            if response.get('rate_limited') and 'error' in response:
+                error = RateLimitError(response['error'], details={
+                    'retry_after': response.get('retry_after'),
+                    'provider': response.get('selected_provider')
+                })
+                return jsonify(error.to_dict()), 429
         
-        # Generate response from LLM (using asyncio.run for sync compatibility)
-        import asyncio
-        response = asyncio.run(llm_manager.generate_response(
-            prompt=enhanced_prompt,
-            provider=provider,
-            **options
-        ))
+        # Start related-content generation while the student is still reading the answer
+        if 'error' not in response and response.get('content') and should_prefetch_related(data):
+            job = prefetch_related_content(ask['question'], response['content'], data)
+            if job is not None:
+                response['related_content_job'] = job.id
         
         # Add knowledge base references if used
-        if use_knowledge_base and response.get('content'):
-            knowledge_refs = get_knowledge_base_references(question, user_id)
+        if ask['use_knowledge_base'] and response.get('content'):
+            knowledge_refs = get_knowledge_base_references(ask['question'], ask['user_id'])
             if knowledge_refs:
                 response['knowledge_base_references'] = knowledge_refs
         
+        response['prompt_budget'] = ask['prompt_budget']
         return jsonify(response)
     
     except Exception as e:
@@ -96,6 +127,152 @@ def ask_question():
             'message': 'An error occurred while processing your request'
         }), 500
 
+@llm_bp.route('/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """
+    Streaming variant of /ask using Server-Sent Events
+    
+    Request body is the same as /ask. The response is a text/event-stream with events:
+        meta      - {"selected_provider", "model", "selection_reason"}
+        reasoning - {"content": "..."} reasoning tokens (DeepSeek-R1 style models)
+        delta     - {"content": "..."} answer tokens
+        done      - {"selected_provider", "model", "prompt_budget", "knowledge_base_references"?, "related_content_job"?}
+        error     - {"error": "..."}
+    """
+    data = request.json
+    
+    if not data or 'question' not in data:
+        return jsonify({
+            'error': 'Missing required parameter: question'
+        }), 400
+    
+    try:
+        ask = prepare_ask_request(data)
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'message': 'An error occurred while processing your request'
+        }), 500
+    
+    max_buffer = int(os.getenv('LLM_STREAM_BUFFER', '64'))
+    idle_timeout = float(os.getenv('LLM_STREAM_IDLE_TIMEOUT', '120'))
+    # The first token (including fallbacks) must arrive within the same budget as /ask
+    deadline = Deadline(ASK_DEADLINE)
+    
+    def generate():
+        answer_parts = []
+        try:
+            events = async_runtime.iterate(
+                llm_manager.stream_response(
+                    prompt=ask['prompt'],
+                    provider=ask['provider'],
+                    deadline=deadline,
+                    **ask['options']
+                ),
+                max_buffer=max_buffer,
+                timeout=idle_timeout
+            )
+            for event in events:
+                if event.get('type') == 'delta' and event.get('content'):
+                    answer_parts.append(event['content'])
+                if event.get('type') == 'done':
+                    event['prompt_budget'] = ask['prompt_budget']
+                if event.get('type') == 'done' and answer_parts and should_prefetch_related(data):
+                    job = prefetch_related_content(ask['question'], ''.join(answer_parts), data)
+                    if job is not None:
+                        event['related_content_job'] = job.id
+                if event.get('type') == 'done' and ask['use_knowledge_base'] and answer_parts:
+                    knowledge_refs = get_knowledge_base_references(ask['question'], ask['user_id'])
+                    if knowledge_refs:
+                        event['knowledge_base_references'] = knowledge_refs
+                yield format_sse_event(event)
+        except Exception as e:
+            yield format_sse_event({
+                'type': 'error',
+                'error': str(e),
+                'message': 'An error occurred while processing your request'
+            })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def prepare_ask_request(data):
+    """
+    Resolve provider, options and the enhanced prompt for an /ask request
+    (shared by the blocking and streaming endpoints)
+    """
+    question = data['question']
+    provider = data.get('provider')
+    model = data.get('model')
+    options = data.get('options', {})
+    use_knowledge_base = data.get('use_knowledge_base', True)
+    context = data.get('context', '')
+    
+    # Get user personalized settings
+    user_id = session.get('user_id', 1)
+    user_settings = get_user_ai_settings(user_id)
+    
+    # Apply user preferences if not explicitly provided
+    if not provider and user_settings.get('ai_preferences', {}).get('preferred_provider') != 'auto':
+        provider = user_settings.get('ai_preferences', {}).get('preferred_provider')
+    
+    # Adjust options based on user settings
+    response_length = user_settings.get('ai_preferences', {}).get('response_length', 'medium')
+    if response_length == 'short':
+        options['max_tokens'] = options.get('max_tokens', 500)
+    elif response_length == 'long':
+        options['max_tokens'] = options.get('max_tokens', 2000)
+    else:  # medium
+        options['max_tokens'] = options.get('max_tokens', 1000)
+    
+    # Combine options with model if provided
+    if model:
+        options['model'] = model
+    
+    # Hedging / race mode for latency-critical sessions
+    if data.get('race_providers'):
+        options['race'] = int(data['race_providers'])
+    if data.get('hedge') is not None:
+        options['hedge'] = bool(data['hedge'])
+    if data.get('use_cache') is not None:
+        options['use_cache'] = bool(data['use_cache'])
+    
+    # Fair-share scheduling per user and class
+    options.update(get_request_identity())
+    
+    # Build enhanced prompt with user preferences and knowledge base, within the prompt token budget
+    enhanced_prompt = build_enhanced_prompt(question, user_settings, use_knowledge_base, context, user_id, provider)
+    
+    return {
+        'question': question,
+        'provider': provider,
+        'options': options,
+        'use_knowledge_base': use_knowledge_base,
+        'user_id': user_id,
+        'prompt': enhanced_prompt.prompt,
+        'prompt_budget': enhanced_prompt.to_dict()
+    }
+
+def get_semantic_cache_scope(ask):
+    """
+    Scope for the semantic cache: answers are only shared between questions asked with
+    the same provider, options and prompt template (user settings, knowledge base context)
+    """
+    options = {k: v for k, v in ask['options'].items() if k not in ('race', 'hedge', 'use_cache')}
+    template = ask['prompt'].replace(ask['question'], '{question}')
+    return semantic_cache.make_scope(ask['provider'], sorted(options.items()), template)
+
+def format_sse_event(event):
+    """Serialize a stream event as a Server-Sent Events frame"""
+    payload = {k: v for k, v in event.items() if k != 'type'}
+    return f"event: {event.get('type', 'message')}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
 @llm_bp.route('/providers', methods=['GET'])
 def get_providers():
     """Get all available LLM providers"""
@@ -111,6 +288,61 @@ def get_providers():
             'message': 'An error occurred while fetching providers'
         }), 500
 
+@llm_bp.route('/providers/health', methods=['GET'])
+def get_providers_health():
+    """Get background health-check and circuit breaker status of all LLM providers"""
+    try:
+        return jsonify({
+            'success': True,
+            'providers': provider_health.get_status(),
+            'circuit_breakers': circuit_breakers.get_status(),
+            'latency': provider_stats.get_stats(),
+            'hedging': hedging_policy.get_stats(),
+            'rate_limits': rate_limiters.get_status(),
+            'model_catalog': llm_manager.model_catalog.get_stats(),
+            'interval': provider_health.interval
+        })
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'message': 'An error occurred while fetching provider health'
+        }), 500
+
+@llm_bp.route('/scheduler', methods=['GET'])
+def get_scheduler_stats():
+    """Get LLM scheduler queue depth and wait-time metrics per tenant"""
+    try:
+        return jsonify({
+            'success': True,
+            'scheduler': llm_scheduler.get_stats(),
+            'jobs': job_manager.get_stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'message': 'An error occurred while fetching scheduler stats'
+        }), 500
+
+@llm_bp.route('/metrics', methods=['GET'])
+def get_llm_metrics():
+    """LLM call metrics (latency, time-to-first-byte, token and throughput histograms) in Prometheus text format"""
+    return Response(llm_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@llm_bp.route('/metrics/summary', methods=['GET'])
+def get_llm_metrics_summary():
+    """p50/p95/p99 of the LLM call histograms per provider and model"""
+    try:
+        return jsonify({
+            'success': True,
+            'providers': llm_metrics.get_summary(),
+            'prompt_budget': prompt_budgeter.get_stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'message': 'An error occurred while fetching LLM metrics'
+        }), 500
+
 @llm_bp.route('/models/<provider>', methods=['GET'])
 def get_provider_models(provider):
     """Get available models for a specific provider"""
@@ -134,8 +366,13 @@ def generate_related_content():
     Request body:
     {
         "question": "用户的问题",
-        "answer": "AI的回答内容"
+        "answer": "AI的回答内容",
+        "async": true  // optional (or header "Prefer: respond-async"), run as a background job
     }
+    
+    In job mode the response is HTTP 202 with {"job_id", "status", "status_url", "events_url"}.
+    Poll status_url (GET /api/llm/jobs/<job_id>) until status is "succeeded" and read "result",
+    or subscribe to events_url (Server-Sent Events) for the completion event.
     """
     try:
         data = request.json
@@ -147,9 +384,35 @@ def generate_related_content():
         
         question = data['question']
         answer = data['answer']
+        generation_args = get_related_content_args()
+        related_key = get_related_content_key(question, answer, generation_args)
+        
+        if data.get('async') or 'respond-async' in request.headers.get('Prefer', ''):
+            # 提交后台任务，立即返回任务ID（/ask 已预取时直接返回预取任务）
+            try:
+                job = job_manager.submit(
+                    'related_content', build_related_content, question, answer,
+                    owner=get_client_id(), key=related_key, **generation_args
+                )
+            except RateLimitError as e:
+                return jsonify(e.to_dict()), 429
+            status_url = url_for('llm.get_job', job_id=job.id)
+            return jsonify({
+                **job.to_dict(),
+                'success': True,
+                'status_url': status_url,
+                'events_url': url_for('llm.get_job_events', job_id=job.id)
+            }), 202, {'Location': status_url}
+        
+        # /ask 已经为这个回答预取了相关内容：等待预取任务，不再重复生成
+        prefetched = job_manager.find(related_key, get_client_id())
+        if prefetched is not None:
+            prefetched = job_manager.wait_finished(prefetched.id, RELATED_CONTENT_DEADLINE + DEADLINE_GRACE)
+            if prefetched is not None and prefetched.status == JOB_SUCCEEDED:
+                return jsonify({**prefetched.result, 'prefetched': True})
         
         # 使用AI生成相关内容
-        return generate_ai_related_content(question, answer)
+        return jsonify(build_related_content(question, answer, **generation_args))
     
     except Exception as e:
         return jsonify({
@@ -157,6 +420,141 @@ def generate_related_content():
             'message': 'An error occurred while generating related content'
         }), 500
 
+@llm_bp.route('/generate-related-content/stream', methods=['POST'])
+def generate_related_content_stream():
+    """
+    Streaming variant of /generate-related-content using Server-Sent Events
+    
+    Request body is the same as /generate-related-content. The response is a text/event-stream with events:
+        meta  - {"selected_provider", "model", "selection_reason"}
+        item  - {"key": "knowledge_points" | "experiments", "index", "value"} as soon as each item is complete
+        done  - the validated and enhanced content, same body as /generate-related-content
+                (cached or fallback content arrives as a single done event)
+    Items are the raw model output; clients render them progressively and replace them with the lists in done.
+    """
+    data = request.json
+    
+    if not data or 'question' not in data or 'answer' not in data:
+        return jsonify({
+            'error': 'Missing required parameters: question and answer'
+        }), 400
+    
+    question = data['question']
+    answer = data['answer']
+    generation_args = get_related_content_args()
+    
+    def generate():
+        try:
+            for event in stream_related_content(question, answer, **generation_args):
+                yield format_sse_event(event)
+        except Exception as e:
+            yield format_sse_event({
+                'type': 'error',
+                'error': str(e),
+                'message': 'An error occurred while generating related content'
+            })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@llm_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of a background job; includes "result" once it has succeeded"""
+    job = get_owned_job(job_id)
+    if job is None:
+        return jsonify({
+            'error': 'Job not found or expired'
+        }), 404
+    return jsonify({**job.to_dict(), 'success': True})
+
+@llm_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    """
+    Follow a background job over Server-Sent Events
+    
+    Events:
+        status - {"job_id", "status", ...} whenever the job is queued or starts running
+        done   - the job including "result" once it has succeeded
+        error  - {"job_id", "status": "failed", "error"} (or job not found)
+    A comment line is sent every LLM_JOB_HEARTBEAT seconds while waiting to keep proxies from closing the stream.
+    """
+    job = get_owned_job(job_id)
+    if job is None:
+        return jsonify({
+            'error': 'Job not found or expired'
+        }), 404
+    
+    heartbeat = float(os.getenv('LLM_JOB_HEARTBEAT', '15'))
+    
+    def generate():
+        known_status = None
+        while True:
+            current = job_manager.wait(job_id, heartbeat, known_status)
+            if current is None:
+                yield format_sse_event({'type': 'error', 'job_id': job_id, 'error': 'Job not found or expired'})
+                return
+            if current.status == known_status:
+                yield ": keep-alive\n\n"
+                continue
+            known_status = current.status
+            if current.status == JOB_SUCCEEDED:
+                yield format_sse_event({'type': 'done', **current.to_dict()})
+                return
+            if current.status == JOB_FAILED:
+                yield format_sse_event({'type': 'error', **current.to_dict()})
+                return
+            yield format_sse_event({'type': 'status', **current.to_dict(include_result=False)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def get_owned_job(job_id):
+    """Job submitted by the current client, or None (jobs of other users are reported as not found)"""
+    job = job_manager.get(job_id)
+    if job is None or job.owner != get_client_id():
+        return None
+    return job
+
+def should_prefetch_related(data):
+    """Whether /ask should start related-content generation right after answering ("prefetch_related", default LLM_RELATED_PREFETCH)"""
+    if data.get('prefetch_related') is not None:
+        return bool(data['prefetch_related'])
+    return os.getenv('LLM_RELATED_PREFETCH', 'false').lower() in ('1', 'true', 'yes')
+
+def prefetch_related_content(question, answer, data=None):
+    """
+    Speculatively start related-content generation for a fresh answer as a background job.
+    The job is keyed like ContentCache, so the page's follow-up /generate-related-content request
+    for the same (question, answer) attaches to it or hits the cache entry it fills.
+    Best effort: returns None when the job queue is full.
+    """
+    generation_args = get_related_content_args()
+    try:
+        return job_manager.submit(
+            'related_content', build_related_content, question, answer,
+            owner=get_client_id(), key=get_related_content_key(question, answer, generation_args),
+            **generation_args
+        )
+    except RateLimitError as e:
+        print(f"Related content prefetch skipped: {e}")
+        return None
+
+def get_related_content_key(question, answer, generation_args):
+    """Deduplication key of a related-content job: the ContentCache key of its result"""
+    return content_cache.get_cache_key(question, answer, generation_args['user_id'])
+
 @llm_bp.route('/project-assistant', methods=['POST'])
 def project_assistant():
     """
@@ -288,37 +686,142 @@ def generate_experiment():
             'message': 'An error occurred while generating experiment'
         }), 500
 
-def generate_ai_related_content(question, answer):
-    """使用AI生成相关知识点、实验和仿真内容 - 集成所有优化功能"""
-    import asyncio
+def get_related_content_args():
+    """相关内容生成依赖的请求信息：用户、问答所用的提供商和调度身份（后台任务执行时请求已结束，需提前取出）"""
+    return {
+        'user_id': session.get('user_id', 1),
+        'provider': session.get('last_used_provider', 'gemini'),
+        'model': session.get('last_used_model', 'gemini-1.5-flash'),
+        'identity': get_request_identity()
+    }
+
+def build_related_content(question, answer, user_id=1, provider='gemini', model='gemini-1.5-flash', identity=None):
+    """使用AI生成相关知识点、实验和仿真内容 - 集成所有优化功能，返回内容字典（不依赖请求上下文，可在后台任务中执行）"""
     
-    # 记录开始时间
+    # 记录开始时间，整个生成过程（含备用服务）不超过截止时间
     start_time = datetime.now()
-    user_id = session.get('user_id', 1)
+    deadline = Deadline(RELATED_CONTENT_DEADLINE)
     
     try:
         # 1. 检查缓存
-        cached_content = content_cache.get_cached_content(question, answer, user_id)
+        cached_content = get_cached_related_content(question, answer, user_id, start_time)
         if cached_content:
-            performance_monitor.log_generation_time(
-                start_time, datetime.now(), 'cache', True, 
-                cached_content.get('quality_score', 0)
-            )
-            return jsonify({
-                **cached_content,
-                'success': True,
-                'generated_by': 'cache'
-            })
+            return cached_content
         
-        # 2. 获取用户个性化上下文
-        personalized_context = user_profile_manager.get_personalized_context(user_id)
+        # 2. 构建增强的AI提示词
+        content_prompt, domain = build_related_content_prompt(question, answer, user_id)
         
-        # 3. 分析学科领域
-        subject_analysis = analyze_subject_domain(question, answer)
-        domain = subject_analysis['domain']
+        # 3. 使用AI生成内容
+        response = run_async(llm_manager.generate_response(
+            prompt=content_prompt,
+            provider=provider,  # 使用与问答相同的提供商（保持一致性）
+            model=model,
+            temperature=0.7,
+            max_tokens=2000,
+            deadline=deadline,
+            priority=PRIORITY_BACKGROUND,
+            **(identity or {})
+        ), timeout=deadline.remaining() + DEADLINE_GRACE)
         
-        # 4. 构建增强的AI提示词
-        content_prompt = f"""
+        # 记录使用的提供商
+        used_provider = response.get('selected_provider', provider)
+        
+        if 'error' in response:
+            # 记录失败
+            performance_monitor.log_generation_time(
+                start_time, datetime.now(), used_provider, False, 0
+            )
+            # 如果AI生成失败，使用备用方案
+            return generate_fallback_content(question, answer)
+        
+        # 4. 解析、校验、增强并缓存（截断时知识点和实验只保留完整的元素）
+        parsed_content, complete = parse_llm_json(response['content'], RELATED_CONTENT_ITEM_KEYS)
+        return finish_related_content(parsed_content, complete, question, answer, user_id, domain, used_provider, start_time)
+    
+    except Exception as e:
+        print(f"AI content generation error: {e}")
+        # 记录异常
+        performance_monitor.log_generation_time(
+            start_time, datetime.now(), 'unknown', False, 0
+        )
+        return generate_fallback_content(question, answer)
+
+def stream_related_content(question, answer, user_id=1, provider='gemini', model='gemini-1.5-flash', identity=None):
+    """
+    build_related_content 的流式版本：边生成边解析，每个知识点和实验一闭合就产出 item 事件，
+    最后产出 done 事件（校验和增强后的完整内容，与 build_related_content 的返回值相同）。
+    生成中途出错时保留已经生成的完整部分
+    """
+    start_time = datetime.now()
+    deadline = Deadline(RELATED_CONTENT_DEADLINE)
+    
+    cached_content = get_cached_related_content(question, answer, user_id, start_time)
+    if cached_content:
+        yield {'type': 'done', **cached_content}
+        return
+    
+    content_prompt, domain = build_related_content_prompt(question, answer, user_id)
+    parser = IncrementalJSONParser(item_keys=RELATED_CONTENT_ITEM_KEYS)
+    used_provider = provider
+    try:
+        events = async_runtime.iterate(
+            llm_manager.stream_response(
+                prompt=content_prompt,
+                provider=provider,
+                model=model,
+                temperature=0.7,
+                max_tokens=2000,
+                deadline=deadline,
+                priority=PRIORITY_BACKGROUND,
+                **(identity or {})
+            ),
+            max_buffer=int(os.getenv('LLM_STREAM_BUFFER', '64')),
+            timeout=float(os.getenv('LLM_STREAM_IDLE_TIMEOUT', '120'))
+        )
+        for event in events:
+            if event.get('type') == 'meta':
+                used_provider = event.get('selected_provider', provider)
+                yield event
+            elif event.get('type') == 'delta' and event.get('content'):
+                for parsed in parser.feed(event['content']):
+                    if parsed['type'] == EVENT_ITEM:
+                        yield parsed
+            elif event.get('type') == 'error':
+                print(f"AI content streaming error: {event.get('error')}")
+    except Exception as e:
+        print(f"AI content streaming error: {e}")
+    
+    # 使用增量解析的结果（截断时在元素边界处截断，与已产出的 item 事件一致）
+    parsed_content, complete = parser.result(), parser.complete
+    if parsed_content is None:
+        parsed_content, complete = parse_llm_json(parser.text, RELATED_CONTENT_ITEM_KEYS)
+    yield {'type': 'done', **finish_related_content(parsed_content, complete, question, answer, user_id, domain, used_provider, start_time)}
+
+def get_cached_related_content(question, answer, user_id, start_time):
+    """缓存中的相关内容，未命中返回 None"""
+    cached_content = content_cache.get_cached_content(question, answer, user_id)
+    if not cached_content:
+        return None
+    performance_monitor.log_generation_time(
+        start_time, datetime.now(), 'cache', True, 
+        cached_content.get('quality_score', 0)
+    )
+    return {
+        **cached_content,
+        'success': True,
+        'generated_by': 'cache'
+    }
+
+def build_related_content_prompt(question, answer, user_id):
+    """相关内容生成的提示词和学科领域"""
+    # 获取用户个性化上下文
+    personalized_context = user_profile_manager.get_personalized_context(user_id)
+    
+    # 分析学科领域
+    subject_analysis = analyze_subject_domain(question, answer)
+    domain = subject_analysis['domain']
+    
+    content_prompt = f"""
 基于以下问题和回答，请生成相关的学习内容：
 
 问题：{question}
@@ -387,106 +890,68 @@ def generate_ai_related_content(question, answer):
 10. 只返回JSON格式，不要其他文字
 """
 
-        # 5. 获取与问答相同的提供商（保持一致性）
-        last_provider = session.get('last_used_provider', 'gemini')
-        last_model = session.get('last_used_model', 'gemini-1.5-flash')
-        
-        # 6. 使用AI生成内容
-        response = asyncio.run(llm_manager.generate_response(
-            prompt=content_prompt,
-            provider=last_provider,  # 使用与问答相同的提供商
-            model=last_model,
-            temperature=0.7,
-            max_tokens=2000
-        ))
-        
-        # 记录使用的提供商
-        used_provider = response.get('selected_provider', last_provider)
-        
-        if 'error' in response:
-            # 记录失败
-            performance_monitor.log_generation_time(
-                start_time, datetime.now(), used_provider, False, 0
-            )
-            # 如果AI生成失败，使用备用方案
-            return generate_fallback_content(question, answer)
-        
-        # 7. 尝试解析AI返回的JSON
-        try:
-            import json
-            ai_content = response['content']
-            
-            # 提取JSON部分（去除可能的前后文字）
-            start_idx = ai_content.find('{')
-            end_idx = ai_content.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = ai_content[start_idx:end_idx]
-                parsed_content = json.loads(json_str)
-                
-                # 8. 验证内容质量
-                is_valid, quality_score, issues = quality_validator.validate_content(parsed_content)
-                
-                if not is_valid:
-                    print(f"Content quality validation failed: {issues}")
-                    # 质量不合格，使用备用方案
-                    performance_monitor.log_generation_time(
-                        start_time, datetime.now(), used_provider, False, quality_score
-                    )
-                    return generate_fallback_content(question, answer)
-                
-                # 9. 验证和补充内容
-                validated_content = validate_and_enhance_content(parsed_content, question, answer)
-                
-                # 10. 多媒体内容增强
-                enhanced_content = multimedia_enhancer.enhance_content(validated_content, domain)
-                
-                # 11. 缓存高质量内容
-                if quality_score >= 80:
-                    content_cache.cache_content(
-                        question, answer, enhanced_content, 
-                        used_provider, quality_score, user_id
-                    )
-                
-                # 12. 更新用户画像
-                user_profile_manager.update_user_profile(user_id, question, answer)
-                
-                # 13. 记录性能指标
-                performance_monitor.log_generation_time(
-                    start_time, datetime.now(), used_provider, True, quality_score
-                )
-                
-                # 14. 记录缓存性能
-                cache_stats = content_cache.get_cache_stats()
-                performance_monitor.log_cache_performance(cache_stats)
-                
-                return jsonify({
-                    **enhanced_content,
-                    'success': True,
-                    'generated_by': 'ai_optimized',
-                    'quality_score': quality_score,
-                    'provider_used': used_provider,
-                    'cache_stats': cache_stats
-                })
-            else:
-                raise ValueError("No valid JSON found in AI response")
-                
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"JSON parsing error: {e}")
-            # 记录解析失败
-            performance_monitor.log_generation_time(
-                start_time, datetime.now(), used_provider, False, 0
-            )
-            # JSON解析失败，使用备用方案
-            return generate_fallback_content(question, answer)
+    return content_prompt, domain
+
+def finish_related_content(parsed_content, complete, question, answer, user_id, domain, used_provider, start_time):
+    """
+    校验、增强并缓存解析后的AI内容；不合格时返回备用内容。
+    complete 为 False 表示内容是从截断的输出中恢复的，仍然返回但不缓存
+    """
     
-    except Exception as e:
-        print(f"AI content generation error: {e}")
-        # 记录异常
+    # 1. 检查解析结果
+    if not isinstance(parsed_content, dict):
+        print("JSON parsing error: No valid JSON found in AI response")
+        # 记录解析失败
         performance_monitor.log_generation_time(
-            start_time, datetime.now(), 'unknown', False, 0
+            start_time, datetime.now(), used_provider, False, 0
+        )
+        # JSON解析失败，使用备用方案
+        return generate_fallback_content(question, answer)
+    
+    # 2. 验证内容质量
+    is_valid, quality_score, issues = quality_validator.validate_content(parsed_content)
+    
+    if not is_valid:
+        print(f"Content quality validation failed: {issues}")
+        # 质量不合格，使用备用方案
+        performance_monitor.log_generation_time(
+            start_time, datetime.now(), used_provider, False, quality_score
         )
         return generate_fallback_content(question, answer)
+    
+    # 3. 验证和补充内容
+    validated_content = validate_and_enhance_content(parsed_content, question, answer)
+    
+    # 4. 多媒体内容增强
+    enhanced_content = multimedia_enhancer.enhance_content(validated_content, domain)
+    
+    # 5. 缓存高质量内容（截断恢复的内容不缓存，下次请求重新生成完整内容）
+    if quality_score >= 80 and complete:
+        content_cache.cache_content(
+            question, answer, enhanced_content, 
+            used_provider, quality_score, user_id
+        )
+    
+    # 6. 更新用户画像
+    user_profile_manager.update_user_profile(user_id, question, answer)
+    
+    # 7. 记录性能指标
+    performance_monitor.log_generation_time(
+        start_time, datetime.now(), used_provider, True, quality_score
+    )
+    
+    # 8. 记录缓存性能
+    cache_stats = content_cache.get_cache_stats()
+    performance_monitor.log_cache_performance(cache_stats)
+    
+    return {
+        **enhanced_content,
+        'success': True,
+        'generated_by': 'ai_optimized',
+        'quality_score': quality_score,
+        'provider_used': used_provider,
+        'cache_stats': cache_stats
+    }
 
 def validate_and_enhance_content(content, question, answer):
     """验证和增强AI生成的内容"""
@@ -640,7 +1105,7 @@ def generate_default_simulation(question, answer):
     }
 
 def generate_fallback_content(question, answer):
-    """AI生成失败时的备用内容生成方案"""
+    """AI生成失败时的备用内容生成方案，返回内容字典"""
     
     # 分析问题类型，确定学科领域
     subject_analysis = analyze_subject_domain(question, answer)
@@ -669,47 +1134,17 @@ def generate_fallback_content(question, answer):
 
 def analyze_subject_domain(question, answer):
     """分析问题所属的学科领域"""
-    import re
-    
-    # 关键词映射 - 增加新的学科领域
-    domain_keywords = {
-        'electronics': ['电路', '电阻', '电容', '电感', '二极管', '晶体管', '运放', '运算放大器', '滤波', '放大', '振荡', '数字电路', '模拟电路', '集成电路', 'PCB', '电压', '电流', '功率', '基本电路', '放大器', '反相', '同相', '差分', '运放电路', '电子', '电子学'],
-        'physics': ['力学', '热力学', '电磁学', '光学', '量子', '相对论', '波动', '振动', '能量', '动量', '加速度', '速度', '质量', '重力', '磁场', '电场', '物理', '牛顿', '单摆', '自由落体', '干涉', '衍射'],
-        'mathematics': ['函数', '导数', '积分', '微分', '矩阵', '向量', '概率', '统计', '几何', '代数', '三角', '对数', '指数', '极限', '级数', '方程', '数学', '计算', '求解'],
-        'chemistry': ['化学', '分子', '原子', '离子', '化合物', '反应', '催化', '平衡', '酸碱', '氧化', '还原', '有机', '无机', '聚合物', '滴定', '溶液'],
-        'control': ['控制', 'PID', '反馈', '系统', '传递函数', '稳定性', '响应', '调节', '自动化', '伺服', '闭环', '开环', '控制器', '控制系统'],
-        'computer_science': ['编程', '程序', '算法', '数据结构', '计算机', '软件', '网络', '操作系统', 'CPU', '内存', '数据库', 'Java', 'Python', 'C++', '面向对象', '软件工程', '计算机组成', '编译原理'],
-        'biology': ['生物', '细胞', '基因', 'DNA', 'RNA', '蛋白质', '酶', '代谢', '遗传', '进化', '生态', '微生物', '病毒', '细菌', '生理', '解剖', '分子生物学', '生物化学'],
-        'semiconductor': ['半导体', '集成电路', 'IC', 'VLSI', 'CMOS', 'MOSFET', '晶圆', '光刻', '刻蚀', '离子注入', 'EDA', '版图', '工艺', '制程', '芯片', '硅', '掺杂'],
-        'artificial_intelligence': ['人工智能', 'AI', '机器学习', '深度学习', '神经网络', '卷积', 'CNN', 'RNN', 'Transformer', '自然语言处理', 'NLP', '计算机视觉', '数据挖掘', '模式识别', '强化学习', '监督学习', '无监督学习']
-    }
+    # 关键词表与权重见 services.keyword_engine.KEYWORD_TABLES，问题和回答只扫描一次
+    match = keyword_engine.match(question + ' ' + answer)
     
     # 计算每个领域的匹配度
-    domain_scores = {}
-    text = (question + ' ' + answer).lower()
-    
-    for domain, keywords in domain_keywords.items():
-        score = 0
-        for keyword in keywords:
-            if keyword in text:
-                # 给电子学相关词汇更高的权重
-                if domain == 'electronics' and keyword in ['运放', '运算放大器', '基本电路', '放大器', '电路']:
-                    score += 3  # 高权重
-                elif keyword in ['电路', '电阻', '电容', '电压', '电流']:
-                    score += 2  # 中等权重
-                else:
-                    score += 1  # 基础权重
-        domain_scores[domain] = score
+    domain_scores = match.scores(SUBJECT_DOMAINS)
     
     # 确定主要领域
     main_domain = max(domain_scores, key=domain_scores.get) if max(domain_scores.values()) > 0 else 'general'
     
     # 提取关键概念
-    key_concepts = []
-    for domain, keywords in domain_keywords.items():
-        for keyword in keywords:
-            if keyword in text:
-                key_concepts.append(keyword)
+    key_concepts = match.keywords(SUBJECT_DOMAINS)
     
     # 调试信息
     print(f"Question: {question}")
@@ -786,16 +1221,15 @@ def generate_electronics_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_project_assistant_response(question, project_id, module_name, context):
     """生成项目助手的AI回答"""
-    import asyncio
     
     try:
         # 构建项目助手的提示词
@@ -826,11 +1260,12 @@ def generate_project_assistant_response(question, project_id, module_name, conte
 """
 
         # 使用AI生成回答
-        response = asyncio.run(llm_manager.generate_response(
+        response = run_async(llm_manager.generate_response(
             prompt=assistant_prompt,
             provider=None,  # 使用默认提供商
             temperature=0.7,
-            max_tokens=1500
+            max_tokens=1500,
+            **get_request_identity()
         ))
         
         if 'error' in response:
@@ -856,7 +1291,6 @@ def generate_project_assistant_response(question, project_id, module_name, conte
 
 def generate_project_recommendations(user_skills, difficulty_preference, interests, completed_projects):
     """生成智能项目推荐"""
-    import asyncio
     
     try:
         # 构建项目推荐的提示词
@@ -906,41 +1340,30 @@ def generate_project_recommendations(user_skills, difficulty_preference, interes
 """
 
         # 使用AI生成推荐
-        response = asyncio.run(llm_manager.generate_response(
+        response = run_async(llm_manager.generate_response(
             prompt=recommendation_prompt,
             provider=None,
             temperature=0.8,
-            max_tokens=2000
+            max_tokens=2000,
+            priority=PRIORITY_BACKGROUND,
+            **get_request_identity()
         ))
         
         if 'error' in response:
             # 使用备用推荐算法
             return generate_fallback_recommendations(user_skills, difficulty_preference, interests, completed_projects)
         
-        # 尝试解析AI返回的JSON
-        try:
-            import json
-            ai_content = response['content']
-            
-            # 提取JSON部分
-            start_idx = ai_content.find('{')
-            end_idx = ai_content.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = ai_content[start_idx:end_idx]
-                parsed_content = json.loads(json_str)
-                
-                return jsonify({
-                    **parsed_content,
-                    'success': True,
-                    'generated_by': 'ai'
-                })
-            else:
-                raise ValueError("No valid JSON found in AI response")
-                
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"JSON parsing error: {e}")
+        # 解析AI返回的JSON（容忍代码块、前后文字和截断，截断时只保留完整的推荐项）
+        parsed_content = extract_json(response['content'], item_keys=('recommendations', 'learning_path'))
+        if not isinstance(parsed_content, dict):
+            print("JSON parsing error: No valid JSON found in AI response")
             return generate_fallback_recommendations(user_skills, difficulty_preference, interests, completed_projects)
+        
+        return jsonify({
+            **parsed_content,
+            'success': True,
+            'generated_by': 'ai'
+        })
     
     except Exception as e:
         print(f"Project recommendation error: {e}")
@@ -948,7 +1371,6 @@ def generate_project_recommendations(user_skills, difficulty_preference, interes
 
 def generate_enhanced_qa_response(question, knowledge_point, project_context):
     """生成增强的智能问答回答"""
-    import asyncio
     
     try:
         # 构建增强问答的提示词
@@ -978,11 +1400,12 @@ def generate_enhanced_qa_response(question, knowledge_point, project_context):
 """
 
         # 使用AI生成回答
-        response = asyncio.run(llm_manager.generate_response(
+        response = run_async(llm_manager.generate_response(
             prompt=qa_prompt,
             provider=None,
             temperature=0.7,
-            max_tokens=2000
+            max_tokens=2000,
+            **get_request_identity()
         ))
         
         if 'error' in response:
@@ -1183,12 +1606,12 @@ def generate_computer_science_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_biology_content(question, answer, analysis):
     """生成生物学相关内容"""
@@ -1256,12 +1679,12 @@ def generate_biology_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_semiconductor_content(question, answer, analysis):
     """生成半导体相关内容"""
@@ -1329,12 +1752,12 @@ def generate_semiconductor_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_ai_content(question, answer, analysis):
     """生成人工智能相关内容"""
@@ -1402,12 +1825,12 @@ def generate_ai_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_physics_content(question, answer, analysis):
     """生成物理学相关内容"""
@@ -1472,12 +1895,12 @@ def generate_physics_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_mathematics_content(question, answer, analysis):
     """生成数学相关内容"""
@@ -1510,12 +1933,12 @@ def generate_mathematics_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_chemistry_content(question, answer, analysis):
     """生成化学相关内容"""
@@ -1548,12 +1971,12 @@ def generate_chemistry_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_control_content(question, answer, analysis):
     """生成控制工程相关内容"""
@@ -1586,12 +2009,12 @@ def generate_control_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_general_content(question, answer, analysis):
     """生成通用内容"""
@@ -1651,16 +2074,15 @@ def generate_general_content(question, answer, analysis):
         ]
     }
     
-    return jsonify({
+    return {
         'knowledge_points': knowledge_points,
         'experiments': experiments,
         'simulation': simulation,
         'success': True
-    })
+    }
 
 def generate_experiment_content(question, subject, difficulty):
     """生成实验内容"""
-    import asyncio
     
     try:
         # 构建实验生成的提示词
@@ -1719,41 +2141,30 @@ def generate_experiment_content(question, subject, difficulty):
 """
 
         # 使用AI生成实验内容
-        response = asyncio.run(llm_manager.generate_response(
+        response = run_async(llm_manager.generate_response(
             prompt=experiment_prompt,
             provider=None,
             temperature=0.7,
-            max_tokens=2000
+            max_tokens=2000,
+            priority=PRIORITY_BACKGROUND,
+            **get_request_identity()
         ))
         
         if 'error' in response:
             # 使用备用方案
             return generate_fallback_experiment(question, subject, difficulty)
         
-        # 尝试解析AI返回的JSON
-        try:
-            import json
-            ai_content = response['content']
-            
-            # 提取JSON部分
-            start_idx = ai_content.find('{')
-            end_idx = ai_content.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = ai_content[start_idx:end_idx]
-                parsed_content = json.loads(json_str)
-                
-                return jsonify({
-                    **parsed_content,
-                    'success': True,
-                    'generated_by': 'ai'
-                })
-            else:
-                raise ValueError("No valid JSON found in AI response")
-                
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"JSON parsing error: {e}")
+        # 解析AI返回的JSON（容忍代码块、前后文字和截断）
+        parsed_content = extract_json(response['content'])
+        if not isinstance(parsed_content, dict):
+            print("JSON parsing error: No valid JSON found in AI response")
             return generate_fallback_experiment(question, subject, difficulty)
+        
+        return jsonify({
+            **parsed_content,
+            'success': True,
+            'generated_by': 'ai'
+        })
     
     except Exception as e:
         print(f"Experiment generation error: {e}")
@@ -1843,6 +2254,9 @@ def get_cache_stats():
         cache_stats = content_cache.get_cache_stats()
         return jsonify({
             'cache_stats': cache_stats,
+            'response_cache_stats': response_cache.get_stats(),
+            'semantic_cache_stats': semantic_cache.get_stats(),
+            'single_flight_stats': single_flight.get_stats(),
             'success': True
         })
     except Exception as e:
@@ -1853,9 +2267,11 @@ def get_cache_stats():
 
 @llm_bp.route('/optimization/cache/clear', methods=['POST'])
 def clear_cache():
-    """清空内容缓存"""
+    """清空内容缓存、LLM响应缓存和语义缓存"""
     try:
         content_cache.clear_cache()
+        response_cache.clear()
+        semantic_cache.clear()
         return jsonify({
             'message': 'Cache cleared successfully',
             'success': True
@@ -1969,8 +2385,13 @@ def get_user_ai_settings(user_id):
     # 从session获取用户设置
     return session.get(settings_key, default_settings)
 
-def build_enhanced_prompt(question, user_settings, use_knowledge_base, context, user_id):
-    """构建增强的AI提示词，集成用户设置和知识库"""
+def build_enhanced_prompt(question, user_settings, use_knowledge_base, context, user_id, provider=None):
+    """
+    构建增强的AI提示词，集成用户设置和知识库
+    
+    提示词按目标提供商估算 token 数并控制在预算内：回答要求和问题完整保留，
+    超出预算时先截断上下文信息，再截断知识库内容。返回 BudgetedPrompt
+    """
     
     # 基础提示词
     prompt_parts = []
@@ -1984,35 +2405,38 @@ def build_enhanced_prompt(question, user_settings, use_knowledge_base, context,
         'casual': '请使用友好、轻松的对话风格回答。'
     }
     
-    prompt_parts.append(style_instructions.get(ai_style, style_instructions['detailed']))
+    prompt_parts.append(PromptSection('style', style_instructions.get(ai_style, style_instructions['detailed'])))
     
-    # 添加知识库上下文
+    # 添加知识库上下文（文档已按相关性排序，截断时保留开头）
     if use_knowledge_base:
         knowledge_context = get_knowledge_base_context(question, user_id, user_settings)
         if knowledge_context:
-            prompt_parts.append(f"\n基于用户的个人知识库内容：\n{knowledge_context}")
+            prompt_parts.append(PromptSection('knowledge_base', knowledge_context, priority=1,
+                                              header="\n基于用户的个人知识库内容：\n"))
     
-    # 添加额外上下文
+    # 添加额外上下文（优先级最低，截断时保留首尾）
     if context:
-        prompt_parts.append(f"\n上下文信息：{context}")
+        prompt_parts.append(PromptSection('context', str(context), priority=2, header="\n上下文信息：", keep_tail=True))
     
     # 添加用户偏好设置
     if user_settings.get('ai_preferences', {}).get('include_sources'):
-        prompt_parts.append("\n请在回答中明确标注信息来源。")
+        prompt_parts.append(PromptSection('include_sources', "\n请在回答中明确标注信息来源。"))
     
     if user_settings.get('ai_preferences', {}).get('explain_reasoning'):
-        prompt_parts.append("\n请解释你的推理过程和逻辑。")
+        prompt_parts.append(PromptSection('explain_reasoning', "\n请解释你的推理过程和逻辑。"))
     
     # 构建完整提示词
-    full_prompt = f"""
-{' '.join(prompt_parts)}
+    def assemble(parts):
+        full_prompt = f"""
+{' '.join(parts)}
 
 用户问题：{question}
 
 请根据上述要求回答用户的问题。使用中文回答。
 """
+        return full_prompt.strip()
     
-    return full_prompt.strip()
+    return prompt_budgeter.build(prompt_parts, assemble, provider=provider)
 
 def get_knowledge_base_context(question, user_id, user_settings):
     """从用户的个人知识库获取相关上下文"""
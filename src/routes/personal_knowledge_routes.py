@@ -12,6 +12,8 @@ import hashlib
 import uuid
 from models.user import db, User
 from models.llm_models import llm_manager
+from services.async_runtime import run_async
+from utils.request_context import get_request_identity
 import PyPDF2
 import docx
 import pdfplumber
@@ -463,10 +465,10 @@ def chat_with_knowledge():
 你是用户的个人AI助手。虽然用户的知识库中暂时没有与此问题直接相关的文档，但请基于你的知识为用户提供有用的回答。建议用户上传相关文档以获得更个性化的帮助。"""
         
         # 调用AI模型
-        import asyncio
-        response = asyncio.run(llm_manager.generate_response(
+        response = run_async(llm_manager.generate_response(
             prompt=full_prompt,
-            provider=None  # 自动选择
+            provider=None,  # 自动选择
+            **get_request_identity()
         ))
         
         if response.get('content'):
@@ -5,7 +5,10 @@ Project-based Learning Routes
 
 from flask import Blueprint, request, jsonify, session
 from models.llm_models import llm_manager
-import json
+from services.async_runtime import run_async
+from services.llm_scheduler import PRIORITY_BACKGROUND
+from services.json_stream import extract_json
+from utils.request_context import get_request_identity
 import logging
 from datetime import datetime
 
@@ -71,8 +74,7 @@ def recommend_projects():
 """
 
         # 调用LLM生成推荐
-        import asyncio
-        response = asyncio.run(llm_manager.generate_response(prompt))
+        response = run_async(llm_manager.generate_response(prompt, priority=PRIORITY_BACKGROUND, **get_request_identity()))
         
         # 检查响应格式
         if isinstance(response, dict) and 'content' in response:
@@ -80,14 +82,14 @@ def recommend_projects():
         else:
             response_content = str(response)
         
-        try:
-            # 尝试解析JSON响应
-            recommendation_data = json.loads(response_content)
+        # 解析JSON响应（容忍代码块、前后文字和截断，截断时只保留完整的推荐项）
+        recommendation_data = extract_json(response_content, item_keys=('recommendations',))
+        if isinstance(recommendation_data, dict):
             return jsonify(recommendation_data)
-        except json.JSONDecodeError:
-            # 如果无法解析JSON，返回备用推荐
-            logger.warning("无法解析AI推荐响应，使用备用推荐")
-            return jsonify(get_fallback_recommendations(interests, difficulty_preference))
+        
+        # 如果无法解析JSON，返回备用推荐
+        logger.warning("无法解析AI推荐响应，使用备用推荐")
+        return jsonify(get_fallback_recommendations(interests, difficulty_preference))
             
     except Exception as e:
         logger.error(f"项目推荐错误: {e}")
@@ -180,8 +182,7 @@ def get_code_help():
 """
 
         # 调用LLM生成帮助
-        import asyncio
-        response = asyncio.run(llm_manager.generate_response(prompt))
+        response = run_async(llm_manager.generate_response(prompt, **get_request_identity()))
         
         # 检查响应格式
         if isinstance(response, dict) and 'content' in response:
@@ -230,8 +231,7 @@ def generate_code():
 """
 
         # 调用LLM生成代码
-        import asyncio
-        response = asyncio.run(llm_manager.generate_response(prompt))
+        response = run_async(llm_manager.generate_response(prompt, **get_request_identity()))
         
         # 检查响应格式
         if isinstance(response, dict) and 'content' in response:
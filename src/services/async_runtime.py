@@ -0,0 +1,288 @@
+"""
+异步运行时服务
+每个工作进程维护一个长期运行的事件循环，同步Flask视图通过线程安全的桥接提交协程，
+连接池、后台任务等异步资源可以跨请求存活
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import os
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 运行模式：loop = 长期事件循环（默认），per_request = 每次调用 asyncio.run（兼容回退）
+ASYNC_MODE_LOOP = 'loop'
+ASYNC_MODE_PER_REQUEST = 'per_request'
+
+# iterate() 队列中的消息类型
+_ITEM = 'item'
+_ERROR = 'error'
+_END = 'end'
+
+
+class AsyncRuntime:
+    """进程级长期事件循环
+
+    事件循环运行在独立的守护线程中，在首次使用时惰性启动；
+    检测到 fork（进程号变化）后会在子进程中重新创建，适配 gunicorn 等多进程部署。
+    """
+
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = (mode or os.getenv('LLM_ASYNC_MODE', ASYNC_MODE_LOOP)).lower()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._shutdown_hooks: List[Callable[[], Awaitable[Any]]] = []
+        self._fallback_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        atexit.register(self.shutdown)
+
+    @property
+    def enabled(self) -> bool:
+        """是否使用长期事件循环"""
+        return self.mode == ASYNC_MODE_LOOP
+
+    def configure(self, mode: Optional[str] = None) -> None:
+        """配置运行模式"""
+        if mode:
+            mode = mode.lower()
+            if mode not in (ASYNC_MODE_LOOP, ASYNC_MODE_PER_REQUEST):
+                raise ValueError(f"Unknown async mode '{mode}'")
+            self.mode = mode
+        logger.info(f"Async runtime mode: {self.mode}")
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """获取（必要时启动）本进程的事件循环"""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._loop.is_running():
+                self._start()
+            return self._loop
+
+    def _start(self) -> None:
+        """在守护线程中启动事件循环"""
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=run_loop, name='alethea-async-runtime', daemon=True)
+        thread.start()
+        started.wait()
+
+        self._loop = loop
+        self._thread = thread
+        self._pid = os.getpid()
+        logger.info(f"Async runtime event loop started in process {self._pid}")
+
+    def in_runtime_thread(self) -> bool:
+        """当前线程是否就是事件循环线程"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """将协程提交到事件循环，立即返回 concurrent.futures.Future
+
+        协程在调用方的 contextvars 上下文中运行，因此 Flask 的 request/session
+        等上下文变量在协程中同样可用。
+        """
+        if not self.enabled:
+            if self._fallback_executor is None:
+                self._fallback_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=8, thread_name_prefix='alethea-async-fallback'
+                )
+            ctx = contextvars.copy_context()
+            return self._fallback_executor.submit(ctx.run, asyncio.run, coro)
+
+        loop = self.get_loop()
+        ctx = contextvars.copy_context()
+        result: concurrent.futures.Future = concurrent.futures.Future()
+
+        # result 保持 PENDING 直到任务结束：concurrent.futures.Future 进入 RUNNING 后
+        # cancel() 不再生效，取消就无法传递到事件循环上的任务
+        def on_done(task: asyncio.Task):
+            if result.cancelled():
+                return
+            try:
+                if task.cancelled():
+                    result.cancel()
+                elif task.exception() is not None:
+                    result.set_exception(task.exception())
+                else:
+                    result.set_result(task.result())
+            except concurrent.futures.InvalidStateError:
+                pass
+
+        def schedule():
+            if result.cancelled():
+                coro.close()
+                return
+            task = ctx.run(loop.create_task, coro)
+            task.add_done_callback(on_done)
+            result.add_done_callback(
+                lambda f: f.cancelled() and loop.call_soon_threadsafe(task.cancel)
+            )
+
+        loop.call_soon_threadsafe(schedule)
+        return result
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """在事件循环上运行协程并阻塞等待结果（供同步视图使用）"""
+        if not self.enabled:
+            if timeout is not None:
+                coro = asyncio.wait_for(coro, timeout)
+            return asyncio.run(coro)
+        if self.in_runtime_thread():
+            coro.close()
+            raise RuntimeError("AsyncRuntime.run() cannot be called from the runtime loop thread")
+
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def iterate(self, agen: AsyncIterator[Any], max_buffer: int = 64,
+                timeout: Optional[float] = None) -> Iterator[Any]:
+        """把异步生成器桥接为同步迭代器（供流式响应使用）
+
+        生产者在事件循环上运行，通过容量为 max_buffer 的队列向调用线程传递数据；
+        消费较慢时生产者会在队列满处等待，内存占用有上界。timeout 为等待单个元素的最长时间。
+        同步迭代器被关闭（如客户端断开）时取消生产者。
+        """
+        if not self.enabled:
+            yield from self._iterate_private_loop(agen, timeout)
+            return
+        if self.in_runtime_thread():
+            raise RuntimeError("AsyncRuntime.iterate() cannot be called from the runtime loop thread")
+
+        queue = self.run(self._make_queue(max_buffer))
+
+        async def pump():
+            try:
+                async for item in agen:
+                    await queue.put((_ITEM, item))
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                await queue.put((_ERROR, e))
+            else:
+                await queue.put((_END, None))
+            finally:
+                await agen.aclose()
+
+        producer = self.submit(pump())
+        try:
+            while True:
+                kind, value = self.run(queue.get(), timeout)
+                if kind is _END:
+                    return
+                if kind is _ERROR:
+                    raise value
+                yield value
+        finally:
+            producer.cancel()
+
+    @staticmethod
+    def _iterate_private_loop(agen: AsyncIterator[Any], timeout: Optional[float]) -> Iterator[Any]:
+        """per_request 模式下在私有事件循环上逐个驱动异步生成器"""
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                try:
+                    item = loop.run_until_complete(asyncio.wait_for(agen.__anext__(), timeout))
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            loop.run_until_complete(agen.aclose())
+            loop.close()
+
+    @staticmethod
+    async def _make_queue(max_buffer: int) -> asyncio.Queue:
+        # 队列需在事件循环线程上创建（Python 3.9 及以下会绑定当前循环）
+        return asyncio.Queue(maxsize=max(1, max_buffer))
+
+    def async_to_sync(self, func: Callable[..., Coroutine]) -> Callable[..., Any]:
+        """把 async 视图函数包装为同步函数，在长期事件循环上执行
+
+        可作为 Flask 的 app.async_to_sync 使用，使 async def 视图以原生协程方式运行。
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+        return wrapper
+
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable[Any]]) -> None:
+        """注册进程退出时在事件循环上执行的清理协程"""
+        self._shutdown_hooks.append(hook)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """执行清理钩子并停止事件循环"""
+        loop = self._loop
+        if loop is None or self._pid != os.getpid() or not loop.is_running():
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_pending(), loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Failed to cancel pending tasks: {str(e)}")
+
+        for hook in self._shutdown_hooks:
+            try:
+                asyncio.run_coroutine_threadsafe(hook(), loop).result(timeout)
+            except Exception as e:
+                logger.warning(f"Async runtime shutdown hook failed: {str(e)}")
+
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._loop = None
+        logger.info("Async runtime event loop stopped")
+
+    def get_stats(self) -> dict:
+        """获取运行时状态"""
+        loop = self._loop
+        running = loop is not None and loop.is_running() and self._pid == os.getpid()
+        pending = 0
+        if running:
+            try:
+                pending = asyncio.run_coroutine_threadsafe(self._count_tasks(), loop).result(1.0)
+            except Exception:
+                pending = -1
+        return {
+            'mode': self.mode,
+            'running': running,
+            'pid': self._pid,
+            'pending_tasks': pending
+        }
+
+    @staticmethod
+    async def _count_tasks() -> int:
+        return len(asyncio.all_tasks()) - 1
+
+    @staticmethod
+    async def _cancel_pending() -> None:
+        """取消循环上除自身外的所有任务"""
+        current = asyncio.current_task()
+        pending = [task for task in asyncio.all_tasks() if task is not current]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+# 全局实例
+async_runtime = AsyncRuntime()
+
+
+def run_async(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """在进程级事件循环上运行协程并返回结果（替代每个请求的 asyncio.run）"""
+    return async_runtime.run(coro, timeout)
@@ -0,0 +1,201 @@
+"""
+LLM提供商熔断器
+按提供商统计最近调用的失败率和慢调用率，超过阈值时熔断（OPEN），
+冷却期内直接跳过该提供商；冷却结束后进入半开（HALF_OPEN）状态放行少量试探请求，
+试探全部成功则恢复（CLOSED），任一失败则重新熔断
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, fields, replace
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+@dataclass
+class CircuitBreakerSettings:
+    """熔断器配置"""
+    window_size: int = 20                 # 统计最近多少次调用
+    min_calls: int = 5                    # 窗口内至少多少次调用才计算比率
+    failure_rate_threshold: float = 0.5   # 失败率阈值
+    slow_call_seconds: float = 20.0       # 超过该耗时视为慢调用
+    slow_call_rate_threshold: float = 0.8 # 慢调用率阈值
+    open_cooldown: float = 30.0           # 熔断后的冷却时间（秒）
+    half_open_max_calls: int = 1          # 半开状态允许的试探请求数
+
+    @classmethod
+    def from_env(cls) -> 'CircuitBreakerSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            window_size=int(os.getenv('LLM_CB_WINDOW', '20')),
+            min_calls=int(os.getenv('LLM_CB_MIN_CALLS', '5')),
+            failure_rate_threshold=float(os.getenv('LLM_CB_FAILURE_RATE', '0.5')),
+            slow_call_seconds=float(os.getenv('LLM_CB_SLOW_CALL_SECONDS', '20')),
+            slow_call_rate_threshold=float(os.getenv('LLM_CB_SLOW_CALL_RATE', '0.8')),
+            open_cooldown=float(os.getenv('LLM_CB_COOLDOWN', '30')),
+            half_open_max_calls=int(os.getenv('LLM_CB_HALF_OPEN_CALLS', '1'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'CircuitBreakerSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+class CircuitBreaker:
+    """单个提供商的熔断器（线程安全）"""
+
+    def __init__(self, name: str, settings: CircuitBreakerSettings):
+        self.name = name
+        self.settings = settings
+        self.state = STATE_CLOSED
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=settings.window_size)  # (failed, slow)
+        self._opened_at = 0.0
+        self._trials_in_flight = 0
+        self._trial_successes = 0
+        self._lock = threading.Lock()
+        self.open_count = 0
+        self.rejected_count = 0
+        self.last_error: Optional[str] = None
+
+    def is_open(self) -> bool:
+        """是否处于熔断冷却期（只读判断，不占用试探名额）"""
+        return self.state == STATE_OPEN and time.monotonic() - self._opened_at < self.settings.open_cooldown
+
+    def allow_request(self) -> bool:
+        """是否放行一次调用；半开状态下会占用一个试探名额，调用结束后必须 record_* 或 release"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self._opened_at < self.settings.open_cooldown:
+                    self.rejected_count += 1
+                    return False
+                self._transition(STATE_HALF_OPEN)
+            if self._trials_in_flight + self._trial_successes >= self.settings.half_open_max_calls:
+                self.rejected_count += 1
+                return False
+            self._trials_in_flight += 1
+            return True
+
+    def record_success(self, duration: float) -> None:
+        """记录一次成功调用及其耗时（秒）"""
+        self._record(False, duration, None)
+
+    def record_failure(self, duration: float, error: Optional[str] = None) -> None:
+        """记录一次失败调用"""
+        self._record(True, duration, error)
+
+    def release(self) -> None:
+        """调用被取消、未产生结果时归还试探名额"""
+        with self._lock:
+            if self.state == STATE_HALF_OPEN and self._trials_in_flight > 0:
+                self._trials_in_flight -= 1
+
+    def _record(self, failed: bool, duration: float, error: Optional[str]) -> None:
+        slow = duration >= self.settings.slow_call_seconds
+        with self._lock:
+            if failed:
+                self.last_error = error
+            if self.state == STATE_HALF_OPEN:
+                self._trials_in_flight = max(0, self._trials_in_flight - 1)
+                if failed or slow:
+                    self._transition(STATE_OPEN)
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.settings.half_open_max_calls:
+                        self._transition(STATE_CLOSED)
+                return
+            if self.state == STATE_OPEN:
+                # 熔断前已发出的调用迟到的结果，不影响状态
+                return
+
+            self._outcomes.append((failed, slow))
+            total = len(self._outcomes)
+            if total < self.settings.min_calls:
+                return
+            failure_rate = sum(1 for f, _ in self._outcomes if f) / total
+            slow_rate = sum(1 for _, s in self._outcomes if s) / total
+            if failure_rate >= self.settings.failure_rate_threshold or slow_rate >= self.settings.slow_call_rate_threshold:
+                logger.warning(
+                    f"Circuit for {self.name} opened (failure_rate={failure_rate:.0%}, slow_rate={slow_rate:.0%})"
+                )
+                self._transition(STATE_OPEN)
+
+    def _transition(self, state: str) -> None:
+        """切换状态（调用方持有锁）"""
+        if state == STATE_OPEN:
+            self._opened_at = time.monotonic()
+            self.open_count += 1
+        if state in (STATE_OPEN, STATE_CLOSED):
+            self._outcomes.clear()
+        self._trials_in_flight = 0
+        self._trial_successes = 0
+        if state != self.state:
+            logger.info(f"Circuit for {self.name}: {self.state} -> {state}")
+        self.state = state
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            total = len(self._outcomes)
+            return {
+                'state': self.state,
+                'calls_in_window': total,
+                'failure_rate': round(sum(1 for f, _ in self._outcomes if f) / total, 3) if total else 0.0,
+                'slow_call_rate': round(sum(1 for _, s in self._outcomes if s) / total, 3) if total else 0.0,
+                'open_count': self.open_count,
+                'rejected_count': self.rejected_count,
+                'cooldown_remaining': round(max(0.0, self.settings.open_cooldown - (time.monotonic() - self._opened_at)), 1)
+                if self.state == STATE_OPEN else 0.0,
+                'last_error': self.last_error
+            }
+
+
+class CircuitBreakerRegistry:
+    """按提供商管理熔断器"""
+
+    def __init__(self, settings: Optional[CircuitBreakerSettings] = None):
+        self.default_settings = settings or CircuitBreakerSettings.from_env()
+        self.provider_settings: Dict[str, CircuitBreakerSettings] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, defaults: Optional[Dict[str, Any]] = None,
+                  overrides: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """配置默认参数以及按提供商的覆盖参数（已创建的熔断器会被重建）"""
+        with self._lock:
+            self.default_settings = self.default_settings.merged(defaults)
+            for provider, provider_overrides in (overrides or {}).items():
+                self.provider_settings[provider] = self.default_settings.merged(provider_overrides)
+            self._breakers.clear()
+        logger.info(f"Circuit breakers configured: {self.default_settings}")
+
+    def get(self, provider: str) -> CircuitBreaker:
+        """获取提供商的熔断器，不存在时创建"""
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(provider)
+                if breaker is None:
+                    settings = self.provider_settings.get(provider, self.default_settings)
+                    breaker = CircuitBreaker(provider, settings)
+                    self._breakers[provider] = breaker
+        return breaker
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有熔断器状态"""
+        return {name: breaker.to_dict() for name, breaker in list(self._breakers.items())}
+
+
+# 全局实例
+circuit_breakers = CircuitBreakerRegistry()
@@ -8,11 +8,15 @@ import json
 import hashlib
 import logging
 import asyncio
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields, replace
 import requests
 
+from services.keyword_engine import keyword_engine, USER_INTERESTS
+from services.shared_cache import CacheBackend, SharedCacheSettings, create_cache_backend
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -23,6 +27,41 @@ class ContentCacheItem:
     provider: str
     quality_score: float
     user_id: Optional[int] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的字典（写入缓存后端）"""
+        return {
+            'content': self.content,
+            'timestamp': self.timestamp.isoformat(),
+            'provider': self.provider,
+            'quality_score': self.quality_score,
+            'user_id': self.user_id
+        }
+
+@dataclass
+class ContentCacheSettings:
+    """内容缓存配置"""
+    ttl_hours: float = 24.0
+    max_entries: int = 1000
+    max_bytes: int = 64 * 1024 * 1024   # 所有缓存项的近似总字节数上限
+    sweep_interval: float = 60.0        # 后台清理过期项的间隔（秒），0 表示不启动后台清理
+
+    @classmethod
+    def from_env(cls) -> 'ContentCacheSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            ttl_hours=float(os.getenv('CONTENT_CACHE_TTL_HOURS', '24')),
+            max_entries=int(os.getenv('CONTENT_CACHE_MAX_ENTRIES', '1000')),
+            max_bytes=int(os.getenv('CONTENT_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            sweep_interval=float(os.getenv('CONTENT_CACHE_SWEEP_INTERVAL', '60'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'ContentCacheSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
 
 @dataclass
 class UserProfile:
@@ -33,16 +72,74 @@ class UserProfile:
     preferred_difficulty: str
     question_history: List[str]
     last_updated: datetime
+    interest_scores: Dict[str, int] = field(default_factory=dict)  # 问题历史中各兴趣领域关键词命中次数
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可序列化的字典（写入缓存后端）"""
+        return {
+            'user_id': self.user_id,
+            'interests': self.interests,
+            'knowledge_level': self.knowledge_level,
+            'preferred_difficulty': self.preferred_difficulty,
+            'question_history': self.question_history,
+            'last_updated': self.last_updated.isoformat(),
+            'interest_scores': self.interest_scores
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'UserProfile':
+        return cls(
+            user_id=data['user_id'],
+            interests=list(data['interests']),
+            knowledge_level=data['knowledge_level'],
+            preferred_difficulty=data['preferred_difficulty'],
+            question_history=list(data['question_history']),
+            last_updated=datetime.fromisoformat(data['last_updated']),
+            interest_scores=dict(data.get('interest_scores') or {})
+        )
 
 class ContentCache:
-    """智能内容缓存系统"""
-    
-    def __init__(self, cache_duration_hours: int = 24):
-        self.cache = {}
-        self.cache_duration = timedelta(hours=cache_duration_hours)
-        self.max_cache_size = 1000
-        self.hit_count = 0
-        self.miss_count = 0
+    """
+    智能内容缓存系统（线程安全）
+    
+    缓存项保存在可替换的后端中（见 services.shared_cache）：默认为进程内 LRU/TTL 缓存，
+    配置为 SQLite 或 Redis 时多个工作进程共享同一份缓存和命中统计；
+    同时限制条目数和近似字节数，后台线程定期清理过期项
+    """
+    
+    def __init__(self, cache_duration_hours: Optional[float] = None, settings: Optional[ContentCacheSettings] = None,
+                 backend: Optional[CacheBackend] = None):
+        self.settings = settings or ContentCacheSettings.from_env()
+        if cache_duration_hours is not None:
+            self.settings = self.settings.merged({'ttl_hours': cache_duration_hours})
+        self.backend = backend or create_cache_backend(
+            'content', SharedCacheSettings.from_env(), self.settings.max_entries, self.settings.max_bytes
+        )
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_pid: Optional[int] = None
+        self._stop_sweeper = threading.Event()
+    
+    @property
+    def cache_duration(self) -> timedelta:
+        return timedelta(hours=self.settings.ttl_hours)
+    
+    @property
+    def max_cache_size(self) -> int:
+        return self.settings.max_entries
+    
+    def configure(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        """更新配置，超出新上限的缓存项立即淘汰"""
+        self.settings = self.settings.merged(overrides)
+        self.backend.set_limits(self.settings.max_entries, self.settings.max_bytes)
+        logger.info(f"Content cache configured: {self.settings}")
+    
+    def use_backend(self, backend: CacheBackend) -> None:
+        """切换缓存后端（旧后端中的缓存项不迁移）"""
+        old_backend, self.backend = self.backend, backend
+        if old_backend is not backend:
+            old_backend.close()
+        logger.info(f"Content cache using {backend.name} backend")
     
     def get_cache_key(self, question: str, answer: str, user_id: Optional[int] = None) -> str:
         """生成缓存键"""
@@ -55,20 +152,12 @@ class ContentCache:
         """获取缓存内容"""
         key = self.get_cache_key(question, answer, user_id)
         
-        if key in self.cache:
-            cached_item = self.cache[key]
-            
-            # 检查缓存是否过期
-            if datetime.now() - cached_item.timestamp < self.cache_duration:
-                self.hit_count += 1
-                logger.info(f"Cache hit for key: {key[:8]}...")
-                return cached_item.content
-            else:
-                # 删除过期缓存
-                del self.cache[key]
-                logger.info(f"Cache expired for key: {key[:8]}...")
+        # 后端负责过期检查和命中统计
+        cached_item = self.backend.get(key)
+        if cached_item is not None:
+            logger.info(f"Cache hit for key: {key[:8]}...")
+            return cached_item['content']
         
-        self.miss_count += 1
         logger.info(f"Cache miss for key: {key[:8]}...")
         return None
     
@@ -76,14 +165,7 @@ class ContentCache:
                      provider: str, quality_score: float, user_id: Optional[int] = None):
         """缓存内容"""
         key = self.get_cache_key(question, answer, user_id)
-        
-        # 如果缓存已满，删除最旧的项
-        if len(self.cache) >= self.max_cache_size:
-            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k].timestamp)
-            del self.cache[oldest_key]
-            logger.info(f"Cache full, removed oldest item: {oldest_key[:8]}...")
-        
-        self.cache[key] = ContentCacheItem(
+        item = ContentCacheItem(
             content=content,
             timestamp=datetime.now(),
             provider=provider,
@@ -91,26 +173,68 @@ class ContentCache:
             user_id=user_id
         )
         
+        # 超出条数或字节上限时，后端先清理过期项，再淘汰最久未使用的项
+        if not self.backend.set(key, item.to_dict(), ttl=self.settings.ttl_hours * 3600):
+            logger.info(f"Content not cached for key: {key[:8]}... (too large or backend unavailable)")
+            return
+        
+        self._ensure_sweeper()
         logger.info(f"Cached content for key: {key[:8]}... (quality: {quality_score})")
     
+    def sweep(self) -> int:
+        """清理所有过期项，返回清理的数量"""
+        removed = self.backend.sweep()
+        if removed:
+            logger.info(f"Content cache sweep removed {removed} expired items")
+        return removed
+    
+    def _ensure_sweeper(self) -> None:
+        """启动（fork 后在子进程中重新启动）后台清理线程"""
+        if self.settings.sweep_interval <= 0:
+            return
+        if self._sweeper is not None and self._sweeper_pid == os.getpid() and self._sweeper.is_alive():
+            return
+        with self._lock:
+            if self._sweeper is not None and self._sweeper_pid == os.getpid() and self._sweeper.is_alive():
+                return
+            self._stop_sweeper.clear()
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='alethea-content-cache-sweeper', daemon=True)
+            self._sweeper_pid = os.getpid()
+            self._sweeper.start()
+    
+    def _sweep_loop(self) -> None:
+        while not self._stop_sweeper.wait(max(self.settings.sweep_interval, 1.0)):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Content cache sweep failed: {e}")
+    
+    def stop_sweeper(self) -> None:
+        """停止后台清理线程"""
+        self._stop_sweeper.set()
+    
     def get_cache_stats(self) -> Dict[str, Any]:
-        """获取缓存统计信息"""
-        total_requests = self.hit_count + self.miss_count
-        hit_rate = (self.hit_count / total_requests * 100) if total_requests > 0 else 0
+        """获取缓存统计信息（共享后端时为所有进程的合计）"""
+        stats = self.backend.stats()
+        total_requests = stats['hits'] + stats['misses']
+        hit_rate = (stats['hits'] / total_requests * 100) if total_requests > 0 else 0
         
         return {
-            'cache_size': len(self.cache),
-            'hit_count': self.hit_count,
-            'miss_count': self.miss_count,
+            'cache_size': stats['entries'],
+            'hit_count': stats['hits'],
+            'miss_count': stats['misses'],
             'hit_rate': round(hit_rate, 2),
-            'max_cache_size': self.max_cache_size
+            'max_cache_size': self.settings.max_entries,
+            'cache_bytes': stats['bytes'],
+            'max_cache_bytes': self.settings.max_bytes,
+            'evictions': stats['evictions'],
+            'expired': stats['expired'],
+            'backend': self.backend.name
         }
     
     def clear_cache(self):
         """清空缓存"""
-        self.cache.clear()
-        self.hit_count = 0
-        self.miss_count = 0
+        self.backend.clear()
         logger.info("Cache cleared")
 
 class ContentQualityValidator:
@@ -325,30 +449,47 @@ class ContentQualityValidator:
         except Exception:
             return False
 
+# 所有用户画像的近似总字节数上限（每个画像最多保留 50 个问题）
+_PROFILE_MAX_BYTES = 256 * 1024 * 1024
+
 class UserProfileManager:
-    """用户画像管理器"""
+    """
+    用户画像管理器
     
-    def __init__(self):
-        self.profiles = {}
-        self.interest_keywords = {
-            'electronics': ['电路', '电子', '电压', '电流', '电阻', '电容', '晶体管', '运放'],
-            'physics': ['物理', '力学', '热力学', '光学', '量子', '波动', '能量'],
-            'mathematics': ['数学', '函数', '微积分', '线性代数', '概率', '统计'],
-            'chemistry': ['化学', '分子', '原子', '反应', '催化', '有机', '无机'],
-            'computer_science': ['编程', '算法', '数据结构', '软件', '计算机', '代码'],
-            'biology': ['生物', '细胞', '基因', 'DNA', '蛋白质', '生态', '进化'],
-            'control': ['控制', 'PID', '系统', '反馈', '自动化', '调节'],
-            'ai': ['人工智能', '机器学习', '深度学习', '神经网络', 'AI']
-        }
+    画像保存在缓存后端中（不过期，超出 max_profiles 时淘汰最久未访问的用户），
+    配置为共享后端时各工作进程读写同一份画像
+    """
+    
+    def __init__(self, max_profiles: Optional[int] = None, backend: Optional[CacheBackend] = None):
+        self.max_profiles = max_profiles or int(os.getenv('USER_PROFILE_MAX_ENTRIES', '10000'))
+        self.backend = backend or create_cache_backend(
+            'profiles', SharedCacheSettings.from_env(), self.max_profiles, _PROFILE_MAX_BYTES
+        )
+    
+    def use_backend(self, backend: CacheBackend) -> None:
+        """切换画像后端（旧后端中的画像不迁移）"""
+        old_backend, self.backend = self.backend, backend
+        if old_backend is not backend:
+            old_backend.close()
+        logger.info(f"User profiles using {backend.name} backend")
     
     def get_user_profile(self, user_id: int) -> Optional[UserProfile]:
-        """获取用户画像"""
-        return self.profiles.get(user_id)
+        """获取用户画像（返回副本，修改后需通过 update_user_profile 写回）"""
+        data = self.backend.get(str(user_id))
+        if data is None:
+            return None
+        try:
+            return UserProfile.from_dict(data)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Discarding unreadable profile for user {user_id}: {e}")
+            self.backend.delete(str(user_id))
+            return None
     
     def update_user_profile(self, user_id: int, question: str, answer: str):
-        """更新用户画像"""
-        if user_id not in self.profiles:
-            self.profiles[user_id] = UserProfile(
+        """更新用户画像（读取-修改-写回；同一用户的并发更新以最后写入的为准）"""
+        profile = self.get_user_profile(user_id)
+        if profile is None:
+            profile = UserProfile(
                 user_id=user_id,
                 interests=[],
                 knowledge_level='beginner',
@@ -357,15 +498,16 @@ class UserProfileManager:
                 last_updated=datetime.now()
             )
         
-        profile = self.profiles[user_id]
-        
         # 更新问题历史
         profile.question_history.append(question)
+        self._count_interests(profile.interest_scores, question, 1)
         if len(profile.question_history) > 50:  # 保留最近50个问题
+            for dropped in profile.question_history[:-50]:
+                self._count_interests(profile.interest_scores, dropped, -1)
             profile.question_history = profile.question_history[-50:]
         
-        # 分析兴趣领域
-        interests = self._analyze_interests(profile.question_history)
+        # 分析兴趣领域（增量计数，只扫描新问题）
+        interests = self._analyze_interests(profile.interest_scores)
         profile.interests = interests
         
         # 分析知识水平
@@ -373,24 +515,20 @@ class UserProfileManager:
         
         # 更新时间戳
         profile.last_updated = datetime.now()
+        self.backend.set(str(user_id), profile.to_dict())
         
         logger.info(f"Updated profile for user {user_id}: interests={interests}, level={profile.knowledge_level}")
     
-    def _analyze_interests(self, question_history: List[str]) -> List[str]:
+    def _count_interests(self, interest_scores: Dict[str, int], question: str, sign: int):
+        """把一个问题的兴趣关键词命中数加入（sign=1）或移出（sign=-1）累计得分"""
+        for domain, score in keyword_engine.match(question).scores(USER_INTERESTS).items():
+            interest_scores[domain] = interest_scores.get(domain, 0) + sign * score
+    
+    def _analyze_interests(self, interest_scores: Dict[str, int]) -> List[str]:
         """分析用户兴趣领域"""
-        interest_scores = {}
-        
-        for domain, keywords in self.interest_keywords.items():
-            score = 0
-            for question in question_history:
-                question_lower = question.lower()
-                for keyword in keywords:
-                    if keyword in question_lower:
-                        score += 1
-            interest_scores[domain] = score
-        
-        # 返回得分最高的前3个领域
-        sorted_interests = sorted(interest_scores.items(), key=lambda x: x[1], reverse=True)
+        # 返回得分最高的前3个领域（同分按关键词表顺序）
+        ordered = [(domain, interest_scores.get(domain, 0)) for domain in keyword_engine.labels(USER_INTERESTS)]
+        sorted_interests = sorted(ordered, key=lambda x: x[1], reverse=True)
         return [domain for domain, score in sorted_interests[:3] if score > 0]
     
     def _analyze_knowledge_level(self, question_history: List[str]) -> str:
@@ -713,3 +851,14 @@ def get_optimization_services():
         'multimedia_enhancer': multimedia_enhancer,
         'performance_monitor': performance_monitor
     }
+
+def configure_shared_cache(overrides: Optional[Dict[str, Any]] = None) -> SharedCacheSettings:
+    """按配置为内容缓存和用户画像选择缓存后端（memory / sqlite / redis）"""
+    settings = SharedCacheSettings.from_env().merged(overrides)
+    content_cache.use_backend(create_cache_backend(
+        'content', settings, content_cache.settings.max_entries, content_cache.settings.max_bytes
+    ))
+    user_profile_manager.use_backend(create_cache_backend(
+        'profiles', settings, user_profile_manager.max_profiles, _PROFILE_MAX_BYTES
+    ))
+    return settings
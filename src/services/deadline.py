@@ -0,0 +1,47 @@
+"""
+请求级截止时间（deadline）
+路由在入口处创建 Deadline，沿 LLMManager、备用链和各提供商传递剩余时间预算，
+每次上游调用的超时都不超过剩余预算，保证整个调用链在截止时间内结束
+"""
+
+import os
+import time
+from typing import Optional, Union
+
+# 各入口的默认截止时间（秒）
+ASK_DEADLINE = float(os.getenv('LLM_ASK_DEADLINE', '20'))
+RELATED_CONTENT_DEADLINE = float(os.getenv('LLM_RELATED_DEADLINE', '45'))
+DEFAULT_DEADLINE = float(os.getenv('LLM_DEFAULT_DEADLINE', '60'))
+
+# 阻塞等待结果时在截止时间之外额外留出的余量（秒），用于收尾和返回错误信息
+DEADLINE_GRACE = 1.0
+
+
+class Deadline:
+    """单调时钟上的截止时间点"""
+
+    def __init__(self, seconds: float):
+        self.budget = float(seconds)
+        self.expires_at = time.monotonic() + self.budget
+
+    @classmethod
+    def coerce(cls, value: Union['Deadline', float, int, None]) -> Optional['Deadline']:
+        """接受 Deadline 或秒数"""
+        if value is None or isinstance(value, Deadline):
+            return value
+        return cls(float(value))
+
+    def remaining(self) -> float:
+        """剩余时间（秒），不小于 0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """单次调用可用的超时时间：cap 与剩余预算中的较小值"""
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+    def __repr__(self) -> str:
+        return f"Deadline(budget={self.budget}s, remaining={self.remaining():.2f}s)"
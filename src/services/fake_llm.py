@@ -0,0 +1,139 @@
+"""
+本地模拟LLM
+按可配置的延迟分布、生成速度、错误率和超时率模拟上游LLM，供 FakeLLMProvider
+（进程内）和 fake_llm_server.py（OpenAI 兼容 / Ollama 协议的本地服务）共用，
+在没有真实 API 密钥时也能对延迟、流式输出和故障处理做有意义的压测。
+同一问题第 n 次调用的延迟、回答和结果只由随机种子决定，与并发顺序无关，便于多次压测结果对比
+"""
+
+import hashlib
+import math
+import os
+import random
+import threading
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, List, Optional
+
+# 延迟分布
+LATENCY_FIXED = 'fixed'
+LATENCY_UNIFORM = 'uniform'
+LATENCY_EXPONENTIAL = 'exponential'
+LATENCY_LOGNORMAL = 'lognormal'
+
+# 调用结果
+OUTCOME_OK = 'ok'
+OUTCOME_ERROR = 'error'
+OUTCOME_TIMEOUT = 'timeout'
+
+# 标准正态分布的 95% 分位数
+_Z95 = 1.6449
+
+_VOCABULARY = [
+    '电路', '的', '分析', '需要', '考虑', '电压', '和', '电流', '之间', '关系', '，', '根据', '欧姆定律',
+    '可以', '得到', '结果', '。', '在', '实际', '应用', '中', '还', '要', '注意', '误差', '与', '稳定性',
+    '系统', '响应', '取决于', '参数', '选择', '例如', '放大器', '增益', '带宽', '反馈', '实验', '数据',
+    '表明', '这种', '方法', '有效', '进一步', '可以', '通过', '仿真', '验证', '结论', '。'
+]
+
+
+@dataclass
+class FakeLLMProfile:
+    """模拟LLM的行为配置"""
+    latency: str = LATENCY_LOGNORMAL    # 首 token 延迟分布：fixed / uniform / exponential / lognormal
+    latency_median: float = 0.8         # 首 token 延迟中位数（秒）
+    latency_p95: float = 2.5            # 首 token 延迟 95 分位（秒，fixed / exponential 不使用）
+    tokens_per_second: float = 40.0     # 生成速度，0 表示生成不耗时
+    completion_tokens: int = 200        # 平均回答长度（token），实际长度在 ±50% 内浮动
+    error_rate: float = 0.0             # 返回上游错误的比例
+    timeout_rate: float = 0.0           # 挂起不返回（直到调用超时）的比例
+    timeout_seconds: float = 120.0      # 挂起时长上限
+    seed: int = 0
+
+    @classmethod
+    def from_env(cls) -> 'FakeLLMProfile':
+        """从环境变量读取默认配置"""
+        return cls(
+            latency=os.getenv('LLM_FAKE_LATENCY', LATENCY_LOGNORMAL),
+            latency_median=float(os.getenv('LLM_FAKE_LATENCY_MEDIAN', '0.8')),
+            latency_p95=float(os.getenv('LLM_FAKE_LATENCY_P95', '2.5')),
+            tokens_per_second=float(os.getenv('LLM_FAKE_TOKENS_PER_SECOND', '40')),
+            completion_tokens=int(os.getenv('LLM_FAKE_COMPLETION_TOKENS', '200')),
+            error_rate=float(os.getenv('LLM_FAKE_ERROR_RATE', '0')),
+            timeout_rate=float(os.getenv('LLM_FAKE_TIMEOUT_RATE', '0')),
+            seed=int(os.getenv('LLM_FAKE_SEED', '0'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'FakeLLMProfile':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+@dataclass
+class FakeCall:
+    """一次模拟调用的计划"""
+    outcome: str
+    ttft: float                 # 首 token 延迟（秒）
+    token_delay: float          # 每个 token 的间隔（秒）
+    tokens: List[str]
+
+    @property
+    def content(self) -> str:
+        return ''.join(self.tokens)
+
+    @property
+    def duration(self) -> float:
+        return self.ttft + self.token_delay * len(self.tokens)
+
+
+class FakeLLM:
+    """按配置为每次调用生成确定性的延迟、回答和结果"""
+
+    def __init__(self, name: str = 'fake', profile: Optional[FakeLLMProfile] = None):
+        self.name = name
+        self.profile = profile or FakeLLMProfile.from_env()
+        self._occurrences: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def plan(self, prompt: str, max_tokens: Optional[int] = None) -> FakeCall:
+        """为一次调用抽样：同一提示词第 n 次调用的结果只取决于种子"""
+        digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+        with self._lock:
+            if len(self._occurrences) > 10000:
+                self._occurrences.clear()
+            occurrence = self._occurrences.get(digest, 0)
+            self._occurrences[digest] = occurrence + 1
+        rng = random.Random(f"{self.profile.seed}:{self.name}:{digest}:{occurrence}")
+
+        p = self.profile
+        roll = rng.random()
+        if roll < p.timeout_rate:
+            outcome = OUTCOME_TIMEOUT
+        elif roll < p.timeout_rate + p.error_rate:
+            outcome = OUTCOME_ERROR
+        else:
+            outcome = OUTCOME_OK
+
+        length = max(1, int(p.completion_tokens * rng.uniform(0.5, 1.5)))
+        if max_tokens:
+            length = min(length, int(max_tokens))
+        tokens = [rng.choice(_VOCABULARY) for _ in range(length)] if outcome == OUTCOME_OK else []
+        token_delay = 1.0 / p.tokens_per_second if p.tokens_per_second > 0 else 0.0
+        ttft = p.timeout_seconds if outcome == OUTCOME_TIMEOUT else self._sample_latency(rng)
+        return FakeCall(outcome, ttft, token_delay, tokens)
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        p = self.profile
+        median = max(0.0, p.latency_median)
+        if p.latency == LATENCY_FIXED or median == 0:
+            return median
+        if p.latency == LATENCY_EXPONENTIAL:
+            return rng.expovariate(math.log(2) / median)
+        if p.latency == LATENCY_UNIFORM:
+            # 对称均匀分布：95 分位 = 中位数 + 0.9 * 半宽
+            half_width = max(0.0, p.latency_p95 - median) / 0.9
+            return max(0.0, rng.uniform(median - half_width, median + half_width))
+        sigma = math.log(max(p.latency_p95, median) / median) / _Z95
+        return rng.lognormvariate(math.log(median), sigma)
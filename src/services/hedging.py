@@ -0,0 +1,153 @@
+"""
+LLM请求对冲（hedging）策略
+主提供商在其历史延迟的指定分位数内仍未返回时，并行发出下一个候选提供商的请求，
+取最先成功的结果并取消其余请求；竞速模式下同时向 N 个提供商发出请求
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, fields, replace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from services.provider_stats import provider_stats
+
+logger = logging.getLogger(__name__)
+
+Attempt = Tuple[str, Callable[[], Awaitable[Dict[str, Any]]]]
+
+
+@dataclass
+class HedgingSettings:
+    """对冲策略配置"""
+    enabled: bool = True
+    latency_percentile: float = 0.95  # 超过该分位数延迟仍未返回则发出对冲请求
+    min_samples: int = 10             # 样本不足时使用 default_delay
+    default_delay: float = 8.0
+    min_delay: float = 1.0
+    max_delay: float = 20.0
+    max_parallel: int = 2             # 对冲模式下同时在途的最大请求数
+    max_race: int = 3                 # 竞速模式允许的最大提供商数
+
+    @classmethod
+    def from_env(cls) -> 'HedgingSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            enabled=os.getenv('LLM_HEDGE_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            latency_percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', '0.95')),
+            default_delay=float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', '8')),
+            min_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY', '1')),
+            max_delay=float(os.getenv('LLM_HEDGE_MAX_DELAY', '20')),
+            max_parallel=int(os.getenv('LLM_HEDGE_MAX_PARALLEL', '2')),
+            max_race=int(os.getenv('LLM_RACE_MAX', '3'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'HedgingSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+class HedgingPolicy:
+    """对冲/竞速执行器"""
+
+    def __init__(self, settings: Optional[HedgingSettings] = None):
+        self.settings = settings or HedgingSettings.from_env()
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.races = 0
+
+    def configure(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        self.settings = self.settings.merged(overrides)
+        logger.info(f"Hedging policy configured: {self.settings}")
+
+    def is_enabled(self, override: Optional[bool] = None) -> bool:
+        """请求级开关优先于全局配置"""
+        return self.settings.enabled if override is None else bool(override)
+
+    def hedge_delay(self, provider: str) -> float:
+        """提供商在该分位数延迟内未返回即发出对冲请求"""
+        delay = None
+        if provider_stats.sample_count(provider) >= self.settings.min_samples:
+            delay = provider_stats.percentile(provider, self.settings.latency_percentile)
+        if delay is None:
+            delay = self.settings.default_delay
+        return min(self.settings.max_delay, max(self.settings.min_delay, delay))
+
+    async def run(self, attempts: List[Attempt], race: int = 0
+                  ) -> Tuple[Optional[Dict[str, Any]], Optional[str], List[Tuple[str, Dict[str, Any]]]]:
+        """
+        按顺序执行候选请求，返回 (成功响应, 成功的提供商, 失败列表)
+
+        对冲模式（race=0）：先只请求第一个候选，超过其延迟分位数或失败时启动下一个；
+        竞速模式（race=N）：同时请求前 N 个候选，失败时补位。
+        首个成功结果返回后，其余在途请求全部取消。
+        """
+        if race:
+            race = min(race, self.settings.max_race)
+            self.races += 1
+        target = max(1, race)
+        pending: Dict[asyncio.Future, str] = {}
+        errors: List[Tuple[str, Dict[str, Any]]] = []
+        next_index = 0
+        last_launched = None
+
+        def launch() -> None:
+            nonlocal next_index, last_launched
+            name, factory = attempts[next_index]
+            next_index += 1
+            pending[asyncio.ensure_future(factory())] = name
+            last_launched = name
+
+        try:
+            while next_index < len(attempts) and len(pending) < target:
+                launch()
+
+            while pending:
+                can_hedge = not race and next_index < len(attempts) and len(pending) < self.settings.max_parallel
+                delay = self.hedge_delay(last_launched) if can_hedge else None
+                done, _ = await asyncio.wait(list(pending), timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    logger.info(f"{last_launched} has not answered within {delay:.1f}s, hedging with {attempts[next_index][0]}")
+                    self.hedges_fired += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        response = {"provider": name, "error": str(e)}
+                    if "error" not in response:
+                        if name != attempts[0][0]:
+                            self.hedge_wins += 1
+                        return response, name, errors
+                    errors.append((name, response))
+
+                # 失败后立即让下一个候选补位
+                while next_index < len(attempts) and len(pending) < target:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        return None, None, errors
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.settings.enabled,
+            'latency_percentile': self.settings.latency_percentile,
+            'hedges_fired': self.hedges_fired,
+            'hedge_wins': self.hedge_wins,
+            'races': self.races
+        }
+
+
+# 全局实例
+hedging_policy = HedgingPolicy()
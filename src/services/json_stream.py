@@ -0,0 +1,263 @@
+"""
+流式JSON解析
+LLM按要求返回JSON时，常常带有 ```json 代码块、前后说明文字、多余的逗号，或者因为
+max_tokens 截断而不完整。增量解析器随输出逐段喂入文本：跳过JSON之前的文字，
+跟踪字符串和括号嵌套，顶层指定数组（如 knowledge_points、experiments）中的每个元素
+一闭合就立即产出，客户端可以逐条渲染；结束时返回完整文档，截断时回退到最后一个
+完整的位置并补齐括号，尽量保留已经生成的内容，而不是整段丢弃改用备用内容
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 产出的事件类型
+EVENT_ITEM = 'item'     # 顶层数组中的一个元素：{'type', 'key', 'index', 'value'}
+EVENT_FIELD = 'field'   # 顶层对象中的一个字段：{'type', 'key', 'value'}
+
+_WHITESPACE = ' \t\r\n'
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+@dataclass
+class _Frame:
+    """一层未闭合的对象或数组"""
+    kind: str                           # '{' 或 '['
+    start: int
+    key: Optional[str] = None           # 对象：当前字段名
+    expect_key: bool = True             # 对象：下一个字符串是字段名
+    index: int = 0                      # 数组：当前元素序号
+    value_start: Optional[int] = None   # 当前值的起始位置
+    value_emitted: bool = False         # 当前值（对象或数组）已在闭合时产出
+    item_key: Optional[str] = None      # 数组：逐元素产出时所属的顶层字段
+
+
+class IncrementalJSONParser:
+    """
+    容错的增量JSON解析器
+
+    feed() 每次喂入一段文本，返回这段文本中闭合的元素和字段事件；
+    result() 返回目前为止能恢复出的完整文档（未闭合时截断到最后一个完整位置并补齐括号）
+    """
+
+    def __init__(self, item_keys: Iterable[str] = (), root: str = '{'):
+        self.item_keys = set(item_keys)
+        self.root = root                # 顶层JSON的起始字符：'{'（对象）或 '['（数组）
+        self.text = ''
+        self._pos = 0
+        self._root_start: Optional[int] = None
+        self._root_end: Optional[int] = None
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._safe_end: Optional[int] = None    # 最后一个可截断的位置
+        self._safe_closers = ''                 # 在该位置补齐的括号
+
+    @property
+    def complete(self) -> bool:
+        """顶层JSON是否已经闭合"""
+        return self._root_end is not None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """喂入一段文本，返回其中闭合的元素和字段事件"""
+        self.text += chunk
+        events: List[Dict[str, Any]] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self._root_end is not None:
+                break
+            self._scan(text, i, text[i], events)
+        self._pos = len(text)
+        return events
+
+    def _scan(self, text: str, i: int, c: str, events: List[Dict[str, Any]]) -> None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif c == '\\':
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                top = self._stack[-1]
+                if top.kind == '{' and top.expect_key:
+                    top.key = _loads(text[self._string_start:i + 1])
+            return
+
+        if self._root_start is None:
+            # 跳过JSON之前的说明文字和代码块标记
+            if c == self.root:
+                self._root_start = i
+                self._push(c, i)
+            return
+
+        if c in _WHITESPACE:
+            return
+        top = self._stack[-1]
+        if c == '"':
+            self._in_string = True
+            self._string_start = i
+            self._start_value(top, i)
+        elif c in _CLOSERS:
+            self._start_value(top, i)
+            self._push(c, i)
+        elif c in '}]':
+            self._complete_value(top, i, events)
+            frame = self._stack.pop()
+            if not self._stack:
+                self._root_end = i + 1
+                return
+            parent = self._stack[-1]
+            if parent.item_key is not None or (len(self._stack) == 1 and parent.kind == '{'):
+                self._emit(parent, text[frame.start:i + 1], events)
+                parent.value_emitted = True
+            self._mark_safe(i + 1)
+        elif c == ':':
+            if top.kind == '{':
+                top.expect_key = False
+        elif c == ',':
+            self._complete_value(top, i, events)
+            if top.kind == '{':
+                top.expect_key = True
+                top.key = None
+            else:
+                top.index += 1
+            self._mark_safe(i)
+        else:
+            # 数字、true/false/null 等裸值
+            self._start_value(top, i)
+
+    def _push(self, kind: str, i: int) -> None:
+        frame = _Frame(kind=kind, start=i)
+        if kind == '[' and len(self._stack) == 1:
+            parent = self._stack[0]
+            if parent.kind == '{' and parent.key in self.item_keys:
+                frame.item_key = parent.key
+        self._stack.append(frame)
+        self._mark_safe(i + 1)
+
+    @staticmethod
+    def _start_value(frame: _Frame, i: int) -> None:
+        if frame.value_start is None and not (frame.kind == '{' and frame.expect_key):
+            frame.value_start = i
+
+    def _complete_value(self, frame: _Frame, end: int, events: List[Dict[str, Any]]) -> None:
+        """frame 的当前值在 end 处结束（遇到逗号或闭合括号），裸值在此时产出"""
+        if frame.value_start is not None and not frame.value_emitted:
+            if frame.item_key is not None or (frame is self._stack_root() and frame.kind == '{'):
+                self._emit(frame, self.text[frame.value_start:end].strip(), events)
+        frame.value_start = None
+        frame.value_emitted = False
+
+    def _stack_root(self) -> Optional[_Frame]:
+        return self._stack[0] if self._stack else None
+
+    def _emit(self, frame: _Frame, value_text: str, events: List[Dict[str, Any]]) -> None:
+        value = loads_lenient(value_text)
+        if value is None:
+            return
+        if frame.item_key is not None:
+            events.append({'type': EVENT_ITEM, 'key': frame.item_key, 'index': frame.index, 'value': value})
+        elif frame.key is not None:
+            events.append({'type': EVENT_FIELD, 'key': frame.key, 'value': value})
+
+    def _mark_safe(self, end: int) -> None:
+        # 逐元素产出的数组只在元素边界截断，不保留写了一半的元素
+        if len(self._stack) >= 3 and self._stack[1].item_key is not None:
+            return
+        self._safe_end = end
+        self._safe_closers = ''.join(_CLOSERS[frame.kind] for frame in reversed(self._stack))
+
+    def result(self) -> Optional[Any]:
+        """目前能恢复出的文档；没有找到JSON时返回 None"""
+        if self._root_start is None:
+            return None
+        if self._root_end is not None:
+            return loads_lenient(self.text[self._root_start:self._root_end])
+        if self._safe_end is None:
+            return None
+        return loads_lenient(self.text[self._root_start:self._safe_end] + self._safe_closers)
+
+
+def loads_lenient(text: str) -> Optional[Any]:
+    """json.loads，失败时去掉对象和数组末尾多余的逗号后重试，仍失败返回 None"""
+    value = _loads(text)
+    if value is not None:
+        return value
+    return _loads(_strip_trailing_commas(text))
+
+
+def _loads(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """删除字符串之外、紧挨 } 或 ] 的逗号"""
+    result = []
+    in_string = False
+    escape = False
+    pending_comma = None
+    for c in text:
+        if in_string:
+            result.append(c)
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if c in _WHITESPACE:
+                pending_comma.append(c)
+                continue
+            if c not in '}]':
+                result.extend(pending_comma)
+            else:
+                result.extend(pending_comma[1:])
+            pending_comma = None
+        if c == ',':
+            pending_comma = [c]
+            continue
+        if c == '"':
+            in_string = True
+        result.append(c)
+    if pending_comma is not None:
+        result.extend(pending_comma)
+    return ''.join(result)
+
+
+def extract_json(text: str, item_keys: Iterable[str] = (), max_attempts: int = 5) -> Optional[Any]:
+    """
+    从完整的LLM输出中提取JSON文档（容忍代码块、前后文字、多余逗号和截断）。
+    顶层可以是对象或数组，以文本中先出现的 { 或 [ 为准（[{"a":1},{"a":2}] 返回整个数组）。
+    说明文字中含有括号时，从后续的同类括号重新尝试，最多 max_attempts 次；
+    截断时 item_keys 指定的顶层数组只保留完整的元素
+    """
+    return parse_llm_json(text, item_keys, max_attempts)[0]
+
+
+def parse_llm_json(text: str, item_keys: Iterable[str] = (), max_attempts: int = 5) -> Tuple[Optional[Any], bool]:
+    """同 extract_json，另外返回文档是否完整（False 表示从截断的输出中恢复）"""
+    # 先尝试文本中先出现的根类型，避免把顶层数组只解析成它的第一个对象
+    roots = sorted(('{', '['), key=lambda root: (text.find(root) == -1, text.find(root)))
+    for root in roots:
+        start = text.find(root)
+        for _ in range(max_attempts):
+            if start == -1:
+                break
+            parser = IncrementalJSONParser(item_keys=item_keys, root=root)
+            parser.feed(text[start:])
+            value = parser.result()
+            if value:
+                if not parser.complete:
+                    logger.info(f"Recovered truncated JSON ({len(text) - start} chars)")
+                return value, parser.complete
+            start = text.find(root, start + 1)
+    return None, False
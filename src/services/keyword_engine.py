@@ -0,0 +1,192 @@
+"""
+关键词分类引擎
+学科领域、用户兴趣、问题特征、知识点等关键词表在导入时合并编译为一个前缀树正则，
+一次扫描文本即可得到所有表的命中结果（领域得分、关键概念、知识点），
+替代各模块对各自关键词表的逐个 `in` 查找。匹配不区分大小写，重叠关键词
+（如“运放电路”中的“运放”与“电路”）均会命中。英文关键词只在单词边界处命中
+（“API”不匹配“rapidly”，“AI”不匹配“explain”），中文关键词按子串匹配
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple, Union
+
+# 关键词表：{标签: [关键词 或 (关键词, 权重)]}，未写权重的关键词权重为 1
+
+# 学科领域（相关内容生成）
+SUBJECT_DOMAINS = 'subject_domains'
+# 用户兴趣领域（用户画像）
+USER_INTERESTS = 'user_interests'
+# 问题特征（模型选择）
+QUERY_CHARACTERISTICS = 'query_characteristics'
+# 课程知识点（学习分析）
+KNOWLEDGE_POINTS = 'knowledge_points'
+# 行为追踪概念（用户行为分析）
+TRACKED_CONCEPTS = 'tracked_concepts'
+
+KeywordTable = Dict[str, List[Union[str, Tuple[str, float]]]]
+
+KEYWORD_TABLES: Dict[str, KeywordTable] = {
+    SUBJECT_DOMAINS: {
+        'electronics': [('电路', 3), ('电阻', 2), ('电容', 2), '电感', '二极管', '晶体管', ('运放', 3), ('运算放大器', 3), '滤波', '放大', '振荡', '数字电路', '模拟电路', '集成电路', 'PCB', ('电压', 2), ('电流', 2), '功率', ('基本电路', 3), ('放大器', 3), '反相', '同相', '差分', '运放电路', '电子', '电子学'],
+        'physics': ['力学', '热力学', '电磁学', '光学', '量子', '相对论', '波动', '振动', '能量', '动量', '加速度', '速度', '质量', '重力', '磁场', '电场', '物理', '牛顿', '单摆', '自由落体', '干涉', '衍射'],
+        'mathematics': ['函数', '导数', '积分', '微分', '矩阵', '向量', '概率', '统计', '几何', '代数', '三角', '对数', '指数', '极限', '级数', '方程', '数学', '计算', '求解'],
+        'chemistry': ['化学', '分子', '原子', '离子', '化合物', '反应', '催化', '平衡', '酸碱', '氧化', '还原', '有机', '无机', '聚合物', '滴定', '溶液'],
+        'control': ['控制', 'PID', '反馈', '系统', '传递函数', '稳定性', '响应', '调节', '自动化', '伺服', '闭环', '开环', '控制器', '控制系统'],
+        'computer_science': ['编程', '程序', '算法', '数据结构', '计算机', '软件', '网络', '操作系统', 'CPU', '内存', '数据库', 'Java', 'Python', 'C++', '面向对象', '软件工程', '计算机组成', '编译原理'],
+        'biology': ['生物', '细胞', '基因', 'DNA', 'RNA', '蛋白质', '酶', '代谢', '遗传', '进化', '生态', '微生物', '病毒', '细菌', '生理', '解剖', '分子生物学', '生物化学'],
+        'semiconductor': ['半导体', '集成电路', 'IC', 'VLSI', 'CMOS', 'MOSFET', '晶圆', '光刻', '刻蚀', '离子注入', 'EDA', '版图', '工艺', '制程', '芯片', '硅', '掺杂'],
+        'artificial_intelligence': ['人工智能', 'AI', '机器学习', '深度学习', '神经网络', '卷积', 'CNN', 'RNN', 'Transformer', '自然语言处理', 'NLP', '计算机视觉', '数据挖掘', '模式识别', '强化学习', '监督学习', '无监督学习']
+    },
+    USER_INTERESTS: {
+        'electronics': ['电路', '电子', '电压', '电流', '电阻', '电容', '晶体管', '运放'],
+        'physics': ['物理', '力学', '热力学', '光学', '量子', '波动', '能量'],
+        'mathematics': ['数学', '函数', '微积分', '线性代数', '概率', '统计'],
+        'chemistry': ['化学', '分子', '原子', '反应', '催化', '有机', '无机'],
+        'computer_science': ['编程', '算法', '数据结构', '软件', '计算机', '代码'],
+        'biology': ['生物', '细胞', '基因', 'DNA', '蛋白质', '生态', '进化'],
+        'control': ['控制', 'PID', '系统', '反馈', '自动化', '调节'],
+        'ai': ['人工智能', '机器学习', '深度学习', '神经网络', 'AI']
+    },
+    QUERY_CHARACTERISTICS: {
+        'math': ['数学', '方程', '计算', '积分', '微分', '导数', '矩阵', '向量', '概率', '统计', '几何', '代数', '三角', '函数'],
+        'code': ['代码', '编程', '函数', '算法', '程序', '开发', '软件', '编写', '实现', '调试', 'API', '接口', '类', '对象', '变量', '循环', '条件', '语法'],
+        'electronics': ['电路', '电子', '电工', '电压', '电流', '电阻', '电容', '电感', '晶体管', '二极管', '逻辑门', '数字电路', '模拟电路', '信号', '频率', '波形', '示波器', '仿真'],
+        'physics': ['物理', '力学', '动力学', '热力学', '电磁学', '光学', '量子', '相对论', '能量', '功率', '速度', '加速度', '质量', '动量', '波动', '振动'],
+        'chemistry': ['化学', '元素', '分子', '原子', '化合物', '反应', '酸碱', '氧化', '还原', '溶液', '浓度', '催化剂', '有机', '无机', '物质'],
+        'biology': ['生物', '细胞', '基因', '蛋白质', 'DNA', 'RNA', '酶', '代谢', '遗传', '进化', '生态', '微生物', '植物', '动物', '人体', '组织', '器官']
+    },
+    KNOWLEDGE_POINTS: {
+        '基尔霍夫定律': ['基尔霍夫', 'KCL', 'KVL', '电流定律', '电压定律'],
+        '欧姆定律': ['欧姆', '电阻', '电压', '电流'],
+        '运算放大器': ['运放', '放大器', 'op-amp', '运算放大'],
+        'PID控制': ['PID', '比例', '积分', '微分', '控制器'],
+        '数字信号处理': ['DSP', '数字信号', '滤波器', 'FFT'],
+        '模拟电路': ['模拟', '晶体管', '二极管', '放大电路'],
+        '数字电路': ['数字', '逻辑门', '触发器', '计数器']
+    },
+    TRACKED_CONCEPTS: {
+        keyword: [keyword] for keyword in ['Arduino', 'PID', '传感器', '电机', '控制', '编程', '电路', '算法']
+    }
+}
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """把关键词集合编译为前缀树形式的正则（同一位置优先匹配最长关键词）"""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def emit(node: Dict[str, dict]) -> str:
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return emit(trie)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+class KeywordMatch:
+    """一段文本的匹配结果，按关键词表查询"""
+
+    def __init__(self, engine: 'KeywordEngine', matched: FrozenSet[str]):
+        self._engine = engine
+        self.matched = matched
+
+    def hits(self, table: str) -> Dict[str, List[str]]:
+        """{标签: 命中的关键词}，只包含有命中的标签，按表中顺序"""
+        result: Dict[str, List[str]] = {}
+        for label, keyword, key, _ in self._engine.entries(table):
+            if key in self.matched:
+                result.setdefault(label, []).append(keyword)
+        return result
+
+    def scores(self, table: str) -> Dict[str, float]:
+        """每个标签的加权得分（包含得分为 0 的标签，按表中顺序）"""
+        result = {label: 0 for label in self._engine.labels(table)}
+        for label, _, key, weight in self._engine.entries(table):
+            if key in self.matched:
+                result[label] += weight
+        return result
+
+    def labels(self, table: str) -> List[str]:
+        """有命中的标签，按表中顺序"""
+        return list(self.hits(table))
+
+    def keywords(self, table: str) -> List[str]:
+        """命中的关键词（去重），按表中顺序"""
+        seen = []
+        for _, keyword, key, _ in self._engine.entries(table):
+            if key in self.matched and keyword not in seen:
+                seen.append(keyword)
+        return seen
+
+
+class KeywordEngine:
+    """多关键词表共享的单次扫描匹配器"""
+
+    def __init__(self, tables: Dict[str, KeywordTable]):
+        # 每个表的条目：(标签, 关键词, 小写关键词, 权重)
+        self._entries: Dict[str, List[Tuple[str, str, str, float]]] = {}
+        self._labels: Dict[str, List[str]] = {}
+        for name, table in tables.items():
+            entries = []
+            for label, keywords in table.items():
+                for item in keywords:
+                    keyword, weight = (item, 1) if isinstance(item, str) else item
+                    entries.append((label, keyword, keyword.lower(), weight))
+            self._entries[name] = entries
+            self._labels[name] = list(table)
+
+        vocabulary = {key for entries in self._entries.values() for _, _, key, _ in entries}
+        self._pattern = re.compile(_trie_pattern(vocabulary))
+        # 同一起点只匹配最长关键词，较短的命中就是它的前缀
+        self._prefixes = {word: [p for p in vocabulary if word.startswith(p)] for word in vocabulary}
+        # 以英文字母或数字开头/结尾的关键词需要检查左/右单词边界
+        self._bounded = {word: (_is_word_char(word[0]), _is_word_char(word[-1])) for word in vocabulary}
+        self.scan = lru_cache(maxsize=512)(self._scan)
+
+    def entries(self, table: str) -> List[Tuple[str, str, str, float]]:
+        return self._entries[table]
+
+    def labels(self, table: str) -> List[str]:
+        return self._labels[table]
+
+    def _scan(self, text: str) -> FrozenSet[str]:
+        """扫描一次文本，返回命中的全部关键词（小写）"""
+        text = text.lower()
+        search = self._pattern.search
+        matched = set()
+        pos = 0
+        while True:
+            m = search(text, pos)
+            if m is None:
+                return frozenset(matched)
+            start = m.start()
+            left_ok = start == 0 or not _is_word_char(text[start - 1])
+            for word in self._prefixes[m.group()]:
+                check_left, check_right = self._bounded[word]
+                end = start + len(word)
+                if check_left and not left_ok:
+                    continue
+                if check_right and end < len(text) and _is_word_char(text[end]):
+                    continue
+                matched.add(word)
+            # 从下一个字符继续，保证重叠的关键词也能命中
+            pos = start + 1
+
+    def match(self, text: str) -> KeywordMatch:
+        """匹配文本（相同文本的扫描结果会被缓存）"""
+        return KeywordMatch(self, self.scan(text or ''))
+
+
+# 全局实例（导入时编译）
+keyword_engine = KeywordEngine(KEYWORD_TABLES)
@@ -10,6 +10,7 @@ from src.models.learning_analytics import (
     UserAchievement, StudyStreak, TeacherStudentMapping
 )
 from src.models.user import User
+from src.services.keyword_engine import keyword_engine, KNOWLEDGE_POINTS
 
 class LearningAnalyticsService:
     """学习分析服务"""
@@ -270,25 +271,8 @@ class LearningAnalyticsService:
     
     def _extract_knowledge_points(self, question_text: str) -> List[str]:
         """从问题中提取知识点"""
-        # 简单的关键词匹配，实际应用中可以使用NLP技术
-        knowledge_keywords = {
-            '基尔霍夫定律': ['基尔霍夫', 'KCL', 'KVL', '电流定律', '电压定律'],
-            '欧姆定律': ['欧姆', '电阻', '电压', '电流'],
-            '运算放大器': ['运放', '放大器', 'op-amp', '运算放大'],
-            'PID控制': ['PID', '比例', '积分', '微分', '控制器'],
-            '数字信号处理': ['DSP', '数字信号', '滤波器', 'FFT'],
-            '模拟电路': ['模拟', '晶体管', '二极管', '放大电路'],
-            '数字电路': ['数字', '逻辑门', '触发器', '计数器']
-        }
-        
-        extracted_points = []
-        question_lower = question_text.lower()
-        
-        for point, keywords in knowledge_keywords.items():
-            if any(keyword.lower() in question_lower for keyword in keywords):
-                extracted_points.append(point)
-        
-        return extracted_points
+        # 简单的关键词匹配，实际应用中可以使用NLP技术（关键词表见 keyword_engine.KNOWLEDGE_POINTS）
+        return keyword_engine.match(question_text or '').labels(KNOWLEDGE_POINTS)
     
     def _update_learning_path(self, user_id: int, subject: Optional[str]):
         """更新学习路径"""
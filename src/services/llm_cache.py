@@ -0,0 +1,236 @@
+"""
+LLM响应缓存
+按规范化提示词、提供商、模型、temperature 和 max_tokens 精确匹配缓存成功的回答。
+内存层使用 TTL + LRU，可选的 SQLite 层在进程重启后仍然有效
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 不写入缓存的响应字段（调试数据或请求级信息）
+_UNCACHED_FIELDS = ('raw_response', 'cached', 'cache_tier')
+
+
+@dataclass
+class ResponseCacheSettings:
+    """响应缓存配置"""
+    enabled: bool = False
+    ttl_seconds: float = 3600.0
+    max_entries: int = 1000
+    sqlite_path: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> 'ResponseCacheSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            enabled=os.getenv('LLM_RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+            ttl_seconds=float(os.getenv('LLM_RESPONSE_CACHE_TTL', '3600')),
+            max_entries=int(os.getenv('LLM_RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+            sqlite_path=os.getenv('LLM_RESPONSE_CACHE_SQLITE') or None
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'ResponseCacheSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+def normalize_prompt(prompt: str) -> str:
+    """规范化提示词：全角转半角（NFKC）、合并空白、去除首尾空白"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', prompt or '')).strip()
+
+
+class LLMResponseCache:
+    """精确匹配的LLM响应缓存（线程安全）"""
+
+    def __init__(self, settings: Optional[ResponseCacheSettings] = None):
+        self.settings = settings or ResponseCacheSettings.from_env()
+        self._memory: 'OrderedDict[str, Tuple[float, Dict[str, Any], float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.latency_saved = 0.0
+        self._open_db()
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    def configure(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        """更新配置（SQLite 路径变化时重新打开数据库）"""
+        old_path = self.settings.sqlite_path
+        self.settings = self.settings.merged(overrides)
+        if self.settings.sqlite_path != old_path:
+            self._close_db()
+            self._open_db()
+        logger.info(f"LLM response cache configured: {self.settings}")
+
+    def _open_db(self) -> None:
+        path = self.settings.sqlite_path
+        if not path:
+            return
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS llm_response_cache ('
+                'key TEXT PRIMARY KEY, response TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, latency REAL NOT NULL DEFAULT 0)'
+            )
+            db.execute('DELETE FROM llm_response_cache WHERE expires_at < ?', (time.time(),))
+            db.commit()
+            self._db = db
+            logger.info(f"LLM response cache SQLite tier at {path}")
+        except sqlite3.Error as e:
+            logger.error(f"Failed to open LLM response cache database {path}: {str(e)}")
+            self._db = None
+
+    def _close_db(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @staticmethod
+    def make_key(prompt: str, provider: Optional[str], model: Optional[str],
+                 temperature: Any = None, max_tokens: Any = None) -> str:
+        """生成缓存键"""
+        material = json.dumps(
+            [normalize_prompt(prompt), provider, model, temperature, max_tokens],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查找缓存，命中时返回响应副本（带 cached / cache_tier 标记）"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, response, latency = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    self.latency_saved += latency
+                    return dict(response, cached=True, cache_tier='memory')
+                del self._memory[key]
+
+        entry = self._db_get(key, now)
+        if entry is not None:
+            expires_at, response, latency = entry
+            self._memory_put(key, expires_at, response, latency)
+            with self._lock:
+                self.disk_hits += 1
+                self.latency_saved += latency
+            return dict(response, cached=True, cache_tier='sqlite')
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, response: Dict[str, Any], latency: float = 0.0) -> None:
+        """缓存一次成功的响应；latency 为原始调用耗时，用于统计节省的时间"""
+        if "error" in response:
+            return
+        stored = {k: v for k, v in response.items() if k not in _UNCACHED_FIELDS}
+        expires_at = time.time() + self.settings.ttl_seconds
+        self._memory_put(key, expires_at, stored, latency)
+        self._db_put(key, expires_at, stored, latency)
+
+    def _memory_put(self, key: str, expires_at: float, response: Dict[str, Any], latency: float) -> None:
+        with self._lock:
+            self._memory[key] = (expires_at, response, latency)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.settings.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def _db_get(self, key: str, now: float) -> Optional[Tuple[float, Dict[str, Any], float]]:
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    'SELECT response, expires_at, latency FROM llm_response_cache WHERE key = ?', (key,)
+                ).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            return row[1], json.loads(row[0]), row[2]
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"LLM response cache read failed: {str(e)}")
+            return None
+
+    def _db_put(self, key: str, expires_at: float, response: Dict[str, Any], latency: float) -> None:
+        if self._db is None:
+            return
+        try:
+            payload = json.dumps(response, ensure_ascii=False, default=str)
+            with self._db_lock:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO llm_response_cache (key, response, expires_at, latency) VALUES (?, ?, ?, ?)',
+                    (key, payload, expires_at, latency)
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response cache write failed: {str(e)}")
+
+    def clear(self) -> None:
+        """清空内存层和 SQLite 层"""
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute('DELETE FROM llm_response_cache')
+                self._db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            stats = {
+                'enabled': self.settings.enabled,
+                'memory_entries': len(self._memory),
+                'max_entries': self.settings.max_entries,
+                'ttl_seconds': self.settings.ttl_seconds,
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / total * 100, 2) if total else 0,
+                'evictions': self.evictions,
+                'latency_saved_seconds': round(self.latency_saved, 2),
+                'sqlite_path': self.settings.sqlite_path
+            }
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    stats['disk_entries'] = self._db.execute('SELECT COUNT(*) FROM llm_response_cache').fetchone()[0]
+            except sqlite3.Error:
+                pass
+        return stats
+
+
+# 全局实例
+response_cache = LLMResponseCache()
@@ -0,0 +1,256 @@
+"""
+LLM后台任务
+把耗时的生成任务（相关内容生成：LLM调用 + 质量校验 + 多媒体增强）从HTTP请求中
+移到工作线程池执行：接口提交任务后立即返回任务ID，客户端轮询任务状态或通过SSE
+订阅完成事件，Web工作进程不再被单个请求占用 10–40 秒。
+任务可以带去重键（如相关内容的缓存键）：同一用户重复提交时复用排队中、执行中或已成功的任务，
+/ask 预取的相关内容因此可以被随后的请求直接取用。
+任务和结果保存在本进程内存中，完成后保留 result_ttl 秒
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, fields, replace
+from typing import Any, Callable, Dict, Optional
+
+from utils.error_handler import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+@dataclass
+class JobSettings:
+    """后台任务配置"""
+    max_workers: int = 8               # 工作线程数（LLM调用仍受调度器后台通道的并发预算约束）
+    max_pending: int = 200             # 排队和执行中的任务总数上限，超出直接拒绝
+    max_pending_per_owner: int = 5     # 单个用户同时未完成的任务数上限
+    result_ttl: float = 600.0          # 完成的任务保留时长（秒）
+
+    @classmethod
+    def from_env(cls) -> 'JobSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            max_workers=int(os.getenv('LLM_JOB_WORKERS', '8')),
+            max_pending=int(os.getenv('LLM_JOB_MAX_PENDING', '200')),
+            max_pending_per_owner=int(os.getenv('LLM_JOB_MAX_PENDING_PER_USER', '5')),
+            result_ttl=float(os.getenv('LLM_JOB_RESULT_TTL', '600'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'JobSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+@dataclass
+class Job:
+    """一个后台任务"""
+    id: str
+    kind: str
+    owner: str
+    key: Optional[str] = None
+    status: str = JOB_QUEUED
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+        if self.started_at is not None:
+            data['queue_ms'] = round((self.started_at - self.created_at) * 1000, 1)
+        if self.finished_at is not None and self.started_at is not None:
+            data['run_ms'] = round((self.finished_at - self.started_at) * 1000, 1)
+        if self.error is not None:
+            data['error'] = self.error
+        if include_result and self.status == JOB_SUCCEEDED:
+            data['result'] = self.result
+        return data
+
+
+class JobManager:
+    """线程池执行的后台任务，支持按任务ID查询和等待状态变化（线程安全）"""
+
+    def __init__(self, settings: Optional[JobSettings] = None):
+        self.settings = settings or JobSettings.from_env()
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._keys: Dict[str, str] = {}    # 去重键 -> 任务ID
+        self._condition = threading.Condition()
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self.stats = {'submitted': 0, 'succeeded': 0, 'failed': 0, 'rejected': 0, 'expired': 0, 'deduplicated': 0}
+
+    def configure(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        with self._condition:
+            settings = self.settings.merged(overrides)
+            if self._executor is not None and settings.max_workers != self.settings.max_workers:
+                # 已提交的任务在旧线程池中继续执行，新任务使用新线程池
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            self.settings = settings
+        logger.info(f"LLM job queue configured: {self.settings}")
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args: Any, owner: str = 'anonymous',
+               key: Optional[str] = None, **kwargs: Any) -> Job:
+        """
+        提交任务并立即返回；未完成的任务过多时抛出 RateLimitError。
+        key 不为空时，同一用户已有该键的任务（未失败）则直接返回该任务
+        """
+        with self._condition:
+            self._purge_expired()
+            existing = self._find(key, owner)
+            if existing is not None:
+                self.stats['deduplicated'] += 1
+                return existing
+            pending = [job for job in self._jobs.values() if not job.finished]
+            if len(pending) >= self.settings.max_pending:
+                self.stats['rejected'] += 1
+                raise RateLimitError(
+                    "Too many background jobs in progress, please try again later",
+                    limit=self.settings.max_pending,
+                    details={'retry_after': 10}
+                )
+            if sum(1 for job in pending if job.owner == owner) >= self.settings.max_pending_per_owner:
+                self.stats['rejected'] += 1
+                raise RateLimitError(
+                    "Too many unfinished jobs, please wait for earlier jobs to finish",
+                    limit=self.settings.max_pending_per_owner,
+                    details={'retry_after': 5}
+                )
+            job = Job(id=uuid.uuid4().hex, kind=kind, owner=owner, key=key, created_at=time.time())
+            self._jobs[job.id] = job
+            if key:
+                self._keys[key] = job.id
+            self.stats['submitted'] += 1
+            executor = self._get_executor()
+
+        executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """获取（必要时创建）本进程的线程池，fork 后在子进程中重新创建"""
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, self.settings.max_workers), thread_name_prefix='alethea-llm-job'
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]) -> None:
+        self._update(job, status=JOB_RUNNING, started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            logger.exception(f"{job.kind} job {job.id} failed")
+            self._update(job, status=JOB_FAILED, error=str(e) or type(e).__name__, finished_at=time.time())
+        else:
+            self._update(job, status=JOB_SUCCEEDED, result=result, finished_at=time.time())
+
+    def _update(self, job: Job, **changes: Any) -> None:
+        with self._condition:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            if changes.get('status') == JOB_SUCCEEDED:
+                self.stats['succeeded'] += 1
+            elif changes.get('status') == JOB_FAILED:
+                self.stats['failed'] += 1
+            self._condition.notify_all()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """按ID取任务，不存在或已过期时返回 None"""
+        with self._condition:
+            self._purge_expired()
+            return self._jobs.get(job_id)
+
+    def find(self, key: Optional[str], owner: str) -> Optional[Job]:
+        """该用户带去重键 key 的任务（排队中、执行中或已成功），没有时返回 None"""
+        with self._condition:
+            self._purge_expired()
+            return self._find(key, owner)
+
+    def _find(self, key: Optional[str], owner: str) -> Optional[Job]:
+        if not key:
+            return None
+        job = self._jobs.get(self._keys.get(key, ''))
+        if job is None or job.owner != owner or job.status == JOB_FAILED:
+            return None
+        return job
+
+    def wait_finished(self, job_id: str, timeout: float) -> Optional[Job]:
+        """等待任务完成，最多 timeout 秒；返回任务当前状态"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            job = self._jobs.get(job_id)
+            while job is not None and not job.finished:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return job
+
+    def wait(self, job_id: str, timeout: float, known_status: Optional[str] = None) -> Optional[Job]:
+        """等待任务状态不同于 known_status（或任务完成），最多 timeout 秒；返回任务当前状态"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            job = self._jobs.get(job_id)
+            while job is not None and not job.finished and job.status == known_status:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return job
+
+    def _purge_expired(self) -> None:
+        """删除完成超过 result_ttl 秒的任务（调用方持有锁）"""
+        cutoff = time.time() - self.settings.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if job.key and self._keys.get(job.key) == job_id:
+                del self._keys[job.key]
+        self.stats['expired'] += len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            self._purge_expired()
+            by_status: Dict[str, int] = {}
+            for job in self._jobs.values():
+                by_status[job.status] = by_status.get(job.status, 0) + 1
+            return {
+                'max_workers': self.settings.max_workers,
+                'max_pending': self.settings.max_pending,
+                'jobs': by_status,
+                **self.stats
+            }
+
+
+# 全局实例
+job_manager = JobManager()
@@ -0,0 +1,253 @@
+"""
+LLM调用指标
+按提供商和模型把每次调用的总耗时、首字节时间、提示词/生成 token 数、生成速度（token/秒）
+和备用服务切换次数计入固定分桶直方图，并按结果和缓存状态计数，
+可导出为 Prometheus 文本格式，或汇总为 p50/p95/p99 供容量规划使用
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from services.rate_limiter import estimate_tokens
+
+# 调用结果
+STATUS_SUCCESS = 'success'
+STATUS_ERROR = 'error'
+STATUS_RATE_LIMITED = 'rate_limited'
+STATUS_DEADLINE_EXCEEDED = 'deadline_exceeded'
+STATUS_CANCELLED = 'cancelled'
+
+# 缓存状态
+CACHE_MISS = 'miss'
+CACHE_HIT = 'hit'
+CACHE_COALESCED = 'coalesced'
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 45, 60)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+THROUGHPUT_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320)
+HOP_BUCKETS = (0, 1, 2, 3, 5)
+
+# 直方图：名称 -> (说明, 分桶)
+HISTOGRAMS: Dict[str, Tuple[str, Sequence[float]]] = {
+    'request_duration_seconds': ('Wall time of successful LLM calls including queueing and fallbacks', LATENCY_BUCKETS),
+    'time_to_first_byte_seconds': ('Time until the first answer byte reaches the caller (whole answer for non-streaming calls)', LATENCY_BUCKETS),
+    'prompt_tokens': ('Prompt tokens per upstream call (provider usage or local estimate)', TOKEN_BUCKETS),
+    'completion_tokens': ('Completion tokens per upstream call (provider usage or local estimate)', TOKEN_BUCKETS),
+    'tokens_per_second': ('Completion tokens per second of wall time', THROUGHPUT_BUCKETS),
+    'fallback_hops': ('Backup providers called before the answer was served', HOP_BUCKETS)
+}
+
+METRIC_PREFIX = 'alethea_llm_'
+
+
+class Histogram:
+    """固定分桶直方图（计数不累积，导出时再累加）"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶内线性插值估算分位数（与 Prometheus histogram_quantile 相同），落在 +Inf 桶时返回最大边界"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    return float(self.buckets[-1])
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return float(self.buckets[-1])
+
+
+def response_usage(response: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+    """从提供商原始响应中取出 (提示词 token 数, 生成 token 数)，没有用量信息时为 None"""
+    raw = response.get('raw_response')
+    if not isinstance(raw, dict):
+        return None, None
+    usage = raw.get('usage')
+    if isinstance(usage, dict):
+        # OpenAI 兼容接口 / 文心：prompt_tokens，Claude：input_tokens
+        prompt = usage.get('prompt_tokens', usage.get('input_tokens'))
+        completion = usage.get('completion_tokens', usage.get('output_tokens'))
+        return prompt, completion
+    metadata = raw.get('usageMetadata')
+    if isinstance(metadata, dict):
+        # Gemini
+        return metadata.get('promptTokenCount'), metadata.get('candidatesTokenCount')
+    return None, None
+
+
+class LLMMetrics:
+    """按提供商和模型汇总的调用指标"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self._requests: Dict[Tuple[str, str, str, str], int] = {}
+        self._tokens: Dict[Tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: str, status: str, cache: str = CACHE_MISS,
+               duration: Optional[float] = None, ttfb: Optional[float] = None,
+               prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None,
+               fallback_hops: int = 0) -> None:
+        """
+        记录一次调用。耗时类直方图只统计成功的调用（快速失败会拉低分位数），
+        token 和生成速度只统计真正发往上游的调用（缓存命中和合并请求不产生 token）
+        """
+        provider = provider or 'unknown'
+        model = model or 'unknown'
+        upstream = status == STATUS_SUCCESS and cache == CACHE_MISS
+        observations: List[Tuple[str, float]] = []
+        if status == STATUS_SUCCESS:
+            if duration is not None:
+                observations.append(('request_duration_seconds', duration))
+            if ttfb is not None:
+                observations.append(('time_to_first_byte_seconds', ttfb))
+            observations.append(('fallback_hops', fallback_hops))
+        if upstream:
+            if prompt_tokens is not None:
+                observations.append(('prompt_tokens', prompt_tokens))
+            if completion_tokens is not None:
+                observations.append(('completion_tokens', completion_tokens))
+                if duration:
+                    observations.append(('tokens_per_second', completion_tokens / duration))
+
+        with self._lock:
+            key = (provider, model, status, cache)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for name, value in observations:
+                histogram = self._histograms.get((name, provider, model))
+                if histogram is None:
+                    histogram = self._histograms[(name, provider, model)] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+            if upstream:
+                for kind, count in (('prompt', prompt_tokens), ('completion', completion_tokens)):
+                    if count:
+                        self._tokens[(provider, model, kind)] = self._tokens.get((provider, model, kind), 0) + count
+
+    def record_response(self, prompt: str, provider: Optional[str], response: Dict[str, Any],
+                        duration: float, model: Optional[str] = None) -> None:
+        """
+        记录一次 LLMManager.generate_response 调用（非流式调用的首字节时间即总耗时）。
+        model 用于响应中没有模型名时
+        """
+        served_by = response.get('selected_provider') or response.get('provider') or provider
+        if 'error' not in response:
+            status = STATUS_SUCCESS
+        elif response.get('rate_limited'):
+            status = STATUS_RATE_LIMITED
+        elif response.get('deadline_exceeded'):
+            status = STATUS_DEADLINE_EXCEEDED
+        else:
+            status = STATUS_ERROR
+        if response.get('cached'):
+            cache = CACHE_HIT
+        elif response.get('coalesced'):
+            cache = CACHE_COALESCED
+        else:
+            cache = CACHE_MISS
+
+        prompt_tokens, completion_tokens = response_usage(response)
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt, served_by)
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(response.get('content') or '', served_by)
+
+        hops = response.get('fallback_hops')
+        if hops is None:
+            hops = 1 if response.get('fallback_from') else 0
+        self.record(served_by, response.get('model') or model, status, cache,
+                    duration=duration, ttfb=duration,
+                    prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                    fallback_hops=hops)
+
+    def get_summary(self) -> Dict[str, Dict[str, Any]]:
+        """{提供商: {模型: {请求计数, 各直方图的 count/avg/p50/p95/p99}}}"""
+        summary: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for (provider, model, status, cache), count in self._requests.items():
+                entry = summary.setdefault(provider, {}).setdefault(model, {'requests': {}})
+                entry['requests'][f"{status}/{cache}"] = count
+            for (name, provider, model), histogram in self._histograms.items():
+                entry = summary.setdefault(provider, {}).setdefault(model, {'requests': {}})
+                entry[name] = {
+                    'count': histogram.count,
+                    'avg': round(histogram.sum / histogram.count, 3) if histogram.count else None,
+                    **{f'p{int(q * 100)}': _round(histogram.quantile(q)) for q in (0.5, 0.95, 0.99)}
+                }
+            for (provider, model, kind), count in self._tokens.items():
+                summary[provider][model][f'{kind}_tokens_total'] = count
+        return summary
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines: List[str] = []
+        with self._lock:
+            requests = sorted(self._requests.items())
+            histograms = sorted(self._histograms.items())
+            tokens = sorted(self._tokens.items())
+
+        name = f'{METRIC_PREFIX}requests_total'
+        lines.append(f'# HELP {name} LLM calls by serving provider, model, outcome and cache status')
+        lines.append(f'# TYPE {name} counter')
+        for (provider, model, status, cache), count in requests:
+            lines.append(f'{name}{_labels(provider=provider, model=model, status=status, cache=cache)} {count}')
+
+        name = f'{METRIC_PREFIX}tokens_total'
+        lines.append(f'# HELP {name} Tokens sent to and generated by upstream providers')
+        lines.append(f'# TYPE {name} counter')
+        for (provider, model, kind), count in tokens:
+            lines.append(f'{name}{_labels(provider=provider, model=model, kind=kind)} {count}')
+
+        for metric, (help_text, _) in HISTOGRAMS.items():
+            name = f'{METRIC_PREFIX}{metric}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (hist_name, provider, model), histogram in histograms:
+                if hist_name != metric:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _format_number(bound)
+                    lines.append(f'{name}_bucket{_labels(provider=provider, model=model, le=le)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(provider=provider, model=model)} {_format_number(histogram.sum)}')
+                lines.append(f'{name}_count{_labels(provider=provider, model=model)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+            self._tokens.clear()
+
+
+def _labels(**labels: str) -> str:
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(round(value, 6))
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+# 全局实例
+llm_metrics = LLMMetrics()
@@ -0,0 +1,365 @@
+"""
+LLM调用公平调度
+请求按租户（班级）和用户分别排队，两级加权公平分配执行名额（stride 调度：
+每次服务后按 cost / weight 推进该队列的虚拟时间，总是先服务虚拟时间最小的队列）。
+某个班级批量提交的请求只会占用其公平份额，轻量用户的排队时间不受影响。
+派发时同时遵守各提供商的并发上限，避免名额被注定要在限流器里等待的请求占用。
+
+请求分为两条优先级通道：interactive（学生正在等待的问答）和 background
+（相关内容、实验、项目推荐等生成任务）。后台通道有独立的并发预算，只能占用
+各提供商并发上限的一部分，并且在有交互请求排队时暂缓派发，保证交互请求的延迟
+不受后台流量影响
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from services.rate_limiter import rate_limiters
+from utils.error_handler import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = 'default'
+
+# 优先级通道
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BACKGROUND = 'background'
+
+
+@dataclass
+class SchedulerSettings:
+    """调度器配置"""
+    enabled: bool = True
+    max_concurrency: int = 16          # 同时执行的交互LLM请求数
+    max_queue_per_user: int = 20       # 单个用户排队请求数上限，超出直接拒绝
+    max_queue_wait: float = 30.0       # 排队等待上限（同时受请求截止时间约束）
+    background_max_concurrency: int = 4       # 后台通道独立的并发预算
+    background_provider_share: float = 0.5    # 后台请求最多占用提供商并发上限的比例
+    background_max_queue_wait: float = 60.0
+    tenant_weights: Dict[str, float] = field(default_factory=dict)
+    user_weights: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> 'SchedulerSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            enabled=os.getenv('LLM_SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            max_concurrency=int(os.getenv('LLM_SCHEDULER_MAX_CONCURRENCY', '16')),
+            max_queue_per_user=int(os.getenv('LLM_SCHEDULER_MAX_QUEUE_PER_USER', '20')),
+            max_queue_wait=float(os.getenv('LLM_SCHEDULER_MAX_WAIT', '30')),
+            background_max_concurrency=int(os.getenv('LLM_SCHEDULER_BACKGROUND_CONCURRENCY', '4')),
+            background_provider_share=float(os.getenv('LLM_SCHEDULER_BACKGROUND_PROVIDER_SHARE', '0.5')),
+            background_max_queue_wait=float(os.getenv('LLM_SCHEDULER_BACKGROUND_MAX_WAIT', '60'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'SchedulerSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+class Ticket:
+    """一个排队中的调用"""
+    __slots__ = ('user', 'tenant', 'priority', 'provider', 'cost', 'loop', 'future', 'enqueued_at', 'granted')
+
+    def __init__(self, user: str, tenant: str, priority: str, provider: Optional[str], cost: float):
+        self.user = user
+        self.tenant = tenant
+        self.priority = priority
+        self.provider = provider
+        self.cost = cost
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class _FairQueue:
+    """带虚拟时间（pass）的加权队列，租户和用户各一层"""
+    __slots__ = ('name', 'weight', 'pass_', 'vtime')
+
+    def __init__(self, name: str, weight: float, pass_: float):
+        self.name = name
+        self.weight = max(weight, 1e-6)
+        self.pass_ = pass_
+        self.vtime = 0.0   # 子队列的虚拟时间基准
+
+
+class _Lane:
+    """一条优先级通道：两级（租户 → 用户）加权公平队列及其统计（调用方持有调度器锁）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.tenants: Dict[str, _FairQueue] = {}            # 仅包含有排队请求的租户
+        self.tenant_users: Dict[str, Dict[str, _FairQueue]] = {}
+        self.user_tickets: Dict[tuple, Deque[Ticket]] = {}
+        self.vtime = 0.0
+        self.in_flight = 0
+        self.dispatched = 0
+        self.timed_out = 0
+        self.waits: Deque[float] = deque(maxlen=1000)
+
+    @property
+    def depth(self) -> int:
+        return sum(len(t) for t in self.user_tickets.values())
+
+    def user_depth(self, tenant: str, user: str) -> int:
+        tickets = self.user_tickets.get((tenant, user))
+        return len(tickets) if tickets else 0
+
+    def enqueue(self, ticket: Ticket, settings: SchedulerSettings) -> None:
+        tenant = self.tenants.get(ticket.tenant)
+        if tenant is None:
+            # 重新进入排队的队列从当前虚拟时间开始，空闲期间不积累额度
+            tenant = _FairQueue(ticket.tenant, settings.tenant_weights.get(ticket.tenant, 1.0), self.vtime)
+            self.tenants[ticket.tenant] = tenant
+            self.tenant_users[ticket.tenant] = {}
+        users = self.tenant_users[ticket.tenant]
+        if ticket.user not in users:
+            users[ticket.user] = _FairQueue(ticket.user, settings.user_weights.get(ticket.user, 1.0), tenant.vtime)
+            self.user_tickets[(ticket.tenant, ticket.user)] = deque()
+        self.user_tickets[(ticket.tenant, ticket.user)].append(ticket)
+
+    def pick(self, eligible: Callable[[Ticket], bool]) -> Optional[Ticket]:
+        """按虚拟时间选择下一个可派发的请求"""
+        for tenant in sorted(self.tenants.values(), key=lambda q: q.pass_):
+            users = self.tenant_users[tenant.name]
+            for user in sorted(users.values(), key=lambda q: q.pass_):
+                tickets = self.user_tickets[(tenant.name, user.name)]
+                ticket = tickets[0]
+                if not eligible(ticket):
+                    continue
+                tickets.popleft()
+                self.vtime = max(self.vtime, tenant.pass_)
+                tenant.pass_ += ticket.cost / tenant.weight
+                tenant.vtime = max(tenant.vtime, user.pass_)
+                user.pass_ += ticket.cost / user.weight
+                if not tickets:
+                    self._drop_user(tenant.name, user.name)
+                return ticket
+        return None
+
+    def remove(self, ticket: Ticket) -> None:
+        tickets = self.user_tickets.get((ticket.tenant, ticket.user))
+        if tickets is None or ticket not in tickets:
+            return
+        tickets.remove(ticket)
+        if not tickets:
+            self._drop_user(ticket.tenant, ticket.user)
+
+    def _drop_user(self, tenant: str, user: str) -> None:
+        del self.user_tickets[(tenant, user)]
+        users = self.tenant_users[tenant]
+        del users[user]
+        if not users:
+            del self.tenants[tenant]
+            del self.tenant_users[tenant]
+
+    def wait_percentile(self, q: float) -> Optional[float]:
+        if not self.waits:
+            return None
+        waits = sorted(self.waits)
+        return round(waits[min(len(waits) - 1, int(round(q * (len(waits) - 1))))] * 1000, 1)
+
+    def get_stats(self, max_concurrency: int) -> Dict[str, Any]:
+        return {
+            'max_concurrency': max_concurrency,
+            'in_flight': self.in_flight,
+            'queue_depth': self.depth,
+            'dispatched': self.dispatched,
+            'timed_out': self.timed_out,
+            'wait_p50_ms': self.wait_percentile(0.5),
+            'wait_p95_ms': self.wait_percentile(0.95)
+        }
+
+
+class LLMScheduler:
+    """带优先级通道的两级加权公平调度器（线程安全，可在多个事件循环中等待）"""
+
+    def __init__(self, settings: Optional[SchedulerSettings] = None):
+        self.settings = settings or SchedulerSettings.from_env()
+        self._lock = threading.Lock()
+        self._lanes: Dict[str, _Lane] = {
+            PRIORITY_INTERACTIVE: _Lane(PRIORITY_INTERACTIVE),
+            PRIORITY_BACKGROUND: _Lane(PRIORITY_BACKGROUND)
+        }
+        self._provider_in_flight: Dict[str, Dict[str, int]] = {}
+        self.rejected = 0
+        self._tenant_stats: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    @property
+    def in_flight(self) -> int:
+        return sum(lane.in_flight for lane in self._lanes.values())
+
+    def configure(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            self.settings = self.settings.merged(overrides)
+        logger.info(f"LLM scheduler configured: max_concurrency={self.settings.max_concurrency}, "
+                    f"background_max_concurrency={self.settings.background_max_concurrency}, "
+                    f"max_queue_per_user={self.settings.max_queue_per_user}")
+
+    async def run(self, factory: Callable[[], Awaitable[Dict[str, Any]]], user: Any = None,
+                  tenant: Any = None, provider: Optional[str] = None, cost: float = 1.0,
+                  timeout: Optional[float] = None, priority: str = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+        """排队等到公平份额后执行 factory()；排队超时抛出 asyncio.TimeoutError，队列已满抛出 RateLimitError"""
+        if not self.enabled:
+            return await factory()
+        ticket = await self.acquire(user, tenant, provider, cost, timeout, priority)
+        try:
+            return await factory()
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, user: Any = None, tenant: Any = None, provider: Optional[str] = None,
+                      cost: float = 1.0, timeout: Optional[float] = None,
+                      priority: str = PRIORITY_INTERACTIVE) -> Ticket:
+        """获取执行名额，成功后必须调用 release(ticket)"""
+        if priority not in self._lanes:
+            priority = PRIORITY_INTERACTIVE
+        ticket = Ticket(str(user or 'anonymous'), str(tenant or DEFAULT_TENANT), priority, provider, max(cost, 0.01))
+        lane = self._lanes[priority]
+        with self._lock:
+            if lane.user_depth(ticket.tenant, ticket.user) >= self.settings.max_queue_per_user:
+                self.rejected += 1
+                raise RateLimitError(
+                    "Too many queued AI requests, please wait for earlier requests to finish",
+                    limit=self.settings.max_queue_per_user,
+                    details={'retry_after': 5}
+                )
+            lane.enqueue(ticket, self.settings)
+            self._dispatch()
+
+        max_wait = self.settings.background_max_queue_wait if priority == PRIORITY_BACKGROUND else self.settings.max_queue_wait
+        wait = max_wait if timeout is None else min(timeout, max_wait)
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            self._abandon(ticket)
+            if isinstance(e, asyncio.TimeoutError):
+                logger.warning(f"{priority} LLM request from {ticket.tenant}/{ticket.user} timed out after "
+                               f"{time.monotonic() - ticket.enqueued_at:.1f}s in queue")
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        """释放名额并派发后续请求"""
+        with self._lock:
+            self._finish(ticket)
+            self._dispatch()
+
+    # 以下方法调用方均持有锁
+
+    def _provider_has_capacity(self, ticket: Ticket) -> bool:
+        if not ticket.provider:
+            return True
+        limit = rate_limiters.get(ticket.provider).settings.max_concurrency
+        if limit <= 0:
+            return True
+        counts = self._provider_in_flight.get(ticket.provider, {})
+        if sum(counts.values()) >= limit:
+            return False
+        if ticket.priority == PRIORITY_BACKGROUND:
+            # 为交互请求保留提供商的其余并发
+            return counts.get(PRIORITY_BACKGROUND, 0) < max(1, int(limit * self.settings.background_provider_share))
+        return True
+
+    def _dispatch(self) -> None:
+        interactive = self._lanes[PRIORITY_INTERACTIVE]
+        background = self._lanes[PRIORITY_BACKGROUND]
+        while interactive.in_flight < self.settings.max_concurrency:
+            ticket = interactive.pick(self._provider_has_capacity)
+            if ticket is None:
+                break
+            self._grant_ticket(interactive, ticket)
+        # 有交互请求在排队时暂缓后台请求
+        if interactive.depth:
+            return
+        while background.in_flight < self.settings.background_max_concurrency:
+            ticket = background.pick(self._provider_has_capacity)
+            if ticket is None:
+                break
+            self._grant_ticket(background, ticket)
+
+    def _grant_ticket(self, lane: _Lane, ticket: Ticket) -> None:
+        ticket.granted = True
+        lane.in_flight += 1
+        lane.dispatched += 1
+        if ticket.provider:
+            counts = self._provider_in_flight.setdefault(ticket.provider, {})
+            counts[ticket.priority] = counts.get(ticket.priority, 0) + 1
+        waited = time.monotonic() - ticket.enqueued_at
+        lane.waits.append(waited)
+        stats = self._tenant_stats.setdefault(ticket.tenant, {'dispatched': 0, 'total_wait': 0.0, 'max_wait': 0.0})
+        stats['dispatched'] += 1
+        stats['total_wait'] += waited
+        stats['max_wait'] = max(stats['max_wait'], waited)
+        ticket.loop.call_soon_threadsafe(self._grant, ticket.future)
+
+    @staticmethod
+    def _grant(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(True)
+
+    def _finish(self, ticket: Ticket) -> None:
+        self._lanes[ticket.priority].in_flight -= 1
+        if ticket.provider:
+            self._provider_in_flight[ticket.provider][ticket.priority] -= 1
+
+    def _abandon(self, ticket: Ticket) -> None:
+        """调用方放弃等待：仍在排队则移出队列，已获得名额则归还"""
+        with self._lock:
+            if ticket.granted:
+                self._finish(ticket)
+            else:
+                lane = self._lanes[ticket.priority]
+                lane.timed_out += 1
+                lane.remove(ticket)
+            self._dispatch()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各通道队列深度与排队时间统计"""
+        with self._lock:
+            queued: Dict[str, Dict[str, int]] = {}
+            for lane in self._lanes.values():
+                for (tenant, _), tickets in lane.user_tickets.items():
+                    entry = queued.setdefault(tenant, {'queued_requests': 0, 'queued_users': 0})
+                    entry['queued_requests'] += len(tickets)
+                    entry['queued_users'] += 1
+            tenants = {
+                tenant: {
+                    'dispatched': int(stats['dispatched']),
+                    'avg_wait_ms': round(stats['total_wait'] / stats['dispatched'] * 1000, 1),
+                    'max_wait_ms': round(stats['max_wait'] * 1000, 1),
+                    **queued.get(tenant, {'queued_requests': 0, 'queued_users': 0})
+                }
+                for tenant, stats in self._tenant_stats.items()
+            }
+            lanes = {
+                PRIORITY_INTERACTIVE: self._lanes[PRIORITY_INTERACTIVE].get_stats(self.settings.max_concurrency),
+                PRIORITY_BACKGROUND: self._lanes[PRIORITY_BACKGROUND].get_stats(self.settings.background_max_concurrency)
+            }
+            return {
+                'enabled': self.settings.enabled,
+                'in_flight': sum(lane['in_flight'] for lane in lanes.values()),
+                'queue_depth': sum(lane['queue_depth'] for lane in lanes.values()),
+                'rejected': self.rejected,
+                'lanes': lanes,
+                'provider_in_flight': {p: dict(c) for p, c in self._provider_in_flight.items()},
+                'tenants': tenants
+            }
+
+
+# 全局实例
+llm_scheduler = LLMScheduler()
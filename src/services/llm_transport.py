@@ -0,0 +1,134 @@
+"""
+LLM HTTP传输层
+为所有LLM提供商提供共享的异步HTTP客户端，支持keep-alive连接池和HTTP/2
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import weakref
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Any, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 依赖 h2 包，未安装时自动退回 HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+@dataclass
+class HTTPPoolSettings:
+    """连接池配置"""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+    http2: bool = True
+
+    @classmethod
+    def from_env(cls) -> 'HTTPPoolSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            max_connections=int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', '100')),
+            max_keepalive_connections=int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', '20')),
+            keepalive_expiry=float(os.getenv('LLM_HTTP_KEEPALIVE_EXPIRY', '30')),
+            connect_timeout=float(os.getenv('LLM_HTTP_CONNECT_TIMEOUT', '10')),
+            read_timeout=float(os.getenv('LLM_HTTP_READ_TIMEOUT', '120')),
+            http2=os.getenv('LLM_HTTP2', 'true').lower() in ('1', 'true', 'yes')
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'HTTPPoolSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+class ProviderHTTPClientPool:
+    """按提供商划分的异步HTTP客户端池
+
+    每个提供商在每个事件循环上持有一个 httpx.AsyncClient。同一提供商的并发请求
+    共享该客户端的连接池，TCP/TLS握手只在建立连接时付出一次。
+    """
+
+    def __init__(self, settings: Optional[HTTPPoolSettings] = None):
+        self.default_settings = settings or HTTPPoolSettings.from_env()
+        self.provider_settings: Dict[str, HTTPPoolSettings] = {}
+        self._clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]' = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def configure(self, defaults: Optional[Dict[str, Any]] = None,
+                  overrides: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """配置默认连接池参数以及按提供商的覆盖参数"""
+        with self._lock:
+            self.default_settings = self.default_settings.merged(defaults)
+            for provider, provider_overrides in (overrides or {}).items():
+                self.provider_settings[provider] = self.default_settings.merged(provider_overrides)
+        logger.info(f"HTTP pool configured: {self.default_settings}, overrides for {list((overrides or {}).keys())}")
+
+    def get_settings(self, provider: str) -> HTTPPoolSettings:
+        """获取提供商的连接池配置"""
+        return self.provider_settings.get(provider, self.default_settings)
+
+    def get_client(self, provider: str) -> httpx.AsyncClient:
+        """获取当前事件循环上该提供商的共享客户端，不存在时创建"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._drop_closed_loops()
+            clients = self._clients.setdefault(loop, {})
+            client = clients.get(provider)
+            if client is None or client.is_closed:
+                client = self._create_client(provider)
+                clients[provider] = client
+        return client
+
+    def _create_client(self, provider: str) -> httpx.AsyncClient:
+        """按配置创建新的客户端"""
+        settings = self.get_settings(provider)
+        use_http2 = settings.http2 and HTTP2_AVAILABLE
+        if settings.http2 and not HTTP2_AVAILABLE:
+            logger.debug(f"h2 not installed, {provider} falls back to HTTP/1.1")
+
+        limits = httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry
+        )
+        timeout = httpx.Timeout(settings.read_timeout, connect=settings.connect_timeout)
+
+        logger.info(f"Creating pooled HTTP client for {provider} (http2={use_http2}, max_connections={settings.max_connections})")
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=use_http2)
+
+    def _drop_closed_loops(self) -> None:
+        """丢弃已关闭事件循环上的客户端（其连接已无法复用）"""
+        for loop in [l for l in self._clients.keys() if l.is_closed()]:
+            del self._clients[loop]
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环上的所有客户端"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._clients.pop(loop, {})
+        for client in clients.values():
+            await client.aclose()
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息"""
+        with self._lock:
+            providers = sorted({name for clients in self._clients.values() for name in clients})
+            return {
+                'event_loops': len(self._clients),
+                'providers': providers,
+                'http2_available': HTTP2_AVAILABLE,
+                'default_settings': self.default_settings.__dict__.copy()
+            }
+
+
+# 全局实例
+http_client_pool = ProviderHTTPClientPool()
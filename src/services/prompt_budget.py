@@ -0,0 +1,199 @@
+"""
+提示词 token 预算
+把提示词拆成带优先级的片段（回答要求、知识库内容、上下文信息……），按目标提供商的
+分词器近似估算 token 数，在配置的预算内按优先级分配：必需片段完整保留，其余片段依次
+占用剩余预算，放不下时截断（标注省略的部分）或整段丢弃，并统计节省的 token 数
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Callable, Dict, List, Optional
+
+from services.rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 必需片段的优先级：总是完整保留
+PRIORITY_REQUIRED = 0
+
+OMITTED_TAIL = "\n……（以下内容已省略）"
+OMITTED_MIDDLE = "\n……（中间内容已省略）……\n"
+
+
+@dataclass
+class PromptBudgetSettings:
+    """提示词预算配置"""
+    enabled: bool = True
+    max_prompt_tokens: int = 3000
+    min_section_tokens: int = 64    # 剩余预算低于该值时整段丢弃，不保留无意义的碎片
+    provider_budgets: Dict[str, int] = field(default_factory=dict)  # 按提供商覆盖 max_prompt_tokens
+
+    @classmethod
+    def from_env(cls) -> 'PromptBudgetSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            enabled=os.getenv('LLM_PROMPT_BUDGET_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            max_prompt_tokens=int(os.getenv('LLM_PROMPT_MAX_TOKENS', '3000'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'PromptBudgetSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+@dataclass
+class PromptSection:
+    """提示词片段：header 随片段保留或丢弃，只有 text 会被截断"""
+    name: str
+    text: str
+    priority: int = PRIORITY_REQUIRED   # 数值越大越先被截断
+    header: str = ''
+    keep_tail: bool = False             # 截断时保留首尾（对话上下文），否则只保留开头（已按相关性排序的内容）
+
+    def render(self) -> str:
+        return f"{self.header}{self.text}"
+
+
+@dataclass
+class BudgetedPrompt:
+    """预算分配结果"""
+    prompt: str
+    tokens: int
+    original_tokens: int
+    budget: int
+    truncated: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.tokens)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'tokens': self.tokens,
+            'original_tokens': self.original_tokens,
+            'budget': self.budget,
+            'tokens_saved': self.tokens_saved,
+            'truncated_sections': self.truncated,
+            'dropped_sections': self.dropped
+        }
+
+
+def truncate_to_tokens(text: str, max_tokens: int, provider: Optional[str] = None,
+                       keep_tail: bool = False) -> str:
+    """把文本截断到 max_tokens 以内（包括省略标记），keep_tail 时保留开头 2/3 和结尾 1/3"""
+    if estimate_tokens(text, provider) <= max_tokens:
+        return text
+    marker = OMITTED_MIDDLE if keep_tail else OMITTED_TAIL
+    available = max_tokens - estimate_tokens(marker, provider)
+    if available <= 0:
+        return ''
+    if not keep_tail:
+        return text[:_fit_prefix(text, available, provider)].rstrip() + marker
+    head = _fit_prefix(text, available * 2 // 3, provider)
+    tail_budget = available - estimate_tokens(text[:head], provider)
+    tail = _fit_prefix(text[head:][::-1], tail_budget, provider)
+    return text[:head].rstrip() + marker + (text[len(text) - tail:].lstrip() if tail else '')
+
+
+def _fit_prefix(text: str, max_tokens: int, provider: Optional[str]) -> int:
+    """满足 estimate_tokens(text[:n]) <= max_tokens 的最大 n（二分查找）"""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid], provider) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class PromptBudgeter:
+    """按优先级在 token 预算内组装提示词"""
+
+    def __init__(self, settings: Optional[PromptBudgetSettings] = None):
+        self.settings = settings or PromptBudgetSettings.from_env()
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.trimmed_prompts = 0
+        self.tokens_saved = 0
+
+    def configure(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        self.settings = self.settings.merged(overrides)
+        logger.info(f"Prompt budget: {self.settings}")
+
+    def budget_for(self, provider: Optional[str] = None) -> int:
+        return int(self.settings.provider_budgets.get(provider, self.settings.max_prompt_tokens)
+                   if provider else self.settings.max_prompt_tokens)
+
+    def build(self, sections: List[PromptSection], assemble: Callable[[List[str]], str],
+              provider: Optional[str] = None, budget: Optional[int] = None) -> BudgetedPrompt:
+        """
+        组装提示词：assemble 接收按原顺序渲染好的片段（被丢弃的片段不出现）返回完整提示词。
+        未超出预算时与不做预算控制的结果完全相同
+        """
+        budget = budget if budget is not None else self.budget_for(provider)
+        prompt = assemble([section.render() for section in sections])
+        original_tokens = estimate_tokens(prompt, provider)
+        result = BudgetedPrompt(prompt, original_tokens, original_tokens, budget)
+        if not self.settings.enabled or original_tokens <= budget:
+            self._record(result)
+            return result
+
+        rendered: Dict[int, str] = {}
+        required = [i for i, section in enumerate(sections) if section.priority == PRIORITY_REQUIRED]
+        for i in required:
+            rendered[i] = sections[i].render()
+        # 片段之间的分隔符按每段 1 token 预留
+        remaining = budget - estimate_tokens(assemble([rendered[i] for i in required]), provider) - len(sections)
+
+        optional = sorted((i for i, section in enumerate(sections) if section.priority != PRIORITY_REQUIRED),
+                          key=lambda i: (sections[i].priority, i))
+        for i in optional:
+            section = sections[i]
+            cost = estimate_tokens(section.render(), provider)
+            if cost <= remaining:
+                rendered[i] = section.render()
+                remaining -= cost
+                continue
+            text_budget = remaining - estimate_tokens(section.header, provider)
+            if text_budget >= self.settings.min_section_tokens:
+                rendered[i] = section.header + truncate_to_tokens(section.text, text_budget, provider, section.keep_tail)
+                remaining -= estimate_tokens(rendered[i], provider)
+                result.truncated.append(section.name)
+            else:
+                result.dropped.append(section.name)
+
+        result.prompt = assemble([rendered[i] for i in sorted(rendered)])
+        result.tokens = estimate_tokens(result.prompt, provider)
+        logger.info(
+            f"Prompt trimmed to budget {budget} for {provider or 'auto'}: {original_tokens} -> {result.tokens} tokens "
+            f"(truncated {result.truncated}, dropped {result.dropped})"
+        )
+        self._record(result)
+        return result
+
+    def _record(self, result: BudgetedPrompt) -> None:
+        with self._lock:
+            self.prompts += 1
+            if result.tokens_saved:
+                self.trimmed_prompts += 1
+                self.tokens_saved += result.tokens_saved
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.settings.enabled,
+            'max_prompt_tokens': self.settings.max_prompt_tokens,
+            'prompts': self.prompts,
+            'trimmed_prompts': self.trimmed_prompts,
+            'tokens_saved': self.tokens_saved
+        }
+
+
+# 全局实例
+prompt_budgeter = PromptBudgeter()
@@ -0,0 +1,171 @@
+"""
+LLM提供商健康状态注册表
+后台周期性探测所有已注册的提供商，记录可用状态和最近延迟，
+请求路径上的路由和备用决策只读取内存状态，不再发起网络请求
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from services.async_runtime import async_runtime
+
+logger = logging.getLogger(__name__)
+
+STATUS_UNKNOWN = 'unknown'
+STATUS_UP = 'up'
+STATUS_DOWN = 'down'
+
+
+@dataclass
+class ProviderHealth:
+    """单个提供商的健康状态"""
+    name: str
+    status: str = STATUS_UNKNOWN
+    last_checked: Optional[float] = None
+    last_error: Optional[str] = None
+    consecutive_failures: int = 0
+    recent_latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=10))
+
+    @property
+    def latency_ms(self) -> Optional[float]:
+        """最近一次探测延迟（毫秒）"""
+        return self.recent_latencies[-1] if self.recent_latencies else None
+
+    @property
+    def avg_latency_ms(self) -> Optional[float]:
+        """最近若干次探测的平均延迟（毫秒）"""
+        if not self.recent_latencies:
+            return None
+        return sum(self.recent_latencies) / len(self.recent_latencies)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'status': self.status,
+            'last_checked': self.last_checked,
+            'last_error': self.last_error,
+            'consecutive_failures': self.consecutive_failures,
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'avg_latency_ms': round(self.avg_latency_ms, 1) if self.avg_latency_ms is not None else None
+        }
+
+
+class ProviderHealthRegistry:
+    """提供商健康状态注册表
+
+    每个提供商注册一个异步探测函数（返回 True 表示健康），后台任务按固定间隔并发探测。
+    is_available() 只做一次字典查找；尚未探测过的提供商视为可用。
+    """
+
+    def __init__(self, interval: float = 30.0, timeout: float = 5.0, failure_threshold: int = 1):
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self._probes: Dict[str, Callable[[], Awaitable[bool]]] = {}
+        self._health: Dict[str, ProviderHealth] = {}
+        self._enabled = False
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, probe: Callable[[], Awaitable[bool]]) -> None:
+        """注册提供商及其探测函数"""
+        self._probes[name] = probe
+        self._health.setdefault(name, ProviderHealth(name=name))
+
+    def start(self, interval: Optional[float] = None, timeout: Optional[float] = None,
+              failure_threshold: Optional[int] = None) -> None:
+        """启动后台探测（fork 后在子进程中首次使用时自动重启）"""
+        if interval is not None:
+            self.interval = float(interval)
+        if timeout is not None:
+            self.timeout = float(timeout)
+        if failure_threshold is not None:
+            self.failure_threshold = max(1, int(failure_threshold))
+        self._enabled = self.interval > 0
+        self._ensure_running()
+
+    def _ensure_running(self) -> None:
+        if not self._enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if async_runtime.enabled:
+                async_runtime.submit(self._probe_loop())
+            else:
+                # per_request 模式没有长期事件循环，探测在独立线程的私有循环上运行
+                threading.Thread(
+                    target=asyncio.run, args=(self._probe_loop(),),
+                    name='alethea-provider-health', daemon=True
+                ).start()
+        logger.info(f"Provider health probing started (interval={self.interval}s, providers={list(self._probes)})")
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(self.interval)
+
+    async def probe_all(self) -> None:
+        """并发探测所有提供商"""
+        await asyncio.gather(*(self._probe(name, probe) for name, probe in list(self._probes.items())))
+
+    async def _probe(self, name: str, probe: Callable[[], Awaitable[bool]]) -> None:
+        start = time.monotonic()
+        try:
+            healthy = await asyncio.wait_for(probe(), self.timeout)
+            error = None if healthy else 'probe reported unhealthy'
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            healthy = False
+            error = str(e) or type(e).__name__
+        self.record_result(name, healthy, (time.monotonic() - start) * 1000, error)
+
+    def record_result(self, name: str, healthy: bool, latency_ms: Optional[float] = None,
+                      error: Optional[str] = None) -> None:
+        """记录一次探测结果"""
+        health = self._health.setdefault(name, ProviderHealth(name=name))
+        previous = health.status
+        health.last_checked = time.time()
+        if healthy:
+            health.consecutive_failures = 0
+            health.last_error = None
+            health.status = STATUS_UP
+            if latency_ms is not None:
+                health.recent_latencies.append(latency_ms)
+        else:
+            health.consecutive_failures += 1
+            health.last_error = error
+            if health.consecutive_failures >= self.failure_threshold:
+                health.status = STATUS_DOWN
+
+        if health.status != previous and previous != STATUS_UNKNOWN:
+            logger.warning(f"Provider {name} is now {health.status}" + (f": {error}" if error else ""))
+
+    def is_available(self, name: str) -> bool:
+        """提供商当前是否可用（O(1)，不发起网络请求）"""
+        self._ensure_running()
+        health = self._health.get(name)
+        return health is None or health.status != STATUS_DOWN
+
+    def get_health(self, name: str) -> Optional[ProviderHealth]:
+        """获取提供商的健康记录"""
+        return self._health.get(name)
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有提供商的健康状态"""
+        self._ensure_running()
+        return {name: health.to_dict() for name, health in self._health.items()}
+
+
+# 全局实例
+provider_health = ProviderHealthRegistry(
+    interval=float(os.getenv('LLM_HEALTH_INTERVAL', '30')),
+    timeout=float(os.getenv('LLM_HEALTH_TIMEOUT', '5'))
+)
@@ -0,0 +1,173 @@
+"""
+LLM提供商调用统计
+记录每个提供商最近成功调用的耗时，用于计算延迟分位数（对冲请求的触发时机等）；
+同时按提供商和模型维护延迟、首 token 时间（TTFT）和错误率的指数加权移动平均（EWMA），
+供 ModelSelector 在自动选择模型时优先选择当前最快、最健康的服务
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, fields, replace
+from typing import Any, Deque, Dict, Optional, Tuple
+
+
+@dataclass
+class RoutingSettings:
+    """自适应路由配置：EWMA 参数与各项统计在提供商评分中的权重"""
+    alpha: float = 0.2                 # EWMA 平滑系数，越大越偏重最近的调用
+    min_samples: int = 3               # 样本数不足时不参与评分
+    stale_after: float = 300.0         # 统计的影响随时间衰减（秒），长期无调用的提供商回到中性
+    latency_weight: float = 1.0        # 每 latency_reference 秒延迟扣分
+    latency_reference: float = 5.0
+    ttft_weight: float = 0.5           # 每 ttft_reference 秒首 token 时间扣分
+    ttft_reference: float = 2.0
+    error_weight: float = 3.0          # 错误率（0~1）扣分
+    max_penalty: float = 5.0
+
+    @classmethod
+    def from_env(cls) -> 'RoutingSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            alpha=float(os.getenv('LLM_ROUTING_EWMA_ALPHA', '0.2')),
+            latency_weight=float(os.getenv('LLM_ROUTING_LATENCY_WEIGHT', '1.0')),
+            ttft_weight=float(os.getenv('LLM_ROUTING_TTFT_WEIGHT', '0.5')),
+            error_weight=float(os.getenv('LLM_ROUTING_ERROR_WEIGHT', '3.0'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'RoutingSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+class _Ewma:
+    """一个提供商（或提供商+模型）的 EWMA 统计"""
+    __slots__ = ('latency', 'ttft', 'error_rate', 'samples', 'ttft_samples', 'updated_at')
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.ttft_samples = 0
+        self.updated_at = 0.0
+
+    def update(self, alpha: float, seconds: float, success: bool, ttft: Optional[float]) -> None:
+        self.samples += 1
+        self.updated_at = time.monotonic()
+        self.error_rate += alpha * ((0.0 if success else 1.0) - self.error_rate)
+        if success:
+            # 失败调用的耗时（超时、快速报错）不代表服务速度，只计入错误率
+            self.latency = seconds if self.latency is None else self.latency + alpha * (seconds - self.latency)
+        if ttft is not None:
+            self.ttft_samples += 1
+            self.ttft = ttft if self.ttft is None else self.ttft + alpha * (ttft - self.ttft)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.samples,
+            'ewma_latency_seconds': round(self.latency, 3) if self.latency is not None else None,
+            'ewma_ttft_seconds': round(self.ttft, 3) if self.ttft is not None else None,
+            'ewma_error_rate': round(self.error_rate, 3)
+        }
+
+
+class ProviderStats:
+    """按提供商统计最近调用延迟"""
+
+    def __init__(self, window: int = 100, settings: Optional[RoutingSettings] = None):
+        self.window = window
+        self.settings = settings or RoutingSettings.from_env()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._ewma: Dict[Tuple[str, Optional[str]], _Ewma] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        self.settings = self.settings.merged(overrides)
+
+    def record_latency(self, provider: str, seconds: float) -> None:
+        """记录一次成功调用的耗时（秒）"""
+        with self._lock:
+            samples = self._latencies.get(provider)
+            if samples is None:
+                samples = self._latencies[provider] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def record_call(self, provider: str, model: Optional[str], seconds: float,
+                    success: bool, ttft: Optional[float] = None) -> None:
+        """记录一次调用结果：更新提供商级和模型级 EWMA，成功调用同时计入延迟分位数"""
+        if success:
+            self.record_latency(provider, seconds)
+        alpha = self.settings.alpha
+        with self._lock:
+            for key in ((provider, None), (provider, model)) if model else ((provider, None),):
+                stats = self._ewma.get(key)
+                if stats is None:
+                    stats = self._ewma[key] = _Ewma()
+                stats.update(alpha, seconds, success, ttft)
+
+    def sample_count(self, provider: str) -> int:
+        samples = self._latencies.get(provider)
+        return len(samples) if samples else 0
+
+    def percentile(self, provider: str, q: float) -> Optional[float]:
+        """最近调用耗时的分位数（q 取 0~1），无样本时返回 None"""
+        with self._lock:
+            samples = self._latencies.get(provider)
+            if not samples:
+                return None
+            ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def routing_penalty(self, provider: str, model: Optional[str] = None) -> float:
+        """
+        根据 EWMA 延迟、TTFT 和错误率计算的评分扣分（>= 0）。
+        优先使用模型级统计，样本不足时退回提供商级；统计随时间衰减，
+        避免被冷落的提供商因陈旧数据永远得不到流量
+        """
+        s = self.settings
+        with self._lock:
+            stats = self._ewma.get((provider, model)) if model else None
+            if stats is None or stats.samples < s.min_samples:
+                stats = self._ewma.get((provider, None))
+            if stats is None or stats.samples < s.min_samples:
+                return 0.0
+            latency, ttft, error_rate, updated_at = stats.latency, stats.ttft, stats.error_rate, stats.updated_at
+
+        penalty = s.error_weight * error_rate
+        if latency is not None:
+            penalty += s.latency_weight * latency / s.latency_reference
+        if ttft is not None:
+            penalty += s.ttft_weight * ttft / s.ttft_reference
+        freshness = math.exp(-(time.monotonic() - updated_at) / s.stale_after) if s.stale_after > 0 else 1.0
+        return min(penalty, s.max_penalty) * freshness
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有提供商的延迟统计"""
+        result = {}
+        for provider in set(self._latencies) | {key[0] for key in list(self._ewma)}:
+            p50 = self.percentile(provider, 0.5)
+            p95 = self.percentile(provider, 0.95)
+            result[provider] = {
+                'samples': self.sample_count(provider),
+                'p50_seconds': round(p50, 3) if p50 is not None else None,
+                'p95_seconds': round(p95, 3) if p95 is not None else None,
+                'routing_penalty': round(self.routing_penalty(provider), 3)
+            }
+        with self._lock:
+            for (provider, model), stats in list(self._ewma.items()):
+                if model is None:
+                    result[provider].update(stats.to_dict())
+                else:
+                    result[provider].setdefault('models', {})[model] = stats.to_dict()
+        return result
+
+
+# 全局实例
+provider_stats = ProviderStats()
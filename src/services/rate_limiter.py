@@ -0,0 +1,284 @@
+"""
+LLM提供商限流
+每个提供商一组令牌桶（每分钟请求数 RPM、每分钟 token 数 TPM）和一个并发上限。
+超出限制的调用在请求截止时间内短暂排队，等待时间不够时立即抛出 RateLimitError，
+使吞吐稳定在提供商的持续上限，而不是触发上游 429 后在备用服务间来回切换
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, fields, replace
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from utils.error_handler import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+
+# 各提供商分词器的近似比例：(每个中日韩字符的 token 数, 每个其他字符的 token 数)。
+# 针对中文优化的分词器（DeepSeek、通义千问、文心、混元、GLM、Kimi）一个汉字通常不到 1 个 token
+DEFAULT_TOKEN_RATIO = (1.0, 0.25)
+TOKEN_RATIOS: Dict[str, Tuple[float, float]] = {
+    'openai': (1.0, 0.25),
+    'claude': (1.3, 0.29),
+    'gemini': (0.8, 0.25),
+    'llama': (1.5, 0.27),
+    'deepseek': (0.6, 0.3),
+    'volces_deepseek': (0.6, 0.3),
+    'ollama_deepseek': (0.6, 0.3),
+    'ali_qwen': (0.7, 0.27),
+    'baidu': (0.7, 0.27),
+    'tencent_hunyuan': (0.7, 0.27),
+    'zhipu_ai': (0.7, 0.27),
+    'moonshot_ai': (0.7, 0.27)
+}
+
+
+def estimate_tokens(text: str, provider: Optional[str] = None) -> int:
+    """
+    粗略估算 token 数（本地近似，不调用分词器）：默认中日韩字符约 1 字 1 token，
+    其余字符约 4 字符 1 token；指定 provider 时使用该提供商分词器的近似比例
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if '　' <= ch <= '鿿' or '豈' <= ch <= '﫿')
+    per_cjk, per_other = TOKEN_RATIOS.get(provider, DEFAULT_TOKEN_RATIO) if provider else DEFAULT_TOKEN_RATIO
+    return math.ceil(cjk * per_cjk + (len(text) - cjk) * per_other)
+
+
+@dataclass
+class RateLimitSettings:
+    """限流配置（0 表示不限制）"""
+    requests_per_minute: float = 0
+    tokens_per_minute: float = 0
+    max_concurrency: int = 32
+    burst_seconds: float = 10.0   # 令牌桶容量 = 该时长内的配额
+    max_queue_wait: float = 5.0   # 排队等待上限（同时受请求截止时间约束）
+
+    @classmethod
+    def from_env(cls) -> 'RateLimitSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            requests_per_minute=float(os.getenv('LLM_RATE_RPM', '0')),
+            tokens_per_minute=float(os.getenv('LLM_RATE_TPM', '0')),
+            max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '32')),
+            max_queue_wait=float(os.getenv('LLM_RATE_MAX_WAIT', '5'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'RateLimitSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+class TokenBucket:
+    """令牌桶（线程安全，可在多个事件循环中等待）"""
+
+    def __init__(self, name: str, per_minute: float, burst_seconds: float):
+        self.name = name
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def take(self, amount: float, timeout: float) -> None:
+        """取出 amount 个令牌；需要等待的时间超过 timeout 时抛出 RateLimitError"""
+        if self.unlimited:
+            return
+        # 单次请求超过桶容量时按满桶处理，避免永远无法满足
+        amount = min(amount, self.capacity)
+        give_up_at = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            if time.monotonic() + wait > give_up_at:
+                raise RateLimitError(
+                    f"Rate limit exceeded for {self.name}",
+                    limit=int(self.per_minute),
+                    details={'retry_after': round(wait, 2)}
+                )
+            await asyncio.sleep(wait)
+
+    def refund(self, amount: float) -> None:
+        """归还未使用的令牌"""
+        if self.unlimited:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ConcurrencyLimiter:
+    """跨事件循环的 FIFO 并发限制器（0 表示不限制）"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: Optional[float] = None) -> bool:
+        """获取一个并发名额，超时返回 False"""
+        if self.limit <= 0:
+            with self._lock:
+                self.active += 1
+            return True
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                still_waiting = waiter in self._waiters
+                if still_waiting:
+                    self._waiters.remove(waiter)
+            if not still_waiting:
+                # 名额已移交给本调用方（或正在移交），放弃时归还
+                waiter[1].add_done_callback(lambda _: self.release())
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+
+    def release(self) -> None:
+        """释放名额：直接移交给最早的等待者"""
+        with self._lock:
+            if self.limit > 0 and self._waiters:
+                loop, future = self._waiters.popleft()
+                loop.call_soon_threadsafe(self._grant, future)
+                return
+            self.active -= 1
+
+    @staticmethod
+    def _grant(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(True)
+
+
+class ProviderRateLimiter:
+    """单个提供商的 RPM/TPM 令牌桶与并发上限"""
+
+    def __init__(self, name: str, settings: RateLimitSettings):
+        self.name = name
+        self.settings = settings
+        self.requests = TokenBucket(f"{name} (requests/min)", settings.requests_per_minute, settings.burst_seconds)
+        self.tokens = TokenBucket(f"{name} (tokens/min)", settings.tokens_per_minute, settings.burst_seconds)
+        self.concurrency = ConcurrencyLimiter(settings.max_concurrency)
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    async def acquire(self, tokens: int, timeout: Optional[float] = None) -> None:
+        """
+        按 RPM → TPM → 并发 的顺序获取许可，总等待不超过 timeout
+        （默认 max_queue_wait）；拿不到时抛出 RateLimitError。成功后必须调用 release()
+        """
+        budget = self.settings.max_queue_wait if timeout is None else min(timeout, self.settings.max_queue_wait)
+        start = time.monotonic()
+        try:
+            await self.requests.take(1, budget)
+            try:
+                await self.tokens.take(tokens, max(0.0, budget - (time.monotonic() - start)))
+            except BaseException:
+                self.requests.refund(1)
+                raise
+            if not await self.concurrency.acquire(max(0.0, budget - (time.monotonic() - start))):
+                self.requests.refund(1)
+                self.tokens.refund(tokens)
+                raise RateLimitError(
+                    f"Too many concurrent requests to {self.name}",
+                    limit=self.settings.max_concurrency,
+                    details={'retry_after': 1}
+                )
+        except RateLimitError:
+            self.rejected += 1
+            raise
+        self.admitted += 1
+        self.total_wait += time.monotonic() - start
+
+    def release(self) -> None:
+        self.concurrency.release()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'requests_per_minute': self.settings.requests_per_minute,
+            'tokens_per_minute': self.settings.tokens_per_minute,
+            'max_concurrency': self.settings.max_concurrency,
+            'in_flight': self.concurrency.active,
+            'queued': self.concurrency.queued,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'avg_wait_ms': round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0
+        }
+
+
+class RateLimiterRegistry:
+    """按提供商管理限流器"""
+
+    def __init__(self, settings: Optional[RateLimitSettings] = None):
+        self.default_settings = settings or RateLimitSettings.from_env()
+        self.provider_settings: Dict[str, RateLimitSettings] = {}
+        self._limiters: Dict[str, ProviderRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, defaults: Optional[Dict[str, Any]] = None,
+                  overrides: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """配置默认参数以及按提供商的覆盖参数（已创建的限流器会被重建）"""
+        with self._lock:
+            self.default_settings = self.default_settings.merged(defaults)
+            for provider, provider_overrides in (overrides or {}).items():
+                self.provider_settings[provider] = self.default_settings.merged(provider_overrides)
+            self._limiters.clear()
+        logger.info(f"Rate limits configured: {self.default_settings}, overrides for {list((overrides or {}).keys())}")
+
+    def get(self, provider: str) -> ProviderRateLimiter:
+        """获取提供商的限流器，不存在时创建"""
+        limiter = self._limiters.get(provider)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(provider)
+                if limiter is None:
+                    settings = self.provider_settings.get(provider, self.default_settings)
+                    limiter = ProviderRateLimiter(provider, settings)
+                    self._limiters[provider] = limiter
+        return limiter
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: limiter.to_dict() for name, limiter in list(self._limiters.items())}
+
+
+# 全局实例
+rate_limiters = RateLimiterRegistry()
@@ -0,0 +1,184 @@
+"""
+提前刷新缓存（refresh-ahead）
+按键缓存异步加载的值（访问令牌、模型列表等），每个值带有自己的有效期：
+进入过期前的刷新窗口后，读取仍立即返回缓存值，同时在后台发起一次刷新；
+同一键的并发刷新只会向上游发出一次请求。结果通过 concurrent.futures.Future
+共享，因此在多个事件循环之间同样有效。开启 stale_on_error 时，上游故障期间
+继续返回已过期的旧值
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 加载函数：返回 (值, 有效期秒数)
+Loader = Callable[[], Awaitable[Tuple[Any, float]]]
+
+
+class _Entry:
+    __slots__ = ('value', 'expires_at', 'refresh_at')
+
+    def __init__(self, value: Any, expires_at: float, refresh_at: float):
+        self.value = value
+        self.expires_at = expires_at
+        self.refresh_at = refresh_at
+
+
+class RefreshAheadCache:
+    """带提前后台刷新和并发刷新合并的异步值缓存"""
+
+    def __init__(self, name: str, refresh_ahead: float = 0.1, max_refresh_ahead: Optional[float] = None,
+                 retry_after: float = 30.0, stale_on_error: bool = False):
+        """
+        Args:
+            name: 名称（用于日志和统计）
+            refresh_ahead: 刷新窗口占有效期的比例，例如 0.1 表示剩余 10% 有效期时开始后台刷新
+            max_refresh_ahead: 刷新窗口的上限（秒），None 表示不限制
+            retry_after: 后台刷新失败后，间隔多久（秒）再次尝试
+            stale_on_error: 值过期后是否继续返回旧值、在后台刷新（上游故障期间一直使用旧值）
+        """
+        self.name = name
+        self.refresh_ahead = refresh_ahead
+        self.max_refresh_ahead = max_refresh_ahead
+        self.retry_after = retry_after
+        self.stale_on_error = stale_on_error
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._refreshing: Dict[Hashable, concurrent.futures.Future] = {}
+        self._tasks: Set[asyncio.Future] = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.background_refreshes = 0
+        self.failures = 0
+        self.stale_served = 0
+
+    async def get(self, key: Hashable, loader: Loader, timeout: Optional[float] = None) -> Any:
+        """
+        获取键对应的值：未过期时直接返回（处于刷新窗口内则顺带触发后台刷新），
+        缺失或已过期时等待加载（与进行中的刷新合并）。开启 stale_on_error 时已过期的值
+        同样直接返回并在后台刷新。加载失败时抛出加载函数的异常，
+        timeout 只限制当前调用方的等待时间
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and (now < entry.expires_at or self.stale_on_error):
+            self.hits += 1
+            if now >= entry.expires_at:
+                self.stale_served += 1
+            if now >= entry.refresh_at:
+                self._start_refresh(key, loader, background=True)
+            return entry.value
+
+        shared = self._start_refresh(key, loader)
+        # shield：当前调用方超时或被取消不会中断共享的加载
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(shared)), timeout)
+
+    async def refresh(self, key: Hashable, loader: Loader) -> Any:
+        """立即重新加载（与进行中的刷新合并）并返回新值，用于同步调用方在后台触发刷新"""
+        shared = self._start_refresh(key, loader, background=True)
+        return await asyncio.shield(asyncio.wrap_future(shared))
+
+    def lookup(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """
+        同步读取，不触发加载：返回 (缓存值或 None, 是否无需刷新)。
+        值已过期但开启了 stale_on_error 时仍会返回旧值
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        now = time.monotonic()
+        if now >= entry.expires_at:
+            if not self.stale_on_error:
+                return None, False
+            self.stale_served += 1
+        self.hits += 1
+        return entry.value, now < entry.refresh_at
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        """直接写入一个值（例如加载失败时的兜底值），ttl 秒后需要重新加载"""
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = _Entry(value, now + ttl, now + ttl)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """删除某个键（None 表示全部），下一次读取会重新加载"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _start_refresh(self, key: Hashable, loader: Loader, background: bool = False) -> concurrent.futures.Future:
+        """发起加载，或返回同一键进行中的加载"""
+        with self._lock:
+            shared = self._refreshing.get(key)
+            if shared is not None:
+                return shared
+            shared = concurrent.futures.Future()
+            self._refreshing[key] = shared
+            if background:
+                self.background_refreshes += 1
+            else:
+                self.loads += 1
+
+        task = asyncio.ensure_future(self._load(key, loader))
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._settle(key, shared, t))
+        return shared
+
+    async def _load(self, key: Hashable, loader: Loader) -> Any:
+        try:
+            value, ttl = await loader()
+        except Exception as e:
+            self.failures += 1
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    # 失败后继续使用旧值（未过期，或开启了 stale_on_error），稍后再试，避免每次读取都打到上游
+                    retry_at = time.monotonic() + self.retry_after
+                    entry.refresh_at = retry_at if self.stale_on_error else min(entry.expires_at, retry_at)
+            logger.warning(f"Refreshing {self.name} failed: {str(e)}")
+            raise
+
+        ttl = max(0.0, float(ttl))
+        window = ttl * self.refresh_ahead
+        if self.max_refresh_ahead is not None:
+            window = min(window, self.max_refresh_ahead)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = _Entry(value, now + ttl, now + ttl - window)
+        return value
+
+    def _settle(self, key: Hashable, shared: concurrent.futures.Future, task: asyncio.Future) -> None:
+        """加载结束：移除进行中的记录并把结果或异常传给所有等待者"""
+        self._tasks.discard(task)
+        with self._lock:
+            if self._refreshing.get(key) is shared:
+                del self._refreshing[key]
+        if task.cancelled():
+            shared.cancel()
+        elif task.exception() is not None:
+            shared.set_exception(task.exception())
+        else:
+            shared.set_result(task.result())
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._entries.values())
+            refreshing = len(self._refreshing)
+        return {
+            'entries': len(entries),
+            'expired': sum(1 for entry in entries if now >= entry.expires_at),
+            'refreshing': refreshing,
+            'hits': self.hits,
+            'loads': self.loads,
+            'background_refreshes': self.background_refreshes,
+            'failures': self.failures,
+            'stale_served': self.stale_served
+        }
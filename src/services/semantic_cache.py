@@ -0,0 +1,346 @@
+"""
+语义近似问题缓存
+在本地把问题编码为字符 n-gram 哈希向量（NumPy，无需网络或模型），
+查找余弦相似度超过阈值的已缓存问题并复用其回答，使“欧姆定律是什么”与
+“请解释欧姆定律”这类同义改写也能命中缓存。
+只差一个关键字的问题（串联/并联、低通/高通、一阶/二阶）在 n-gram 向量上同样很接近，
+因此命中前还要求两个问题的学科关键词相同、且没有互相替换的字词，宁可不命中也不返回错误的回答。
+缓存较小时用矩阵乘法暴力检索，较大时用随机超平面 LSH 近似索引
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from services.keyword_engine import keyword_engine
+
+logger = logging.getLogger(__name__)
+
+# 问句中不影响语义的套话，规范化时去除（长的在前，避免部分匹配）
+QUESTION_FILLERS = sorted([
+    '请问', '请解释一下', '请解释', '解释一下', '请介绍一下', '请介绍', '介绍一下', '请说明一下', '请说明',
+    '说明一下', '请讲一下', '讲一下', '请简述', '简述一下', '简述', '帮我', '告诉我', '能否', '可以',
+    '什么是', '是什么意思', '什么意思', '的意思', '是什么', '什么叫', '是指什么', '指的是什么', '是啥', '啥是',
+    '的含义', '的定义', '如何', '怎么样', '怎么', '怎样',
+    '一下', '吗', '呢', '呀', '啊',
+    'please', 'explain', 'what is', 'what are', 'tell me about', 'define'
+], key=len, reverse=True)
+_FILLER_PATTERN = re.compile('|'.join(re.escape(f) for f in QUESTION_FILLERS))
+
+# 词项：ASCII 字母数字串整体作为一项（如 10k、npn、pid），其余每个字符一项
+_TERM_PATTERN = re.compile(r'[a-z0-9]+|[^a-z0-9]')
+# 比较两个问题的差异时忽略的虚词
+_FUNCTION_CHARS = frozenset('的了地得之里')
+# 相似度超过阈值的候选中，最多检查这么多个是否通过差异检查
+_MAX_GUARD_CANDIDATES = 5
+
+
+@dataclass
+class SemanticCacheSettings:
+    """语义缓存配置"""
+    enabled: bool = False
+    similarity_threshold: float = 0.92   # 实测只差一个关键字的问题对最高 0.894（低通/高通滤波器）
+    max_entries: int = 5000
+    ttl_seconds: float = 86400.0
+    dim: int = 1024
+    brute_force_limit: int = 1024   # 条目数不超过该值时暴力检索
+    lsh_tables: int = 6
+    lsh_bits: int = 10
+
+    @classmethod
+    def from_env(cls) -> 'SemanticCacheSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            enabled=os.getenv('LLM_SEMANTIC_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+            similarity_threshold=float(os.getenv('LLM_SEMANTIC_CACHE_THRESHOLD', '0.92')),
+            max_entries=int(os.getenv('LLM_SEMANTIC_CACHE_MAX_ENTRIES', '5000')),
+            ttl_seconds=float(os.getenv('LLM_SEMANTIC_CACHE_TTL', '86400'))
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'SemanticCacheSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+def normalize_question(text: str) -> str:
+    """规范化问题：NFKC、小写、去掉标点空白和问句套话"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = _FILLER_PATTERN.sub('', text)
+    return ''.join(ch for ch in text if not unicodedata.category(ch).startswith(('P', 'Z', 'S', 'C')))
+
+
+def question_terms(text: str) -> FrozenSet[str]:
+    """规范化问题中的内容词项（去掉虚词）"""
+    return frozenset(t for t in _TERM_PATTERN.findall(normalize_question(text)) if t not in _FUNCTION_CHARS)
+
+
+def question_keywords(text: str) -> FrozenSet[str]:
+    """问题命中的学科关键词（在规范化后的问题上匹配，避免英文套话中的 ai 等误命中）"""
+    return keyword_engine.scan(normalize_question(text))
+
+
+def is_same_question(terms: FrozenSet[str], keywords: FrozenSet[str],
+                     other_terms: FrozenSet[str], other_keywords: FrozenSet[str]) -> bool:
+    """
+    相似度达到阈值的两个问题是否可以共用回答：学科关键词必须相同，
+    且不能双方各有对方没有的词项（即有字词被替换，如“串联”与“并联”）
+    """
+    if keywords != other_keywords:
+        return False
+    return not (terms - other_terms) or not (other_terms - terms)
+
+
+class NgramHashEmbedder:
+    """字符 n-gram 特征哈希向量（带符号哈希，L2 归一化）"""
+
+    def __init__(self, dim: int = 1024, ngram_sizes: Tuple[int, ...] = (1, 2, 3)):
+        self.dim = dim
+        self.ngram_sizes = ngram_sizes
+
+    def embed(self, text: str) -> np.ndarray:
+        normalized = normalize_question(text)
+        indices: List[int] = []
+        weights: List[float] = []
+        for n in self.ngram_sizes:
+            for i in range(len(normalized) - n + 1):
+                h = zlib.crc32(normalized[i:i + n].encode('utf-8'))
+                indices.append(h % self.dim)
+                # 较长的 n-gram 携带更多词序信息，权重更高
+                weights.append(float(n) if h & 0x80000000 else -float(n))
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if indices:
+            np.add.at(vector, np.asarray(indices), np.asarray(weights, dtype=np.float32))
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+        return vector
+
+
+@dataclass
+class SemanticCacheEntry:
+    question: str
+    scope: str
+    response: Dict[str, Any]
+    expires_at: float
+    buckets: Tuple[int, ...] = ()
+    terms: FrozenSet[str] = frozenset()
+    keywords: FrozenSet[str] = frozenset()
+
+
+class SemanticCache:
+    """语义近似问题缓存（线程安全）
+
+    向量按槽位存放在一个按需扩容的矩阵中，空闲槽位复用；LRU 顺序和写入顺序（TTL 固定，
+    即过期顺序）各由一个 OrderedDict 维护，写入时从过期队列头部清理过期条目。
+    scope 用于隔离不同提供商、个性化设置或知识库上下文下的回答。
+    """
+
+    def __init__(self, settings: Optional[SemanticCacheSettings] = None):
+        self.settings = settings or SemanticCacheSettings.from_env()
+        self._lock = threading.Lock()
+        self._reset()
+        self.hits = 0
+        self.misses = 0
+        self.lsh_lookups = 0
+        self.guard_rejections = 0
+
+    def _reset(self) -> None:
+        s = self.settings
+        self.embedder = NgramHashEmbedder(dim=s.dim)
+        self._vectors = np.zeros((min(256, s.max_entries), s.dim), dtype=np.float32)
+        self._scope_ids = np.zeros(len(self._vectors), dtype=np.int64)
+        self._expires = np.zeros(len(self._vectors), dtype=np.float64)  # 0 表示空槽位
+        self._entries: List[Optional[SemanticCacheEntry]] = [None] * len(self._vectors)
+        self._free: List[int] = list(range(len(self._vectors) - 1, -1, -1))
+        self._lru: 'OrderedDict[int, None]' = OrderedDict()
+        self._expiry: 'OrderedDict[int, None]' = OrderedDict()
+        rng = np.random.default_rng(20240601)
+        self._planes = rng.standard_normal((s.lsh_tables, s.lsh_bits, s.dim)).astype(np.float32)
+        self._bit_weights = (1 << np.arange(s.lsh_bits)).astype(np.int64)
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(s.lsh_tables)]
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    def configure(self, overrides: Optional[Dict[str, Any]] = None) -> None:
+        """更新配置（清空已有条目）"""
+        with self._lock:
+            self.settings = self.settings.merged(overrides)
+            self._reset()
+        logger.info(f"Semantic cache configured: {self.settings}")
+
+    @staticmethod
+    def make_scope(*parts: Any) -> str:
+        """由影响回答的上下文（提供商、设置、提示词模板等）生成 scope"""
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _scope_id(scope: str) -> int:
+        return int(hashlib.sha1(scope.encode('utf-8')).hexdigest()[:15], 16)
+
+    def _signatures(self, vector: np.ndarray) -> Tuple[int, ...]:
+        bits = (self._planes @ vector) > 0
+        return tuple(int(x) for x in bits.astype(np.int64) @ self._bit_weights)
+
+    def lookup(self, question: str, scope: str = '') -> Optional[Tuple[Dict[str, Any], float, str]]:
+        """查找语义最接近的缓存问题，返回 (回答副本, 相似度, 匹配到的问题)"""
+        vector = self.embedder.embed(question)
+        if not vector.any():
+            return None
+        terms, keywords = question_terms(question), question_keywords(question)
+        scope_id = self._scope_id(scope)
+        now = time.time()
+        threshold = self.settings.similarity_threshold
+
+        with self._lock:
+            count = len(self._lru)
+            if count == 0:
+                self.misses += 1
+                return None
+
+            if count <= self.settings.brute_force_limit:
+                similarities = self._vectors @ vector
+                valid = (self._expires > now) & (self._scope_ids == scope_id)
+                similarities = np.where(valid, similarities, -1.0)
+                index = np.flatnonzero(similarities >= threshold)
+                similarities = similarities[index]
+            else:
+                self.lsh_lookups += 1
+                candidates = set()
+                for table, signature in zip(self._buckets, self._signatures(vector)):
+                    candidates.update(table.get(signature, ()))
+                candidates = [i for i in candidates if self._expires[i] > now and self._scope_ids[i] == scope_id]
+                if not candidates:
+                    self.misses += 1
+                    return None
+                index = np.asarray(candidates)
+                similarities = self._vectors[index] @ vector
+                above = similarities >= threshold
+                index, similarities = index[above], similarities[above]
+
+            # 从最相似的候选开始，返回第一个通过差异检查的
+            for position in np.argsort(-similarities)[:_MAX_GUARD_CANDIDATES]:
+                slot = int(index[position])
+                entry = self._entries[slot]
+                if not is_same_question(terms, keywords, entry.terms, entry.keywords):
+                    self.guard_rejections += 1
+                    logger.info(f"Semantic cache rejected near match '{entry.question}' for '{question}' "
+                                f"(similarity {float(similarities[position]):.3f})")
+                    continue
+                self._lru.move_to_end(slot)
+                self.hits += 1
+                return dict(entry.response), float(similarities[position]), entry.question
+
+            self.misses += 1
+            return None
+
+    def add(self, question: str, response: Dict[str, Any], scope: str = '') -> None:
+        """缓存问题及其回答"""
+        if "error" in response:
+            return
+        vector = self.embedder.embed(question)
+        if not vector.any():
+            return
+        stored = {k: v for k, v in response.items() if k not in ('raw_response', 'cached', 'semantic_cache')}
+        terms, keywords = question_terms(question), question_keywords(question)
+
+        with self._lock:
+            now = time.time()
+            self._purge_expired(now)
+            slot = self._allocate_slot()
+            signatures = self._signatures(vector)
+            self._vectors[slot] = vector
+            self._scope_ids[slot] = self._scope_id(scope)
+            self._expires[slot] = now + self.settings.ttl_seconds
+            self._entries[slot] = SemanticCacheEntry(question, scope, stored, self._expires[slot], signatures,
+                                                     terms, keywords)
+            for table, signature in zip(self._buckets, signatures):
+                table.setdefault(signature, []).append(slot)
+            self._lru[slot] = None
+            self._expiry[slot] = None
+
+    def _allocate_slot(self) -> int:
+        """分配空槽位：优先复用空闲槽，其次扩容，最后淘汰最久未使用的条目（调用方持有锁）"""
+        if not self._free and len(self._vectors) < self.settings.max_entries:
+            old = len(self._vectors)
+            new = min(self.settings.max_entries, old * 2)
+            self._vectors = np.vstack([self._vectors, np.zeros((new - old, self.settings.dim), dtype=np.float32)])
+            self._scope_ids = np.concatenate([self._scope_ids, np.zeros(new - old, dtype=np.int64)])
+            self._expires = np.concatenate([self._expires, np.zeros(new - old, dtype=np.float64)])
+            self._entries.extend([None] * (new - old))
+            self._free.extend(range(new - 1, old - 1, -1))
+        if not self._free:
+            oldest, _ = self._lru.popitem(last=False)
+            self._release(oldest)
+        return self._free.pop()
+
+    def _release(self, slot: int) -> None:
+        """释放槽位并从 LSH 桶中移除（调用方持有锁）"""
+        entry = self._entries[slot]
+        if entry is not None:
+            for table, signature in zip(self._buckets, entry.buckets):
+                bucket = table.get(signature)
+                if bucket is not None:
+                    bucket.remove(slot)
+                    if not bucket:
+                        del table[signature]
+        self._entries[slot] = None
+        self._expires[slot] = 0
+        self._lru.pop(slot, None)
+        self._expiry.pop(slot, None)
+        self._free.append(slot)
+
+    def purge_expired(self) -> int:
+        """清理过期条目，返回清理数量"""
+        with self._lock:
+            return self._purge_expired(time.time())
+
+    def _purge_expired(self, now: float) -> int:
+        """从过期队列头部释放已过期的条目（调用方持有锁）"""
+        removed = 0
+        while self._expiry:
+            slot = next(iter(self._expiry))
+            if self._expires[slot] > now:
+                break
+            self._release(slot)
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.settings.enabled,
+                'entries': len(self._lru),
+                'max_entries': self.settings.max_entries,
+                'similarity_threshold': self.settings.similarity_threshold,
+                'index': 'brute_force' if len(self._lru) <= self.settings.brute_force_limit else 'lsh',
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 2) if total else 0,
+                'lsh_lookups': self.lsh_lookups,
+                'guard_rejections': self.guard_rejections
+            }
+
+
+# 全局实例
+semantic_cache = SemanticCache()
@@ -0,0 +1,788 @@
+"""
+共享缓存后端
+gunicorn 多进程部署时，每个工作进程各有一份内存缓存：命中率被进程数稀释，用户画像也在
+不同请求之间不一致。缓存后端把“带 TTL 和 LRU 上限的键值存储 + 命中统计”抽象出来：
+- memory：进程内 OrderedDict（单进程或开发环境，默认）
+- sqlite：同一台机器上的所有进程共享一个 SQLite 文件（WAL + mmap 读取）
+- redis：所有节点共享一个 Redis（内置精简的 RESP 客户端，也可以指向 fake_redis_server.py）
+命中、未命中、淘汰和过期计数保存在后端中，所有进程看到的统计是一致的。
+后端出错时按未命中处理，不影响请求本身
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, fields, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+BACKEND_MEMORY = 'memory'
+BACKEND_SQLITE = 'sqlite'
+BACKEND_REDIS = 'redis'
+
+# 统计计数器名称
+STAT_HITS = 'hits'
+STAT_MISSES = 'misses'
+STAT_EVICTIONS = 'evictions'
+STAT_EXPIRED = 'expired'
+
+_STAT_NAMES = (STAT_HITS, STAT_MISSES, STAT_EVICTIONS, STAT_EXPIRED)
+
+
+@dataclass
+class SharedCacheSettings:
+    """共享缓存后端配置"""
+    backend: str = BACKEND_MEMORY
+    sqlite_path: str = 'data/shared_cache.db'
+    sqlite_mmap_size: int = 64 * 1024 * 1024    # SQLite 内存映射读取的字节数，0 表示不使用
+    redis_url: str = 'redis://localhost:6379/0'
+    redis_timeout: float = 1.0                  # Redis 连接和读写超时（秒）
+    key_prefix: str = 'alethea'                 # Redis 键前缀，多个部署共用一个 Redis 时区分
+
+    @classmethod
+    def from_env(cls) -> 'SharedCacheSettings':
+        """从环境变量读取默认配置"""
+        return cls(
+            backend=os.getenv('SHARED_CACHE_BACKEND', BACKEND_MEMORY).strip().lower(),
+            sqlite_path=os.getenv('SHARED_CACHE_SQLITE', 'data/shared_cache.db'),
+            sqlite_mmap_size=int(os.getenv('SHARED_CACHE_SQLITE_MMAP_SIZE', str(64 * 1024 * 1024))),
+            redis_url=os.getenv('SHARED_CACHE_REDIS_URL') or os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+            redis_timeout=float(os.getenv('SHARED_CACHE_REDIS_TIMEOUT', '1.0')),
+            key_prefix=os.getenv('SHARED_CACHE_PREFIX', 'alethea')
+        )
+
+    def merged(self, overrides: Optional[Dict[str, Any]]) -> 'SharedCacheSettings':
+        """返回合并覆盖项后的新配置，忽略未知字段"""
+        if not overrides:
+            return self
+        known = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in known})
+
+
+class CacheBackend(ABC):
+    """
+    一个命名空间的缓存存储
+
+    值必须可以序列化为 JSON（进程内后端直接保存对象本身）；ttl 为 None 表示不过期。
+    超出条目数或字节数上限时先清理过期项，再淘汰最久未访问的项
+    """
+
+    name = ''
+
+    def __init__(self, namespace: str, max_entries: int, max_bytes: int):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def set_limits(self, max_entries: int, max_bytes: int) -> None:
+        """更新上限，超出的项立即淘汰"""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict()
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存项并刷新其访问时间，同时记录命中或未命中；不存在或已过期时返回 None"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """写入缓存项；超过字节上限或写入失败时返回 False"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """删除缓存项"""
+        pass
+
+    @abstractmethod
+    def evict(self) -> int:
+        """淘汰超出上限的项，返回淘汰的数量"""
+        pass
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """清理所有过期项，返回清理的数量"""
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        """清空缓存项和统计"""
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """条目数、字节数和各统计计数器"""
+        pass
+
+    def close(self) -> None:
+        """释放连接"""
+        pass
+
+    @staticmethod
+    def dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+
+# ---- 进程内 ----
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    进程内缓存（线程安全）
+
+    按访问顺序维护 LRU，按写入顺序维护过期队列（同一命名空间 TTL 固定，写入越早越先过期），
+    查找、写入和淘汰都是 O(1)
+    """
+
+    name = BACKEND_MEMORY
+
+    def __init__(self, namespace: str, max_entries: int, max_bytes: int):
+        super().__init__(namespace, max_entries, max_bytes)
+        self._items: 'OrderedDict[str, Tuple[Any, int, Optional[float]]]' = OrderedDict()  # 访问顺序
+        self._expiry: 'OrderedDict[str, None]' = OrderedDict()                              # 写入顺序
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._stats = dict.fromkeys(_STAT_NAMES, 0)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                value, _, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._items.move_to_end(key)
+                    self._stats[STAT_HITS] += 1
+                    return value
+                self._remove(key)
+                self._stats[STAT_EXPIRED] += 1
+            self._stats[STAT_MISSES] += 1
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        size = len(self.dumps(value).encode('utf-8'))
+        if size > self.max_bytes:
+            return False
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (value, size, expires_at)
+            if expires_at is not None:
+                self._expiry[key] = None
+            self._bytes += size
+            self._evict()
+        return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        """删除缓存项（调用方持有锁）"""
+        _, size, _ = self._items.pop(key)
+        self._expiry.pop(key, None)
+        self._bytes -= size
+
+    def evict(self) -> int:
+        with self._lock:
+            return self._evict()
+
+    def _evict(self) -> int:
+        """淘汰超出上限的项（调用方持有锁）"""
+        if len(self._items) <= self.max_entries and self._bytes <= self.max_bytes:
+            return 0
+        self._expire(time.monotonic())
+        evicted = 0
+        while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._items)))
+            evicted += 1
+        self._stats[STAT_EVICTIONS] += evicted
+        return evicted
+
+    def _expire(self, now: float) -> int:
+        """从过期队列头部删除已过期的项（调用方持有锁）"""
+        removed = 0
+        while self._expiry:
+            key = next(iter(self._expiry))
+            if self._items[key][2] > now:
+                break
+            self._remove(key)
+            removed += 1
+        self._stats[STAT_EXPIRED] += removed
+        return removed
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._expire(time.monotonic())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._expiry.clear()
+            self._bytes = 0
+            self._stats = dict.fromkeys(_STAT_NAMES, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._items), 'bytes': self._bytes, **self._stats}
+
+
+# ---- SQLite（同机多进程共享） ----
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    同一台机器上的多个进程共享的 SQLite 缓存
+
+    WAL 模式下读取不加锁（走内存映射），写入用 BEGIN IMMEDIATE 在进程间串行化。
+    读取时的访问时间刷新和命中计数先在进程内累积，每 flush_ops 次或 flush_interval 秒
+    （以及每次写入时）合并为一个写事务，避免每次读取都争用跨进程写锁；
+    因此其他进程的统计和 LRU 顺序最多滞后 flush_interval 秒。
+    连接在首次使用时打开，fork 后在子进程中重新打开
+    """
+
+    name = BACKEND_SQLITE
+
+    def __init__(self, namespace: str, max_entries: int, max_bytes: int, path: str, mmap_size: int = 0,
+                 flush_ops: int = 64, flush_interval: float = 1.0):
+        super().__init__(namespace, max_entries, max_bytes)
+        self.path = path
+        self.mmap_size = mmap_size
+        self.flush_ops = flush_ops
+        self.flush_interval = flush_interval
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._reset_pending()
+
+    def _reset_pending(self) -> None:
+        self._pending_access: Dict[str, float] = {}     # 键 -> 最近访问时间
+        self._pending_stats = dict.fromkeys((STAT_HITS, STAT_MISSES), 0)
+        self._pending_ops = 0
+        self._last_flush = time.monotonic()
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取（必要时打开）本进程的连接（调用方持有锁）"""
+        if self._db is not None and self._pid == os.getpid():
+            return self._db
+        if self._pid is not None and self._pid != os.getpid():
+            # fork 继承的未提交计数属于父进程
+            self._reset_pending()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        if self.mmap_size > 0:
+            db.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS shared_cache ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL, '
+            'expires_at REAL, accessed_at REAL NOT NULL, PRIMARY KEY (namespace, key))'
+        )
+        db.execute('CREATE INDEX IF NOT EXISTS shared_cache_lru ON shared_cache (namespace, accessed_at)')
+        db.execute('CREATE INDEX IF NOT EXISTS shared_cache_expiry ON shared_cache (namespace, expires_at)')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS shared_cache_stats ('
+            'namespace TEXT NOT NULL, name TEXT NOT NULL, value INTEGER NOT NULL, PRIMARY KEY (namespace, name))'
+        )
+        self._db = db
+        self._pid = os.getpid()
+        logger.info(f"Shared cache '{self.namespace}' using SQLite at {self.path}")
+        return db
+
+    def _incr(self, db: sqlite3.Connection, name: str, amount: int = 1) -> None:
+        if amount:
+            db.execute(
+                'INSERT INTO shared_cache_stats (namespace, name, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (namespace, name) DO UPDATE SET value = value + excluded.value',
+                (self.namespace, name, amount)
+            )
+
+    def _flush_pending(self, db: sqlite3.Connection) -> None:
+        """把累积的访问时间和命中计数写入数据库（调用方持有锁并已开启写事务）"""
+        if self._pending_access:
+            db.executemany(
+                'UPDATE shared_cache SET accessed_at = MAX(accessed_at, ?) WHERE namespace = ? AND key = ?',
+                [(accessed_at, self.namespace, key) for key, accessed_at in self._pending_access.items()]
+            )
+        for name, amount in self._pending_stats.items():
+            self._incr(db, name, amount)
+        self._reset_pending()
+
+    def _transaction(self, db: sqlite3.Connection, operation: Callable[[sqlite3.Connection, float], Any]) -> Any:
+        """在一个写事务中执行 operation，同时写入累积的访问记录（调用方持有锁）"""
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            self._flush_pending(db)
+            result = operation(db, time.time())
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return result
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._connect()
+                row = db.execute(
+                    'SELECT value, expires_at FROM shared_cache WHERE namespace = ? AND key = ?',
+                    (self.namespace, key)
+                ).fetchone()
+                # 过期项留给写入时的淘汰和后台清理删除
+                hit = row is not None and (row[1] is None or row[1] > now)
+                if hit:
+                    self._pending_access[key] = now
+                self._pending_stats[STAT_HITS if hit else STAT_MISSES] += 1
+                self._pending_ops += 1
+                if (self._pending_ops >= self.flush_ops
+                        or time.monotonic() - self._last_flush >= self.flush_interval):
+                    try:
+                        self._transaction(db, lambda db, now: None)
+                    except sqlite3.Error as e:
+                        # 累积的记录已丢弃，不影响本次读取
+                        logger.warning(f"Shared cache '{self.namespace}' flush failed: {str(e)}")
+            return json.loads(row[0]) if hit else None
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Shared cache '{self.namespace}' read failed: {str(e)}")
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        payload = self.dumps(value)
+        size = len(payload.encode('utf-8'))
+        if size > self.max_bytes:
+            return False
+
+        def store(db: sqlite3.Connection, now: float) -> None:
+            db.execute(
+                'INSERT OR REPLACE INTO shared_cache (namespace, key, value, size, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self.namespace, key, payload, size, now + ttl if ttl is not None else None, now)
+            )
+            self._evict(db, now)
+
+        return self._write(store, 'write') is not None
+
+    def delete(self, key: str) -> None:
+        self._write(lambda db, now: db.execute(
+            'DELETE FROM shared_cache WHERE namespace = ? AND key = ?', (self.namespace, key)
+        ), 'delete')
+
+    def _usage(self, db: sqlite3.Connection) -> Tuple[int, int]:
+        count, total = db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM shared_cache WHERE namespace = ?', (self.namespace,)
+        ).fetchone()
+        return count, total
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> int:
+        """淘汰超出上限的项（调用方已开启事务）"""
+        count, total = self._usage(db)
+        if count <= self.max_entries and total <= self.max_bytes:
+            return 0
+        if self._expire(db, now):
+            count, total = self._usage(db)
+        victims = []
+        for key, size in db.execute(
+            'SELECT key, size FROM shared_cache WHERE namespace = ? ORDER BY accessed_at', (self.namespace,)
+        ):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((self.namespace, key))
+            count -= 1
+            total -= size
+        db.executemany('DELETE FROM shared_cache WHERE namespace = ? AND key = ?', victims)
+        self._incr(db, STAT_EVICTIONS, len(victims))
+        return len(victims)
+
+    def _expire(self, db: sqlite3.Connection, now: float) -> int:
+        removed = db.execute(
+            'DELETE FROM shared_cache WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?',
+            (self.namespace, now)
+        ).rowcount
+        self._incr(db, STAT_EXPIRED, removed)
+        return removed
+
+    def _write(self, operation: Callable[[sqlite3.Connection, float], Any], action: str = 'maintenance') -> Any:
+        """执行写事务；失败时记录日志并返回 None"""
+        try:
+            with self._lock:
+                result = self._transaction(self._connect(), operation)
+            return 0 if result is None else result
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache '{self.namespace}' {action} failed: {str(e)}")
+            return None
+
+    def evict(self) -> int:
+        return self._write(self._evict) or 0
+
+    def sweep(self) -> int:
+        return self._write(self._expire) or 0
+
+    def clear(self) -> None:
+        def clear_namespace(db: sqlite3.Connection, now: float) -> None:
+            db.execute('DELETE FROM shared_cache WHERE namespace = ?', (self.namespace,))
+            db.execute('DELETE FROM shared_cache_stats WHERE namespace = ?', (self.namespace,))
+        self._write(clear_namespace, 'clear')
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            with self._lock:
+                db = self._connect()
+                if self._pending_ops:
+                    self._transaction(db, lambda db, now: None)
+                count, total = self._usage(db)
+                counters = dict(db.execute(
+                    'SELECT name, value FROM shared_cache_stats WHERE namespace = ?', (self.namespace,)
+                ).fetchall())
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache '{self.namespace}' stats failed: {str(e)}")
+            return {'entries': 0, 'bytes': 0, **dict.fromkeys(_STAT_NAMES, 0), 'error': str(e)}
+        return {'entries': count, 'bytes': total, **{name: counters.get(name, 0) for name in _STAT_NAMES}}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                if self._pending_ops:
+                    try:
+                        self._transaction(self._db, lambda db, now: None)
+                    except sqlite3.Error as e:
+                        logger.warning(f"Shared cache '{self.namespace}' flush failed: {str(e)}")
+                self._db.close()
+            self._db = None
+
+
+# ---- Redis（多节点共享） ----
+
+class RedisError(Exception):
+    """Redis 返回错误或连接失败"""
+    pass
+
+
+class RedisConnection:
+    """精简的 RESP 客户端：一条连接，支持单条命令和管道（线程安全，fork 后重新连接）"""
+
+    def __init__(self, url: str, timeout: float = 1.0):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('redis', ''):
+            raise ValueError(f"Unsupported Redis URL scheme: {parsed.scheme}")
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        """建立连接并认证、选择数据库（调用方持有锁）"""
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile('rb')
+        self._pid = os.getpid()
+        handshake = []
+        if self.password:
+            handshake.append(('AUTH', self.username, self.password) if self.username else ('AUTH', self.password))
+        if self.db:
+            handshake.append(('SELECT', self.db))
+        if handshake:
+            self._roundtrip(handshake)
+
+    def _disconnect(self) -> None:
+        if self._sock is not None and self._pid == os.getpid():
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+    def execute(self, *args: Any) -> Any:
+        """执行一条命令"""
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        """一次发送多条命令，按顺序返回结果；任何一条返回错误时抛出 RedisError"""
+        with self._lock:
+            try:
+                if self._sock is None or self._pid != os.getpid():
+                    self._connect()
+                return self._roundtrip(commands)
+            except (OSError, EOFError) as e:
+                self._disconnect()
+                raise RedisError(f"Redis connection to {self.host}:{self.port} failed: {e}") from e
+            except RedisError:
+                self._disconnect()
+                raise
+
+    def _roundtrip(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        self._sock.sendall(b''.join(_encode_command(command) for command in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def _read_reply(self) -> Any:
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise EOFError('connection closed')
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode('utf-8')
+        if kind == b'-':
+            return RedisError(body.decode('utf-8'))
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            if len(data) != length + 2:
+                raise EOFError('connection closed')
+            return data[:-2]
+        if kind == b'*':
+            length = int(body)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected Redis reply: {line!r}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+
+def _encode_command(args: Tuple[Any, ...]) -> bytes:
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, float):
+            data = repr(arg).encode('ascii')
+        else:
+            data = str(arg).encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Redis 共享缓存
+
+    每个缓存项一个字符串键（原生 TTL），另有四个辅助结构：
+    {prefix}:{namespace}:lru（有序集合，最近访问时间）、:exp（有序集合，过期时间）、
+    :sizes（哈希，各项字节数）和 :stats（哈希，统计计数器与总字节数）。
+    写入和淘汰只读取过期或最久未访问的少量项，每次操作的往返次数与条目数无关。
+    多个进程并发写同一个键时总字节数可能短暂偏差，sweep 时按 :sizes 重新校正
+    """
+
+    name = BACKEND_REDIS
+
+    # 淘汰和清理时每批读取的项数
+    BATCH_SIZE = 64
+
+    def __init__(self, namespace: str, max_entries: int, max_bytes: int, url: str,
+                 timeout: float = 1.0, key_prefix: str = 'alethea'):
+        super().__init__(namespace, max_entries, max_bytes)
+        self.url = url
+        self.redis = RedisConnection(url, timeout=timeout)
+        base = f"{key_prefix}:{namespace}"
+        self._value_prefix = f"{base}:v:"
+        self._lru_key = f"{base}:lru"
+        self._exp_key = f"{base}:exp"
+        self._sizes_key = f"{base}:sizes"
+        self._stats_key = f"{base}:stats"
+
+    def _value_key(self, key: str) -> str:
+        return self._value_prefix + key
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            payload = self.redis.execute('GET', self._value_key(key))
+            if payload is not None:
+                self.redis.pipeline([
+                    ('ZADD', self._lru_key, time.time(), key),
+                    ('HINCRBY', self._stats_key, STAT_HITS, 1)
+                ])
+                return json.loads(payload)
+            # 已过期（键被 Redis 删除）但仍在索引中的项，顺便清理索引
+            removed, _, size = self.redis.pipeline([
+                ('ZREM', self._lru_key, key),
+                ('ZREM', self._exp_key, key),
+                ('HGET', self._sizes_key, key)
+            ])
+            commands = [('HINCRBY', self._stats_key, STAT_MISSES, 1)]
+            if removed:
+                commands += [
+                    ('HDEL', self._sizes_key, key),
+                    ('HINCRBY', self._stats_key, 'bytes', -int(size or 0)),
+                    ('HINCRBY', self._stats_key, STAT_EXPIRED, 1)
+                ]
+            self.redis.pipeline(commands)
+            return None
+        except (RedisError, ValueError) as e:
+            logger.warning(f"Shared cache '{self.namespace}' read failed: {str(e)}")
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        payload = self.dumps(value).encode('utf-8')
+        size = len(payload)
+        if size > self.max_bytes:
+            return False
+        now = time.time()
+        try:
+            old_size = self.redis.execute('HGET', self._sizes_key, key)
+            store = ('SET', self._value_key(key), payload)
+            if ttl is not None:
+                store += ('PX', max(1, int(ttl * 1000)))
+            self.redis.pipeline([
+                store,
+                ('ZADD', self._lru_key, now, key),
+                ('ZADD', self._exp_key, now + ttl, key) if ttl is not None else ('ZREM', self._exp_key, key),
+                ('HSET', self._sizes_key, key, size),
+                ('HINCRBY', self._stats_key, 'bytes', size - int(old_size or 0))
+            ])
+            self.evict()
+            return True
+        except RedisError as e:
+            logger.warning(f"Shared cache '{self.namespace}' write failed: {str(e)}")
+            return False
+
+    def delete(self, key: str) -> None:
+        try:
+            self._remove([key], None)
+        except RedisError as e:
+            logger.warning(f"Shared cache '{self.namespace}' delete failed: {str(e)}")
+
+    def _remove(self, keys: List[str], stat: Optional[str]) -> None:
+        if not keys:
+            return
+        sizes = self.redis.execute('HMGET', self._sizes_key, *keys)
+        commands = [
+            ('DEL', *[self._value_key(key) for key in keys]),
+            ('ZREM', self._lru_key, *keys),
+            ('ZREM', self._exp_key, *keys),
+            ('HDEL', self._sizes_key, *keys),
+            ('HINCRBY', self._stats_key, 'bytes', -sum(int(size or 0) for size in sizes))
+        ]
+        if stat:
+            commands.append(('HINCRBY', self._stats_key, stat, len(keys)))
+        self.redis.pipeline(commands)
+
+    def _usage(self) -> Tuple[int, int]:
+        count, total = self.redis.pipeline([
+            ('ZCARD', self._lru_key),
+            ('HGET', self._stats_key, 'bytes')
+        ])
+        return count, int(total or 0)
+
+    def evict(self) -> int:
+        try:
+            count, total = self._usage()
+            if count <= self.max_entries and total <= self.max_bytes:
+                return 0
+            if self._expire(self.BATCH_SIZE):
+                count, total = self._usage()
+            # 按访问时间从旧到新分批读取，直到条目数和字节数都低于上限
+            victims: List[str] = []
+            start = 0
+            while count > self.max_entries or total > self.max_bytes:
+                batch = max(self.BATCH_SIZE, count - self.max_entries)
+                keys = [key.decode('utf-8') for key in
+                        self.redis.execute('ZRANGE', self._lru_key, start, start + batch - 1)]
+                if not keys:
+                    break
+                sizes = self.redis.execute('HMGET', self._sizes_key, *keys)
+                for key, size in zip(keys, sizes):
+                    if count <= self.max_entries and total <= self.max_bytes:
+                        break
+                    victims.append(key)
+                    count -= 1
+                    total -= int(size or 0)
+                start += len(keys)
+            self._remove(victims, STAT_EVICTIONS)
+            return len(victims)
+        except RedisError as e:
+            logger.warning(f"Shared cache '{self.namespace}' eviction failed: {str(e)}")
+            return 0
+
+    def _expire(self, limit: int) -> int:
+        """删除过期时间已到的项（最多 limit 个），返回删除的数量"""
+        keys = [key.decode('utf-8') for key in
+                self.redis.execute('ZRANGEBYSCORE', self._exp_key, '-inf', time.time(), 'LIMIT', 0, limit)]
+        self._remove(keys, STAT_EXPIRED)
+        return len(keys)
+
+    def sweep(self) -> int:
+        try:
+            removed = 0
+            while True:
+                expired = self._expire(self.BATCH_SIZE * 16)
+                removed += expired
+                if expired < self.BATCH_SIZE * 16:
+                    break
+            # 校正总字节数
+            sizes = self.redis.execute('HVALS', self._sizes_key)
+            self.redis.execute('HSET', self._stats_key, 'bytes', sum(int(size) for size in sizes))
+            return removed
+        except RedisError as e:
+            logger.warning(f"Shared cache '{self.namespace}' sweep failed: {str(e)}")
+            return 0
+
+    def clear(self) -> None:
+        try:
+            keys = [key.decode('utf-8') for key in self.redis.execute('ZRANGE', self._lru_key, 0, -1)]
+            commands = [('DEL', self._lru_key, self._exp_key, self._sizes_key, self._stats_key)]
+            if keys:
+                commands.append(('DEL', *[self._value_key(key) for key in keys]))
+            self.redis.pipeline(commands)
+        except RedisError as e:
+            logger.warning(f"Shared cache '{self.namespace}' clear failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            count, raw = self.redis.pipeline([
+                ('ZCARD', self._lru_key),
+                ('HGETALL', self._stats_key)
+            ])
+        except RedisError as e:
+            logger.warning(f"Shared cache '{self.namespace}' stats failed: {str(e)}")
+            return {'entries': 0, 'bytes': 0, **dict.fromkeys(_STAT_NAMES, 0), 'error': str(e)}
+        counters = {raw[i].decode('utf-8'): int(raw[i + 1]) for i in range(0, len(raw), 2)}
+        return {
+            'entries': count,
+            'bytes': counters.get('bytes', 0),
+            **{name: counters.get(name, 0) for name in _STAT_NAMES}
+        }
+
+    def close(self) -> None:
+        self.redis.close()
+
+
+def create_cache_backend(namespace: str, settings: SharedCacheSettings,
+                         max_entries: int, max_bytes: int) -> CacheBackend:
+    """按配置创建命名空间的缓存后端；未知的后端类型退回进程内缓存"""
+    if settings.backend == BACKEND_SQLITE:
+        return SQLiteCacheBackend(namespace, max_entries, max_bytes,
+                                  path=settings.sqlite_path, mmap_size=settings.sqlite_mmap_size)
+    if settings.backend == BACKEND_REDIS:
+        return RedisCacheBackend(namespace, max_entries, max_bytes, url=settings.redis_url,
+                                 timeout=settings.redis_timeout, key_prefix=settings.key_prefix)
+    if settings.backend != BACKEND_MEMORY:
+        logger.error(f"Unknown shared cache backend '{settings.backend}', using in-process cache")
+    return MemoryCacheBackend(namespace, max_entries, max_bytes)
@@ -0,0 +1,94 @@
+"""
+相同请求合并（single-flight）
+同一缓存键的并发LLM请求只向上游发出一次调用，其余请求等待并共享其结果或错误。
+结果通过 concurrent.futures.Future 共享，因此在多个事件循环之间同样有效
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """按键合并进行中的异步调用"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def configure(self, enabled: Optional[bool] = None) -> None:
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        logger.info(f"Single-flight request coalescing {'enabled' if self.enabled else 'disabled'}")
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Dict[str, Any]]],
+                  timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        执行 factory() 或加入同键的进行中调用
+
+        共享调用在独立任务中运行：发起者被取消（客户端断开、超时）时，等待者仍能拿到结果。
+        timeout 只限制当前调用方的等待时间。每个调用方得到结果的独立副本。
+        """
+        if not self.enabled:
+            return await factory()
+
+        with self._lock:
+            shared = self._calls.get(key)
+            leader = shared is None
+            if leader:
+                shared = concurrent.futures.Future()
+                self._calls[key] = shared
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            task = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda t: self._settle(key, shared, t))
+            waiter = task
+        else:
+            logger.info(f"Coalescing request into in-flight call {key[:8]}...")
+            waiter = asyncio.wrap_future(shared)
+
+        # shield：当前调用方被取消不会取消共享调用
+        result = await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        result = dict(result)
+        if not leader:
+            result['coalesced'] = True
+        return result
+
+    def _settle(self, key: str, shared: concurrent.futures.Future, task: asyncio.Future) -> None:
+        """共享调用结束：移除键并把结果或异常传给所有等待者"""
+        with self._lock:
+            if self._calls.get(key) is shared:
+                del self._calls[key]
+        if task.cancelled():
+            shared.cancel()
+        elif task.exception() is not None:
+            shared.set_exception(task.exception())
+        else:
+            shared.set_result(task.result())
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            'enabled': self.enabled,
+            'in_flight': in_flight,
+            'upstream_calls': self.leaders,
+            'coalesced_requests': self.coalesced
+        }
+
+
+# 全局实例
+single_flight = SingleFlight(
+    enabled=os.getenv('LLM_SINGLE_FLIGHT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+)
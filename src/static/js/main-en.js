@@ -1155,6 +1155,70 @@ function showSubjectModal(subjectTitle, subjectDescription) {
     generateSubjectContent(subjectTitle, subjectDescription);
 }
 
+/**
+ * Generate related content as a background job: submit it, then wait for the completion event over SSE (polling when SSE is unavailable or the connection drops)
+ * @param {Object} payload - {question, answer}
+ * @returns {Promise<Object>} Generated content data
+ */
+function requestRelatedContent(payload) {
+    return fetch('/api/llm/generate-related-content', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(Object.assign({}, payload, { async: true }))
+    })
+    .then(response => response.json())
+    .then(job => job.job_id ? waitForJob(job) : job);
+}
+
+/**
+ * Wait for a background job to finish
+ * @param {Object} job - Job submission response (with events_url and status_url)
+ * @returns {Promise<Object>} Job result
+ */
+function waitForJob(job) {
+    if (!window.EventSource) {
+        return pollJob(job.status_url);
+    }
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(job.events_url);
+        source.addEventListener('done', event => {
+            source.close();
+            resolve(JSON.parse(event.data).result);
+        });
+        source.addEventListener('error', event => {
+            source.close();
+            if (event.data) {
+                reject(new Error(JSON.parse(event.data).error));
+            } else {
+                pollJob(job.status_url).then(resolve, reject);
+            }
+        });
+    });
+}
+
+/**
+ * Poll the job status until it finishes (backing off to 5 seconds)
+ * @param {string} statusUrl - Job status URL
+ * @param {number} interval - Polling interval in milliseconds
+ * @returns {Promise<Object>} Job result
+ */
+function pollJob(statusUrl, interval = 1000) {
+    return fetch(statusUrl)
+    .then(response => response.json())
+    .then(job => {
+        if (job.status === 'succeeded') {
+            return job.result;
+        }
+        if (job.status === 'failed' || job.error) {
+            throw new Error(job.error || 'Job failed');
+        }
+        return new Promise(resolve => setTimeout(resolve, interval))
+            .then(() => pollJob(statusUrl, Math.min(interval * 1.5, 5000)));
+    });
+}
+
 /**
  * Generate subject-related content
  * @param {string} subjectTitle - Subject title
@@ -1165,17 +1229,10 @@ function generateSubjectContent(subjectTitle, subjectDescription) {
     const subjectQuestion = `Please provide a detailed introduction to ${subjectTitle}, including main learning content, core concepts and application areas. ${subjectDescription}`;
     
     // Call AI to generate related content
-    fetch('/api/llm/generate-related-content', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-            question: subjectQuestion,
-            answer: `${subjectTitle} is an important engineering discipline. ${subjectDescription}. This discipline covers both theoretical learning and practical applications.`
-        })
+    requestRelatedContent({
+        question: subjectQuestion,
+        answer: `${subjectTitle} is an important engineering discipline. ${subjectDescription}. This discipline covers both theoretical learning and practical applications.`
     })
-    .then(response => response.json())
     .then(data => {
         if (data.success) {
             displaySubjectContent(data);
@@ -1426,6 +1426,70 @@ function showSubjectModal(subjectTitle, subjectDescription) {
     generateSubjectContent(subjectTitle, subjectDescription);
 }
 
+/**
+ * 以后台任务方式生成相关内容：提交任务后通过SSE等待完成事件（不支持或连接中断时改为轮询）
+ * @param {Object} payload - {question, answer}
+ * @returns {Promise<Object>} 生成的内容数据
+ */
+function requestRelatedContent(payload) {
+    return fetch('/api/llm/generate-related-content', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(Object.assign({}, payload, { async: true }))
+    })
+        .then(response => response.json())
+        .then(job => job.job_id ? waitForJob(job) : job);
+}
+
+/**
+ * 等待后台任务完成
+ * @param {Object} job - 提交任务的响应（含 events_url 和 status_url）
+ * @returns {Promise<Object>} 任务结果
+ */
+function waitForJob(job) {
+    if (!window.EventSource) {
+        return pollJob(job.status_url);
+    }
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(job.events_url);
+        source.addEventListener('done', event => {
+            source.close();
+            resolve(JSON.parse(event.data).result);
+        });
+        source.addEventListener('error', event => {
+            source.close();
+            if (event.data) {
+                reject(new Error(JSON.parse(event.data).error));
+            } else {
+                pollJob(job.status_url).then(resolve, reject);
+            }
+        });
+    });
+}
+
+/**
+ * 轮询任务状态直到完成（间隔逐渐增加到 5 秒）
+ * @param {string} statusUrl - 任务状态地址
+ * @param {number} interval - 轮询间隔（毫秒）
+ * @returns {Promise<Object>} 任务结果
+ */
+function pollJob(statusUrl, interval = 1000) {
+    return fetch(statusUrl)
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === 'succeeded') {
+                return job.result;
+            }
+            if (job.status === 'failed' || job.error) {
+                throw new Error(job.error || 'Job failed');
+            }
+            return new Promise(resolve => setTimeout(resolve, interval))
+                .then(() => pollJob(statusUrl, Math.min(interval * 1.5, 5000)));
+        });
+}
+
 /**
  * 生成学科相关内容
  * @param {string} subjectTitle - 学科标题
@@ -1436,17 +1500,10 @@ function generateSubjectContent(subjectTitle, subjectDescription) {
     const subjectQuestion = `请详细介绍${subjectTitle}学科，包括主要学习内容、核心概念和应用领域。${subjectDescription}`;
 
     // 调用AI生成相关内容
-    fetch('/api/llm/generate-related-content', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-            question: subjectQuestion,
-            answer: `${subjectTitle}是一门重要的工程学科，${subjectDescription}。该学科涵盖了理论学习和实践应用两个方面。`
-        })
+    requestRelatedContent({
+        question: subjectQuestion,
+        answer: `${subjectTitle}是一门重要的工程学科，${subjectDescription}。该学科涵盖了理论学习和实践应用两个方面。`
     })
-        .then(response => response.json())
         .then(data => {
             if (data.success) {
                 displaySubjectContent(data);
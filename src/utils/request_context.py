@@ -0,0 +1,37 @@
+"""
+Request identity helpers for Alethea Platform
+Resolves who is making the current request, used for fair scheduling of LLM calls.
+Only server-controlled data is used (the signed session and the connection address):
+anything the client sends could be varied per request to obtain a fresh fair-share queue
+or a lighter tenant lane
+"""
+
+from typing import Dict
+from flask import request, session, has_request_context
+
+
+def get_client_id() -> str:
+    """
+    Logged-in user id, falling back to the client address for anonymous requests.
+    X-Forwarded-For is only honoured through ProxyFix (TRUSTED_PROXY_COUNT), which
+    rewrites remote_addr from the hops added by our own proxies
+    """
+    if 'user_id' in session:
+        return f"user:{session['user_id']}"
+    return f"ip:{request.remote_addr or 'unknown'}"
+
+
+def get_tenant_id() -> str:
+    """Tenant (class / course group) recorded in the session by the server, 'default' when unknown"""
+    tenant = session.get('class_id')
+    return str(tenant) if tenant else 'default'
+
+
+def get_request_identity() -> Dict[str, str]:
+    """
+    Scheduling identity of the current request as LLMManager keyword arguments:
+    {'user_id': ..., 'tenant_id': ...}. Empty outside a request context.
+    """
+    if not has_request_context():
+        return {}
+    return {'user_id': get_client_id(), 'tenant_id': get_tenant_id()}